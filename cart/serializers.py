@@ -1,35 +1,55 @@
 from rest_framework import serializers
 from .models import Cart, CartItem
+from core.fragments import FragmentCacheMixin
+from core.loaders import BatchListSerializer, BatchSerializerMixin
+from core.shaping import SparseFieldsMixin
 from products.serializers import ProductSerializer, ProductImageSerializer
+from products.cache import product_version_key
+from products.loaders import collect_variations
 from products.models import ProductVariation
+from products.images import THUMBNAIL_WIDTH
 
 
-class CartVariationSerializer(serializers.ModelSerializer):
+class CartVariationSerializer(SparseFieldsMixin, FragmentCacheMixin, BatchSerializerMixin, serializers.ModelSerializer):
     product = serializers.SerializerMethodField()
     main_image = serializers.SerializerMethodField()
     
     class Meta:
         model = ProductVariation
         fields = ['id', 'name', 'unit_price', 'unit_measurement', 'stock', 'is_available', 'product', 'main_image']
+        list_serializer_class = BatchListSerializer
+
+    def collect(self, variations):
+        # Sibling variations (for the picker) and main images, for the whole cart at once
+        variations = self.uncached(variations)
+        if 'product' in self.fields:
+            self.loaders['product_variations'].collect(variation.product_id for variation in variations)
+        if 'main_image' in self.fields:
+            collect_variations(self.loaders, variations)
+
+    def fragment_counter_key(self, obj):
+        # Bumped by changes to the product, its other variations and their images
+        return product_version_key(obj.product_id)
 
     def get_product(self, obj):
-    # Fetch all variations of the product
-        variations = obj.product.variations.all().values('id', 'name')
+        # All variations of the product
+        variations = self.loaders['product_variations'].load(obj.product_id) or []
         
         return {
             'id': str(obj.product.id),
             'name': obj.product.name,
             'slug': obj.product.slug,
-            'variations': list(variations),  # List of dicts with id & name
+            'variations': [{'id': variation.id, 'name': variation.name} for variation in variations],  # List of dicts with id & name
         }
 
     def get_main_image(self, obj):
-        main_img = obj.images.filter(is_main=True).first()
+        images = self.loaders['variation_images'].load(obj.id) or []
+        main_img = next((image for image in images if image.is_main), None)
         if main_img:
-            return main_img.image
+            return main_img.rendition_url(THUMBNAIL_WIDTH)
         return None
 
-class CartItemSerializer(serializers.ModelSerializer):
+class CartItemSerializer(SparseFieldsMixin, BatchSerializerMixin, serializers.ModelSerializer):
     variation = CartVariationSerializer(read_only=True)
     variation_id = serializers.UUIDField(write_only=True)
     total_price = serializers.SerializerMethodField(read_only=True)
@@ -38,6 +58,11 @@ class CartItemSerializer(serializers.ModelSerializer):
     class Meta:
         model = CartItem
         fields = ['cart', 'variation', 'variation_id', 'quantity', 'total_price', 'warning_message']
+        list_serializer_class = BatchListSerializer
+
+    def collect(self, items):
+        if 'variation' in self.fields:
+            self.fields['variation'].collect([item.variation for item in items])
 
     def get_total_price(self, obj):
         return obj.quantity * obj.variation.unit_price
@@ -47,7 +72,7 @@ class CartItemSerializer(serializers.ModelSerializer):
             return f"Only {obj.variation.stock} left in stock."
         return None
     
-class CartSerializer(serializers.ModelSerializer):
+class CartSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     items = CartItemSerializer(many=True, read_only=True)
     user_name = serializers.CharField(source='user.username', read_only=True)
 
@@ -1,3 +1,53 @@
-from django.test import TestCase
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+from products.models import Product, ProductVariation, VariationImage
+from users.models import CustomUser
+from .models import Cart, CartItem
+import itertools
 
-# Create your tests here.
+contact_numbers = itertools.count(9200000000)
+
+
+def make_user(username, role):
+    return CustomUser.objects.create_user(
+        email=f'{username}@example.com', username=username, contact_no=str(next(contact_numbers)), role=role,
+    )
+
+
+@override_settings(ROOT_URLCONF='cart.urls', FRAGMENT_CACHE_ENABLED=False)
+class CartViewQueryTests(TestCase):
+    def setUp(self):
+        self.buyer = make_user('buyer', 'buyer')
+        self.cart = Cart.objects.create(user=self.buyer)
+        self.client = APIClient()
+        self.client.force_authenticate(self.buyer)
+
+    def add_items(self, count):
+        for number in range(count):
+            vendor = make_user(f'farmer{number}', 'farmer')
+            product = Product.objects.create(vendor=vendor, name=f'Product {number}', description='Fresh')
+            variation = ProductVariation.objects.create(product=product, name='1kg', unit_price='10.00', stock=10)
+            ProductVariation.objects.create(product=product, name='5kg', unit_price='45.00', stock=10)
+            VariationImage.objects.create(variation=variation, image='https://example.com/v.jpg', is_main=True)
+            CartItem.objects.create(cart=self.cart, variation=variation, quantity=2)
+
+    def get_cart(self, count):
+        self.add_items(count)
+        # Items with their variations, products and vendors, sibling variations, variation images
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('my_cart'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), count)
+        return response.data
+
+    def test_one_item(self):
+        group = self.get_cart(1)[0]
+
+        self.assertEqual(group['vendor_name'], 'farmer0')
+        variation = group['items'][0]['variation']
+        self.assertEqual([sibling['name'] for sibling in variation['product']['variations']], ['1kg', '5kg'])
+        self.assertEqual(variation['main_image'], 'https://example.com/v.jpg')
+
+    def test_five_items(self):
+        self.get_cart(5)
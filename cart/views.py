@@ -18,6 +18,9 @@ class CartView(APIView):
     def get(self, request):
         # Select related variation and variation's product vendor for efficient queries
         cart_items = CartItem.objects.select_related('variation__product__vendor').filter(cart__user=request.user)
+        # One batch per kind for the whole cart rather than per vendor group
+        context = {'request': request}
+        CartItemSerializer(context=context).collect(cart_items)
         
         vendor_items = defaultdict(list)
         
@@ -29,7 +32,7 @@ class CartView(APIView):
         
         for vendor_id, items in vendor_items.items():
             vendor = items[0].variation.product.vendor
-            serializer = CartItemSerializer(items, many=True)
+            serializer = CartItemSerializer(items, many=True, context=context)
             response_data.append({
                 'vendor_id': vendor.id,
                 'vendor_name': getattr(vendor, 'username', str(vendor)),
@@ -74,7 +77,6 @@ class UpdateCartItem(APIView):
     def patch(self, request, item_id):
         # Get cart item based on cart_id (since item_id should be the cart item's ID, not variation_id)
         cart_item = get_object_or_404(CartItem, variation=item_id, cart__user=request.user)
-        print('1')
         # Handle quantity update
         quantity = request.data.get('quantity')
         if quantity is not None:
@@ -82,7 +84,6 @@ class UpdateCartItem(APIView):
             if quantity < 1:
                 return Response({"error": "Quantity must be at least 1."}, status=status.HTTP_400_BAD_REQUEST)
             cart_item.quantity = quantity
-        print('2')
         # Handle variation update
         new_variation_id = request.data.get('variation_id')
         if new_variation_id is not None:
@@ -107,7 +108,6 @@ class UpdateCartItem(APIView):
                     
             except ProductVariation.DoesNotExist:
                 return Response({"error": "Invalid variation ID."}, status=status.HTTP_400_BAD_REQUEST)
-        print('3')
         cart_item.save()
 
         # Serialize the cart item to return the updated data
@@ -139,6 +139,8 @@ class OrderSummaryView(APIView):
             cart=cart,
             variation_id__in=variation_ids
         )
+        context = {'request': request}
+        CartItemSerializer(context=context).collect(cart_items)
 
         vendor_items = defaultdict(list)
         for item in cart_items:
@@ -151,7 +153,7 @@ class OrderSummaryView(APIView):
 
         for vendor_id, items in vendor_items.items():
             vendor = items[0].variation.product.vendor
-            serializer = CartItemSerializer(items, many=True)
+            serializer = CartItemSerializer(items, many=True, context=context)
             sub_total = sum(item.quantity * item.variation.unit_price for item in items)
             grand_total += sub_total
 
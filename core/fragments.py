@@ -0,0 +1,78 @@
+"""
+Fragment cache: each object's serialized representation, cached per version.
+
+A serializer with FragmentCacheMixin caches what it returns for an object
+under the object's id, a version made of its `updated_at` and of a counter
+bumped when related rows the representation includes change (see
+`fragment_counter_key`), and the requested shape (?fields=, ?expand=). Lists
+are assembled from cached fragments: `uncached(instances)` looks up a whole
+batch with a single cache.get_many() and returns the objects left to
+serialize, so only those collect and load their relations.
+
+Saving an object moves its `updated_at` and saving a related row bumps the
+counter, so a stale fragment is never read again; it expires on
+FRAGMENT_CACHE_TIMEOUT. That only holds if every process bumps and reads the
+same counters, so the fragment cache is meant for a shared cache backend.
+"""
+from hashlib import sha1
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.functional import cached_property
+from .loaders import batch_loader
+
+KEY_PREFIX = 'fragment'
+
+
+@batch_loader('cache_entries')
+def load_cache_entries(keys):
+    return cache.get_many(keys)
+
+
+def fragment_cache_enabled():
+    return getattr(settings, 'FRAGMENT_CACHE_ENABLED', False)
+
+
+class FragmentCacheMixin:
+    """
+    For batch-loading serializers with sparse fieldsets (core/loaders.py,
+    core/shaping.py). Their `collect()` passes the instances through
+    `uncached()` and collects relations for those only.
+    """
+
+    def fragment_counter_key(self, instance):
+        """Cache key of the version counter of the related rows in the representation, if any."""
+        return None
+
+    @cached_property
+    def fragment_prefix(self):
+        cls = type(self)
+        shape = sha1(self.shape.key.encode('utf-8')).hexdigest()[:16]
+        return f'{KEY_PREFIX}:{cls.__module__}.{cls.__qualname__}:{shape}'
+
+    def fragment_key(self, instance):
+        counter_key = self.fragment_counter_key(instance)
+        counter = self.loaders['cache_entries'].load(counter_key) if counter_key else None
+        return f'{self.fragment_prefix}:{instance.pk}:{instance.updated_at.timestamp():f}:{counter or 0}'
+
+    def uncached(self, instances):
+        if not fragment_cache_enabled():
+            return instances
+        entries = self.loaders['cache_entries']
+        # One round trip for the counters, one for the fragments
+        entries.load_many(key for key in map(self.fragment_counter_key, instances) if key)
+        keys = [self.fragment_key(instance) for instance in instances]
+        cached = entries.load_many(keys)
+        return [instance for instance, data in zip(instances, cached) if data is None]
+
+    def to_representation(self, instance):
+        if not fragment_cache_enabled():
+            return super().to_representation(instance)
+        key = self.fragment_key(instance)
+        entries = self.loaders['cache_entries']
+        data = entries.load(key)
+        if data is None:
+            data = super().to_representation(instance)
+            cache.set(key, data, timeout=getattr(settings, 'FRAGMENT_CACHE_TIMEOUT', 3600))
+            # Also for the next time it's in this response (e.g. the same product in two orders)
+            entries.cache[key] = data
+        return data
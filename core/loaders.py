@@ -0,0 +1,111 @@
+"""
+Request-scoped batch loading for serializers (DataLoader style).
+
+A serializer asks a loader for rows by key instead of following a relation
+per object. Before a list is serialized, `collect(instances)` queues every key
+the list will ask for, and the first `load()` resolves all queued keys of that
+kind with a single batch query; later loads are served from the loader's
+cache. Loaders live on the request (or the serializer context without one), so
+every serializer of a response shares them.
+
+Batch functions are registered by name with `@batch_loader(name)`; they take a
+set of keys and return {key: value}. Keys without a value load as None.
+"""
+from rest_framework import serializers
+
+BATCH_FUNCTIONS = {}
+REQUEST_ATTRIBUTE = '_batch_loaders'
+
+
+def batch_loader(name):
+    def decorator(function):
+        BATCH_FUNCTIONS[name] = function
+        return function
+    return decorator
+
+
+class DataLoader:
+    def __init__(self, batch_function):
+        self.batch_function = batch_function
+        self.cache = {}
+        self.queued = set()
+
+    def prime(self, key, value):
+        """Seed the cache, e.g. with a relation the queryset already selected."""
+        self.cache.setdefault(key, value)
+
+    def collect(self, keys):
+        """Queue keys for the next batch."""
+        self.queued.update(key for key in keys if key is not None and key not in self.cache)
+
+    def dispatch(self):
+        keys, self.queued = self.queued, set()
+        if keys:
+            values = self.batch_function(keys)
+            for key in keys:
+                self.cache[key] = values.get(key)
+
+    def load(self, key):
+        if key is None:
+            return None
+        if key not in self.cache:
+            self.queued.add(key)
+            self.dispatch()
+        return self.cache[key]
+
+    def load_many(self, keys):
+        keys = list(keys)
+        self.collect(keys)
+        self.dispatch()
+        return [self.cache.get(key) for key in keys]
+
+
+class Loaders:
+    """One DataLoader per registered batch function, created on first use."""
+
+    def __init__(self):
+        self.loaders = {}
+
+    def __getitem__(self, name):
+        if name not in self.loaders:
+            self.loaders[name] = DataLoader(BATCH_FUNCTIONS[name])
+        return self.loaders[name]
+
+
+def get_loaders(context):
+    request = context.get('request')
+    holder = request if request is not None else context
+    if isinstance(holder, dict):
+        return holder.setdefault(REQUEST_ATTRIBUTE, Loaders())
+    if not hasattr(holder, REQUEST_ATTRIBUTE):
+        setattr(holder, REQUEST_ATTRIBUTE, Loaders())
+    return getattr(holder, REQUEST_ATTRIBUTE)
+
+
+class BatchListSerializer(serializers.ListSerializer):
+    """Lets the child serializer collect the keys of the whole list before serializing any item."""
+
+    def to_representation(self, data):
+        instances = list(data.all() if hasattr(data, 'all') else data)
+        self.child.collect(instances)
+        return [self.child.to_representation(instance) for instance in instances]
+
+
+class BatchSerializerMixin:
+    """
+    For serializers reading related rows through `self.loaders`: `collect(instances)`
+    queues the keys a batch of instances needs. Set
+    `list_serializer_class = BatchListSerializer` in their Meta.
+    """
+
+    @property
+    def loaders(self):
+        return get_loaders(self.context)
+
+    def collect(self, instances):
+        pass
+
+    def to_representation(self, instance):
+        # A single instance too (no-op when a list or parent already collected it)
+        self.collect([instance])
+        return super().to_representation(instance)
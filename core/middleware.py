@@ -0,0 +1,246 @@
+from collections import Counter
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.utils.cache import patch_vary_headers
+from django.utils.text import compress_sequence, compress_string
+from rest_framework import serializers
+from contextlib import ExitStack
+from contextvars import ContextVar
+import logging, re, time
+
+try:
+    import brotli
+except ImportError:  # Optional: gzip only without it
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+IN_LIST_RE = re.compile(r'IN \((?:%s, )*%s\)')
+WHITESPACE_RE = re.compile(r'\s+')
+
+
+def fingerprint(sql):
+    """Collapse a query to its shape so repeats with different params (N+1s) group together."""
+    sql = IN_LIST_RE.sub('IN (...)', sql)
+    return WHITESPACE_RE.sub(' ', sql).strip()
+
+
+class QueryCollector:
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.fingerprints = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+            self.fingerprints[fingerprint(sql)] += 1
+
+
+class RequestTiming:
+    def __init__(self, collector):
+        self.collector = collector
+        self.serialize = 0.0
+        self.render = 0.0
+        self.depth = 0
+
+
+# The timing of the request being measured, for the serializer hook below
+current_timing = ContextVar('current_timing', default=None)
+
+
+def instrument_serializers():
+    """
+    Time serializer `.data` (where to_representation runs, usually in the view)
+    for the measured request. Serializer.data and ListSerializer.data both go
+    through BaseSerializer.data; nested serializers' `.data` inside an outer one
+    isn't counted twice, and queries run while serializing count as SQL time.
+    """
+    data = serializers.BaseSerializer.data
+    if getattr(data.fget, 'instrumented', False):
+        return
+
+    def timed_data(self):
+        timing = current_timing.get()
+        if timing is None or timing.depth:
+            return data.fget(self)
+        timing.depth += 1
+        started, sql_started = time.perf_counter(), timing.collector.duration
+        try:
+            return data.fget(self)
+        finally:
+            timing.depth -= 1
+            timing.serialize += (time.perf_counter() - started) - (timing.collector.duration - sql_started)
+
+    timed_data.instrumented = True
+    serializers.BaseSerializer.data = property(timed_data)
+
+
+class QueryBudgetMiddleware:
+    """
+    Per-request instrumentation: query count, SQL time, serialization time
+    (serializer `.data`, see instrument_serializers), response rendering time
+    and wall time, exposed as a Server-Timing header. Requests over the
+    configured budgets are logged with their most repeated query shapes.
+
+    Enabled with QUERY_BUDGET_ENABLED=true (see core/settings.py).
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'QUERY_BUDGET_ENABLED', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.max_queries = getattr(settings, 'QUERY_BUDGET_MAX_QUERIES', 50)
+        self.max_duration_ms = getattr(settings, 'QUERY_BUDGET_MAX_MS', 500)
+        self.report_limit = getattr(settings, 'QUERY_BUDGET_REPORT_LIMIT', 5)
+        instrument_serializers()
+
+    def __call__(self, request):
+        collector = QueryCollector()
+        timing = request._request_timing = RequestTiming(collector)
+        token = current_timing.set(timing)
+        start = time.perf_counter()
+
+        try:
+            with ExitStack() as stack:
+                for alias in connections:
+                    stack.enter_context(connections[alias].execute_wrapper(collector))
+                response = self.get_response(request)
+        finally:
+            current_timing.reset(token)
+
+        total_ms = (time.perf_counter() - start) * 1000
+        db_ms = collector.duration * 1000
+        serialize_ms = timing.serialize * 1000
+        render_ms = timing.render * 1000
+
+        response['Server-Timing'] = ', '.join([
+            f'db;dur={db_ms:.1f};desc="{collector.count} queries"',
+            f'serialize;dur={serialize_ms:.1f}',
+            f'render;dur={render_ms:.1f}',
+            f'app;dur={max(total_ms - db_ms - serialize_ms - render_ms, 0):.1f}',
+            f'total;dur={total_ms:.1f}',
+        ])
+
+        if collector.count > self.max_queries or total_ms > self.max_duration_ms:
+            self.report(request, response, collector, total_ms, db_ms, serialize_ms, render_ms)
+        return response
+
+    def process_template_response(self, request, response):
+        # DRF responses are rendered after the view returns; time the renderer separately
+        timing = getattr(request, '_request_timing', None)
+        if timing is not None:
+            started = time.perf_counter()
+
+            def finished(rendered):
+                timing.render += time.perf_counter() - started
+
+            response.add_post_render_callback(finished)
+        return response
+
+    def report(self, request, response, collector, total_ms, db_ms, serialize_ms, render_ms):
+        match = getattr(request, 'resolver_match', None)
+        view_name = match.view_name if match else request.path
+        duplicates = [(count, sql) for sql, count in collector.fingerprints.most_common(self.report_limit) if count > 1]
+
+        lines = [
+            f'Request over budget: {request.method} {request.path} ({view_name}) -> {response.status_code}: '
+            f'{collector.count} queries (budget {self.max_queries}), {total_ms:.1f}ms total '
+            f'(budget {self.max_duration_ms}ms), {db_ms:.1f}ms SQL, {serialize_ms:.1f}ms serialize, '
+            f'{render_ms:.1f}ms render'
+        ]
+        for count, sql in duplicates:
+            lines.append(f'  {count}x {sql[:300]}')
+        logger.warning('\n'.join(lines))
+
+
+COMPRESSIBLE_TYPES = ('text/', 'application/json', 'application/javascript', 'application/xml', 'image/svg+xml')
+
+
+def accepted_encodings(header):
+    """{content coding: q} of an Accept-Encoding header."""
+    accepted = {}
+    for part in header.split(','):
+        coding, *params = [value.strip() for value in part.split(';')]
+        if not coding:
+            continue
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[coding.lower()] = q
+    return accepted
+
+
+def choose_encoding(header, available):
+    """The client's most preferred of `available` codings (ours breaking ties), or None."""
+    accepted = accepted_encodings(header)
+    best, best_q = None, 0.0
+    for coding in available:
+        q = accepted.get(coding, accepted.get('*', 0.0))
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+class CompressionMiddleware:
+    """
+    Compresses response bodies of at least COMPRESSION_MIN_BYTES with brotli or
+    gzip, whichever the client's Accept-Encoding prefers (brotli on a tie, when
+    the brotli package is installed). Small bodies aren't worth the CPU or the
+    header overhead, and already compressed media types are left alone. Like
+    Django's GZipMiddleware, gzip output gets random padding against BREACH and
+    strong ETags are made weak, so If-None-Match still matches.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.min_bytes = getattr(settings, 'COMPRESSION_MIN_BYTES', 1024)
+        self.brotli_quality = getattr(settings, 'BROTLI_QUALITY', 5)
+        self.available = ('br', 'gzip') if brotli is not None else ('gzip',)
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if response.has_header('Content-Encoding') or not self.compressible(response):
+            return response
+        if not response.streaming and len(response.content) < self.min_bytes:
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        # No brotli streaming: those are sent gzipped
+        available = ('gzip',) if response.streaming else self.available
+        encoding = choose_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''), available)
+        if encoding is None:
+            return response
+
+        if response.streaming:
+            response.streaming_content = compress_sequence(response.streaming_content, max_random_bytes=100)
+            del response.headers['Content-Length']
+        else:
+            if encoding == 'br':
+                compressed = brotli.compress(response.content, quality=self.brotli_quality)
+            else:
+                compressed = compress_string(response.content, max_random_bytes=100)
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response.headers['Content-Length'] = str(len(compressed))
+
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = encoding
+        return response
+
+    def compressible(self, response):
+        content_type = response.get('Content-Type', '').lower()
+        return content_type.startswith(COMPRESSIBLE_TYPES)
@@ -0,0 +1,84 @@
+"""
+Model mixins shared by the apps.
+"""
+import copy
+
+
+def snapshot_value(value):
+    # JSON fields hold dicts/lists that can be changed in place
+    return copy.deepcopy(value) if isinstance(value, (dict, list)) else value
+
+
+class DirtyFieldsMixin:
+    """
+    Remembers the values a row was loaded (or last saved) with, so `changed_fields`
+    can tell what was modified without reading the row back. A save of a loaded row
+    writes only the changed columns, and is skipped altogether when nothing changed
+    (no UPDATE, no post_save). Put it before models.Model in the bases.
+    """
+
+    _loaded_values = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = {name: snapshot_value(value) for name, value in zip(field_names, values)}
+        return instance
+
+    def snapshot_fields(self, names):
+        loaded = dict(self._loaded_values or {})
+        loaded.update({name: snapshot_value(getattr(self, name)) for name in names})
+        self._loaded_values = loaded
+
+    @property
+    def changed_fields(self):
+        """Attnames of the concrete fields changed since load; every field of an unsaved row."""
+        if self._state.adding or self._loaded_values is None:
+            return {field.attname for field in self._meta.concrete_fields}
+        changed = {name for name, value in self._loaded_values.items() if getattr(self, name) != value}
+        # Fields deferred at load time count as changed once assigned
+        changed.update(
+            field.attname for field in self._meta.concrete_fields
+            if field.attname not in self._loaded_values and field.attname in self.__dict__
+        )
+        return changed
+
+    def has_changed(self, *names):
+        changed = self.changed_fields
+        return any(self._meta.get_field(name).attname in changed for name in names)
+
+    def loaded_value(self, name):
+        """The value `name` was loaded (or last saved) with; the current one for an unsaved row."""
+        attname = self._meta.get_field(name).attname
+        if self._state.adding or not self._loaded_values or attname not in self._loaded_values:
+            return getattr(self, attname)
+        return self._loaded_values[attname]
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+        deferred = self.get_deferred_fields()
+        self.snapshot_fields([
+            field.attname for field in self._meta.concrete_fields
+            if field.attname not in deferred and (fields is None or field.name in fields or field.attname in fields)
+        ])
+
+    def save(self, *args, **kwargs):
+        # Plain saves of a loaded row only; explicit update_fields/force_* are left as they are
+        if not args and not kwargs and not self._state.adding and self._loaded_values is not None:
+            changed = self.changed_fields
+            if not changed:
+                return
+            if self._meta.pk.attname not in changed:
+                # auto_now columns (updated_at) are set by the save itself
+                kwargs['update_fields'] = {
+                    field.name for field in self._meta.concrete_fields
+                    if field.attname in changed or getattr(field, 'auto_now', False)
+                }
+
+        super().save(*args, **kwargs)
+
+        fields = self._meta.concrete_fields
+        if kwargs.get('update_fields') is not None:
+            written = set(kwargs['update_fields'])
+            fields = [field for field in fields if field.name in written or field.attname in written]
+        self.snapshot_fields([field.attname for field in fields])
@@ -0,0 +1,31 @@
+"""
+JSON rendering with orjson.
+
+Same output as DRF's JSONRenderer (compact, UTF-8, "Z" for UTC datetimes,
+Decimals as numbers, U+2028/U+2029 escaped), but orjson serializes dicts,
+lists, UUIDs and datetimes in C: on large product lists rendering is several
+times faster than json.dumps with DRF's encoder.
+"""
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+import orjson
+
+OPTIONS = orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS
+# Everything orjson doesn't serialize itself (Decimal, lazy strings, timedelta, ...): as DRF does
+default = JSONEncoder().default
+
+
+class ORJSONRenderer(JSONRenderer):
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        options = OPTIONS
+        # `Accept: application/json; indent=4`, and the browsable API
+        if self.get_indent(accepted_media_type or '', renderer_context or {}):
+            options |= orjson.OPT_INDENT_2
+        ret = orjson.dumps(data, default=default, option=options)
+        # Like DRF: these are valid JSON but not valid JavaScript
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
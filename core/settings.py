@@ -92,6 +92,12 @@ LOGGING = {
             'level': 'DEBUG',
             'propagate': False,
         },
+        # Over-budget request reports from core.middleware.QueryBudgetMiddleware
+        'core.middleware': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
         # Your app logs
         'your_app_name': {  # Replace with your actual app name
             'handlers': ['console'],
@@ -123,11 +129,14 @@ INSTALLED_APPS = [
     'orders',
     'cart',
     'users',
+    'jobs',
     
 ]
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'core.middleware.CompressionMiddleware',
+    'core.middleware.QueryBudgetMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -222,7 +231,19 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
-LOGGING = None
+
+# Per-request query budget instrumentation (core/middleware.py): adds Server-Timing
+# headers and logs requests over these budgets with their repeated queries. When enabled,
+# the middleware replaces rest_framework's BaseSerializer.data with a timed property for
+# the whole process (a pass-through outside measured requests)
+QUERY_BUDGET_ENABLED = os.getenv('QUERY_BUDGET_ENABLED', str(DEBUG)).lower() == 'true'
+QUERY_BUDGET_MAX_QUERIES = int(os.getenv('QUERY_BUDGET_MAX_QUERIES', 50))
+QUERY_BUDGET_MAX_MS = int(os.getenv('QUERY_BUDGET_MAX_MS', 500))
+
+# Response compression (core/middleware.py): gzip, or brotli when the `brotli` package
+# is installed and the client accepts it, for bodies of at least COMPRESSION_MIN_BYTES
+COMPRESSION_MIN_BYTES = int(os.getenv('COMPRESSION_MIN_BYTES', 1024))
+BROTLI_QUALITY = int(os.getenv('BROTLI_QUALITY', 5))
 # CORS settings
 CORS_ALLOW_ALL_ORIGINS = True  
 CORS_ALLOW_CREDENTIALS = True
@@ -231,9 +252,73 @@ AUTH_USER_MODEL = "users.CustomUser"
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
         'rest_framework_simplejwt.authentication.JWTAuthentication',
-    )
+    ),
+    # orjson instead of json.dumps, same output (core/renderers.py)
+    'DEFAULT_RENDERER_CLASSES': (
+        'core.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
 }
 
+# Cache backend: Redis when REDIS_URL is set (shared by all gunicorn workers), per-process memory otherwise
+if os.getenv('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Versioned response cache for the catalog read endpoints (products/cache.py). Its version counters
+# live in the cache, so it is only on by default when that cache is shared: with the per-process
+# fallback a write (or an image job in run_jobs) would only invalidate the process that made it
+CATALOG_CACHE_ENABLED = os.getenv('CATALOG_CACHE_ENABLED', str(bool(os.getenv('REDIS_URL')))).lower() == 'true'
+CATALOG_CACHE_TIMEOUT = int(os.getenv('CATALOG_CACHE_TIMEOUT', 300))
+# Serialized products and variations, per version (core/fragments.py). Versioned keys are never
+# stale, so they can live longer than whole responses. Like the response cache, only on by
+# default with a shared cache, where every process sees the same version counters
+FRAGMENT_CACHE_ENABLED = os.getenv('FRAGMENT_CACHE_ENABLED', str(bool(os.getenv('REDIS_URL')))).lower() == 'true'
+FRAGMENT_CACHE_TIMEOUT = int(os.getenv('FRAGMENT_CACHE_TIMEOUT', 3600))
+
+# Image uploads go to the Supabase buckets; IMAGE_STORAGE_BACKEND=local keeps them on disk
+# under LOCAL_STORAGE_ROOT instead (tests, offline development)
+IMAGE_STORAGE_BACKEND = os.getenv('IMAGE_STORAGE_BACKEND', 'supabase' if os.getenv('SUPABASE_URL') else 'local')
+LOCAL_STORAGE_ROOT = os.path.join(MEDIA_ROOT, 'storage')
+LOCAL_STORAGE_URL = f'{MEDIA_URL}storage/'
+# Parallel uploads per processing job (original + renditions of every image in a request)
+IMAGE_UPLOAD_CONCURRENCY = int(os.getenv('IMAGE_UPLOAD_CONCURRENCY', 8))
+# Decode limits per upload (products/images.py): larger headers are rejected, larger
+# images are downscaled while decoding. `manage.py profile_image_upload` shows the cost
+IMAGE_MAX_PIXELS = int(os.getenv('IMAGE_MAX_PIXELS', 40_000_000))
+IMAGE_MAX_EDGE = int(os.getenv('IMAGE_MAX_EDGE', 2048))
+# Size of the process pool that decodes/encodes a request's images in parallel
+IMAGE_PROCESS_WORKERS = int(os.getenv('IMAGE_PROCESS_WORKERS', min(4, os.cpu_count() or 1)))
+
+# Background jobs (jobs app, `python manage.py run_jobs`)
+JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', 5))
+JOB_RETRY_BASE_SECONDS = int(os.getenv('JOB_RETRY_BASE_SECONDS', 10))
+JOB_STALE_AFTER_SECONDS = int(os.getenv('JOB_STALE_AFTER_SECONDS', 600))
+
+# "Frequently bought together" neighbors (products/recommendations.py): kept per product,
+# and baskets (a buyer's orders of one day) larger than this are ignored as noise
+RECOMMENDATION_NEIGHBORS = int(os.getenv('RECOMMENDATION_NEIGHBORS', 10))
+RECOMMENDATION_MAX_BASKET_SIZE = int(os.getenv('RECOMMENDATION_MAX_BASKET_SIZE', 50))
+
+# Keyset pagination for the product list endpoints (?page_size= / ?cursor=)
+PRODUCT_PAGE_SIZE = int(os.getenv('PRODUCT_PAGE_SIZE', 20))
+PRODUCT_MAX_PAGE_SIZE = int(os.getenv('PRODUCT_MAX_PAGE_SIZE', 100))
+
+# Reviews: always paginated on /products/detail/<slug>/reviews/, the detail page embeds the newest few
+REVIEW_PAGE_SIZE = int(os.getenv('REVIEW_PAGE_SIZE', 10))
+REVIEW_MAX_PAGE_SIZE = int(os.getenv('REVIEW_MAX_PAGE_SIZE', 50))
+PRODUCT_DETAIL_REVIEWS = int(os.getenv('PRODUCT_DETAIL_REVIEWS', 5))
+
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=30),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
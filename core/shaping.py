@@ -0,0 +1,111 @@
+"""
+Sparse fieldsets for serializers: `?fields=` and `?expand=`.
+
+`?fields=id,name,variations.unit_price` keeps only the named fields; a dotted
+name reaches into a nested serializer (`variations` alone keeps all of its
+default fields). `?expand=thumbnail` adds fields a serializer leaves out by
+default (its Meta.expandable_fields). Without either, responses are unchanged.
+
+Pruned fields are removed from the serializer before anything is serialized,
+so their SerializerMethodFields never run, and batch-loading serializers (see
+core/loaders.py) only collect the relations of the fields that are left:
+what isn't asked for is never queried.
+"""
+from rest_framework import serializers
+
+FIELDS_PARAM = 'fields'
+EXPAND_PARAM = 'expand'
+
+
+def parse_paths(value):
+    """'a,b.c,b.d' -> {'a': {}, 'b': {'c': {}, 'd': {}}}"""
+    tree = {}
+    for path in (value or '').split(','):
+        node = tree
+        for name in filter(None, (part.strip() for part in path.split('.'))):
+            node = node.setdefault(name, {})
+    return tree
+
+
+def format_paths(tree, prefix=''):
+    """The inverse of parse_paths, sorted: {'b': {'d': {}, 'c': {}}, 'a': {}} -> 'a,b.c,b.d'"""
+    paths = []
+    for name in sorted(tree):
+        path = prefix + name
+        paths.append(format_paths(tree[name], path + '.') if tree[name] else path)
+    return ','.join(paths)
+
+
+class Shape:
+    """The fields (None: the defaults) and expansions requested of one serializer, and of its nested ones."""
+
+    def __init__(self, fields=None, expand=None):
+        self.fields = fields
+        self.expand = expand or {}
+
+    @classmethod
+    def parse(cls, fields=None, expand=None):
+        return cls(parse_paths(fields) if fields else None, parse_paths(expand))
+
+    @classmethod
+    def from_request(cls, request):
+        params = request.query_params
+        return cls.parse(params.get(FIELDS_PARAM), params.get(EXPAND_PARAM))
+
+    @property
+    def key(self):
+        """Canonical text of the shape, e.g. for cache keys."""
+        fields = '*' if self.fields is None else format_paths(self.fields)
+        return f'{fields}|{format_paths(self.expand)}'
+
+    def nested(self, name):
+        # `fields=variations` (no sub-fields) means the nested serializer's defaults
+        fields = None if self.fields is None else (self.fields.get(name) or None)
+        return Shape(fields, self.expand.get(name))
+
+    def keep(self, names, expandable):
+        expanded = expandable & set(self.expand)
+        if self.fields is None:
+            return (names - expandable) | expanded
+        return names & (set(self.fields) | expanded)
+
+
+DEFAULT_SHAPE = Shape()
+
+
+class SparseFieldsMixin:
+    """
+    Prunes the serializer's fields to its Shape: passed as `shape=`, inherited
+    from the parent serializer for nested fields, or read from the request in
+    the context for the top-level serializer.
+    """
+
+    def __init__(self, *args, shape=None, **kwargs):
+        self._shape = shape
+        super().__init__(*args, **kwargs)
+
+    @property
+    def shape(self):
+        if self._shape is not None:
+            return self._shape
+        parent, name = self.parent, self.field_name
+        if isinstance(parent, serializers.ListSerializer):
+            parent, name = parent.parent, parent.field_name
+        if parent is None:
+            request = self.context.get('request')
+            self._shape = Shape.from_request(request) if request is not None else DEFAULT_SHAPE
+        elif isinstance(parent, SparseFieldsMixin):
+            self._shape = parent.shape.nested(name)
+        else:
+            self._shape = DEFAULT_SHAPE
+        return self._shape
+
+    def nested_shape(self, name):
+        """Shape of a nested serializer created by hand (e.g. in a SerializerMethodField)."""
+        return self.shape.nested(name)
+
+    def get_fields(self):
+        fields = super().get_fields()
+        expandable = set(getattr(self.Meta, 'expandable_fields', ()))
+        keep = self.shape.keep(set(fields), expandable)
+        return {name: field for name, field in fields.items() if name in keep}
@@ -0,0 +1,201 @@
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from unittest import skipUnless
+from django.db import connection
+from django.http import HttpResponse, HttpResponseNotModified
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils.translation import gettext_lazy
+from rest_framework import serializers
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from products.models import Product
+from users.models import CustomUser
+from .middleware import (CompressionMiddleware, QueryCollector, RequestTiming, brotli, current_timing,
+    instrument_serializers)
+from .renderers import ORJSONRenderer
+import gzip, re, time, uuid
+
+
+def server_timing(response):
+    """{metric: (duration, description)} of a Server-Timing header."""
+    metrics = {}
+    for entry in response['Server-Timing'].split(', '):
+        name, *params = entry.split(';')
+        params = dict(param.split('=', 1) for param in params)
+        metrics[name] = (float(params['dur']), params.get('desc', '').strip('"'))
+    return metrics
+
+
+def make_products(count):
+    vendor = CustomUser.objects.create_user(
+        email='farmer@example.com', username='farmer', contact_no='9190000000', role='farmer',
+    )
+    for number in range(count):
+        Product.objects.create(vendor=vendor, name=f'Product {number}', description='Fresh')
+
+
+@override_settings(ROOT_URLCONF='products.urls', QUERY_BUDGET_ENABLED=True)
+class QueryBudgetMiddlewareTests(TestCase):
+    def setUp(self):
+        make_products(3)
+        self.client = APIClient()
+
+    def test_server_timing_counts_the_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/')
+
+        metrics = server_timing(response)
+        self.assertEqual(list(metrics), ['db', 'serialize', 'render', 'app', 'total'])
+        self.assertEqual(metrics['db'][1], f'{len(queries)} queries')
+        parts = sum(metrics[name][0] for name in ('db', 'serialize', 'render', 'app'))
+        self.assertAlmostEqual(parts, metrics['total'][0], delta=0.5)
+
+    def test_request_within_budget_is_not_logged(self):
+        with self.assertNoLogs('core.middleware', 'WARNING'):
+            self.client.get('/')
+
+    @override_settings(QUERY_BUDGET_MAX_QUERIES=1)
+    def test_request_over_budget_is_logged(self):
+        with self.assertLogs('core.middleware', 'WARNING') as logs:
+            response = self.client.get('/')
+
+        count = server_timing(response)['db'][1].split()[0]
+        self.assertRegex(logs.output[0], re.escape(f'Request over budget: GET / (all-products) -> 200: {count} queries (budget 1)'))
+
+    @override_settings(QUERY_BUDGET_ENABLED=False)
+    def test_disabled(self):
+        self.assertFalse(self.client.get('/').has_header('Server-Timing'))
+
+
+class SleepySerializer(serializers.Serializer):
+    value = serializers.SerializerMethodField()
+
+    def get_value(self, obj):
+        time.sleep(0.05)
+        return obj
+
+
+class OuterSerializer(serializers.Serializer):
+    inner = serializers.SerializerMethodField()
+
+    def get_inner(self, obj):
+        # A nested serializer's `.data`: part of the outer one's time, not added again
+        return SleepySerializer(obj).data
+
+
+class SerializerTimingTests(TestCase):
+    def setUp(self):
+        instrument_serializers()
+
+    def measure(self, serializer):
+        timing = RequestTiming(QueryCollector())
+        token = current_timing.set(timing)
+        try:
+            data = serializer.data
+        finally:
+            current_timing.reset(token)
+        return data, timing.serialize
+
+    def test_outermost_data_is_timed_once(self):
+        data, seconds = self.measure(OuterSerializer([1, 2], many=True))
+
+        self.assertEqual(data, [{'inner': {'value': 1}}, {'inner': {'value': 2}}])
+        self.assertGreaterEqual(seconds, 0.1)
+        self.assertLess(seconds, 0.19)
+
+    def test_unmeasured_data_passes_through(self):
+        self.assertEqual(SleepySerializer(3).data, {'value': 3})
+
+
+class ORJSONRendererTests(TestCase):
+    def test_output_matches_drf(self):
+        data = {
+            'id': uuid.UUID('5b0c7c5e-3d51-4f7a-9c61-3f1f2e8f4a10'),
+            'price': Decimal('120.50'),
+            'total': Decimal('0.1'),
+            'created_at': datetime(2024, 5, 1, 8, 30, 15, 123456, tzinfo=dt_timezone.utc),
+            'local': datetime(2024, 5, 1, 16, 30, tzinfo=dt_timezone(timedelta(hours=8))),
+            'day': date(2024, 5, 1),
+            'histogram': {1: 0, 5: 3},
+            'flags': {True: 'yes', None: 'unknown'},
+            'name': 'Kamatis – ₱50 per kg ',
+            'label': gettext_lazy('Fresh'),
+            'window': timedelta(hours=1, seconds=30),
+            'ratio': 0.1 + 0.2,
+            'nested': [{'stock': 0, 'tags': ('organic', 'local'), 'empty': None, 'ok': False}],
+        }
+
+        self.assertEqual(ORJSONRenderer().render(data), JSONRenderer().render(data))
+
+    def test_none_is_an_empty_body(self):
+        self.assertEqual(ORJSONRenderer().render(None), b'')
+
+
+def text_response(size, content_type='application/json', **headers):
+    response = HttpResponse(b'x' * size, content_type=content_type)
+    for name, value in headers.items():
+        response[name] = value
+    return response
+
+
+@override_settings(COMPRESSION_MIN_BYTES=1024)
+class CompressionMiddlewareTests(TestCase):
+    def compress(self, response, accept_encoding='gzip'):
+        request = RequestFactory().get('/', HTTP_ACCEPT_ENCODING=accept_encoding)
+        return CompressionMiddleware(lambda request: response)(request)
+
+    def test_body_over_the_threshold_is_gzipped(self):
+        response = self.compress(text_response(2048, ETag='"abc"'))
+
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.content), b'x' * 2048)
+        self.assertEqual(response['Content-Length'], str(len(response.content)))
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        # Still matches If-None-Match (weak comparison), but no longer claims byte equality
+        self.assertEqual(response['ETag'], 'W/"abc"')
+
+    def test_body_under_the_threshold_is_left_alone(self):
+        response = self.compress(text_response(1023, ETag='"abc"'))
+
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(response.content, b'x' * 1023)
+        self.assertEqual(response['ETag'], '"abc"')
+
+    def test_not_modified_is_left_alone(self):
+        response = self.compress(HttpResponseNotModified(headers={'ETag': '"abc"'}))
+
+        self.assertEqual(response.status_code, 304)
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(response['ETag'], '"abc"')
+
+    def test_compressed_media_is_left_alone(self):
+        response = self.compress(text_response(4096, content_type='image/webp'))
+
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+    def test_client_without_gzip_gets_identity(self):
+        response = self.compress(text_response(2048), accept_encoding='gzip;q=0, identity')
+
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+
+    @skipUnless(brotli, 'brotli is not installed')
+    def test_brotli_is_preferred(self):
+        response = self.compress(text_response(2048), accept_encoding='gzip, br')
+
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(brotli.decompress(response.content), b'x' * 2048)
+
+    @override_settings(ROOT_URLCONF='products.urls', COMPRESSION_MIN_BYTES=1)
+    def test_weak_etag_revalidates(self):
+        make_products(3)
+        client = APIClient()
+        response = client.get('/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertTrue(response['ETag'].startswith('W/"'))
+
+        response = client.get('/', HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=response['ETag'])
+
+        self.assertEqual(response.status_code, 304)
+        self.assertFalse(response.has_header('Content-Encoding'))
@@ -37,7 +37,6 @@ logger = logging.getLogger(__name__)
 
 def health_check(request):
     logger.info("Health check endpoint called")
-    print("Health check endpoint called")
     return JsonResponse({"status": "healthy", "message": "Django is running"})
 
 # Add to urlpatterns
@@ -0,0 +1,36 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from jobs.queue import requeue_stale_jobs, run_pending
+import time
+
+
+class Command(BaseCommand):
+    help = 'Run the background job worker.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Drain the due jobs and exit instead of polling.')
+        parser.add_argument('--sleep', type=float, default=1.0, help='Seconds to wait when the queue is empty.')
+        parser.add_argument('--name', action='append', dest='names', help='Only run jobs with this name (repeatable).')
+
+    def handle(self, *args, **options):
+        # Handlers are registered by each app's ready(); make sure they've all run
+        apps.check_apps_ready()
+        names = options['names']
+
+        if options['once']:
+            requeue_stale_jobs()
+            ran = run_pending(names)
+            self.stdout.write(self.style.SUCCESS(f'Ran {ran} jobs.'))
+            return
+
+        self.stdout.write('Job worker started.')
+        last_stale_check = 0
+        try:
+            while True:
+                if time.monotonic() - last_stale_check > 60:
+                    requeue_stale_jobs()
+                    last_stale_check = time.monotonic()
+                if not run_pending(names, limit=100):
+                    time.sleep(options['sleep'])
+        except KeyboardInterrupt:
+            self.stdout.write('Job worker stopped.')
@@ -0,0 +1,132 @@
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from .models import Job
+import logging, os, random, socket, traceback
+
+logger = logging.getLogger(__name__)
+
+HANDLERS = {}
+
+
+class Handler:
+    def __init__(self, func, on_failure=None):
+        self.func = func
+        self.on_failure = on_failure
+
+
+def register(name, on_failure=None):
+    """
+    Register a job handler: `handler(payload)`. `on_failure(payload, error)` is
+    called once the job has used up its attempts.
+    """
+    def decorator(func):
+        HANDLERS[name] = Handler(func, on_failure)
+        return func
+    return decorator
+
+
+def enqueue(name, payload=None, run_at=None, max_attempts=None):
+    """
+    Queue a job. Call it inside the transaction that writes the rows the job
+    needs: the worker can't see the job before those rows are committed.
+    """
+    return Job.objects.create(
+        name=name,
+        payload=payload or {},
+        run_at=run_at or timezone.now(),
+        max_attempts=max_attempts or getattr(settings, 'JOB_MAX_ATTEMPTS', 5),
+    )
+
+
+def worker_id():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def retry_delay(attempts):
+    """Exponential backoff with jitter: base, 2x base, 4x base... capped."""
+    base = getattr(settings, 'JOB_RETRY_BASE_SECONDS', 10)
+    cap = getattr(settings, 'JOB_RETRY_MAX_SECONDS', 3600)
+    delay = min(base * (2 ** max(attempts - 1, 0)), cap)
+    return timedelta(seconds=delay * random.uniform(0.8, 1.2))
+
+
+def requeue_stale_jobs():
+    """Put back jobs whose worker died mid-run."""
+    stale_after = getattr(settings, 'JOB_STALE_AFTER_SECONDS', 600)
+    cutoff = timezone.now() - timedelta(seconds=stale_after)
+    return Job.objects.filter(status='running', locked_at__lt=cutoff).update(
+        status='queued', locked_at=None, locked_by='', updated_at=timezone.now()
+    )
+
+
+def claim_next_job(names=None):
+    """Atomically take the oldest due job, or return None."""
+    with transaction.atomic():
+        jobs = Job.objects.filter(status='queued', run_at__lte=timezone.now())
+        if names:
+            jobs = jobs.filter(name__in=names)
+        # skip_locked lets several workers poll Postgres without blocking each other;
+        # on SQLite it's ignored and the conditional update below does the claiming
+        job = jobs.order_by('run_at').select_for_update(skip_locked=True).first()
+        if job is None:
+            return None
+        now = timezone.now()
+        claimed = Job.objects.filter(pk=job.pk, status='queued').update(
+            status='running', attempts=job.attempts + 1, locked_at=now, locked_by=worker_id(), updated_at=now
+        )
+        if not claimed:
+            return None
+    job.refresh_from_db()
+    return job
+
+
+def run_job(job):
+    handler = HANDLERS.get(job.name)
+    if handler is None:
+        job.status = 'failed'
+        job.last_error = f'No handler registered for {job.name}'
+        job.save(update_fields=['status', 'last_error', 'updated_at'])
+        logger.error(job.last_error)
+        return False
+
+    try:
+        handler.func(job.payload)
+    except Exception as exc:
+        job.last_error = traceback.format_exc()
+        job.locked_at = None
+        job.locked_by = ''
+        if job.attempts >= job.max_attempts:
+            job.status = 'failed'
+            logger.error('Job %s (%s) failed after %s attempts: %s', job.name, job.pk, job.attempts, exc)
+            if handler.on_failure:
+                try:
+                    handler.on_failure(job.payload, exc)
+                except Exception:
+                    logger.exception('on_failure hook of %s raised', job.name)
+        else:
+            job.status = 'queued'
+            job.run_at = timezone.now() + retry_delay(job.attempts)
+            logger.warning('Job %s (%s) attempt %s failed, retrying at %s: %s',
+                           job.name, job.pk, job.attempts, job.run_at, exc)
+        job.save(update_fields=['status', 'run_at', 'last_error', 'locked_at', 'locked_by', 'updated_at'])
+        return False
+
+    job.status = 'done'
+    job.locked_at = None
+    job.last_error = ''
+    job.save(update_fields=['status', 'locked_at', 'last_error', 'updated_at'])
+    return True
+
+
+def run_pending(names=None, limit=None):
+    """Run due jobs until the queue is empty (or `limit` jobs ran). Returns the number run."""
+    ran = 0
+    while limit is None or ran < limit:
+        job = claim_next_job(names)
+        if job is None:
+            break
+        run_job(job)
+        ran += 1
+    return ran
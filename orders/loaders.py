@@ -0,0 +1,17 @@
+"""
+Batch functions of the order serializers (see core/loaders.py).
+"""
+from core.loaders import batch_loader
+from products.loaders import group_by
+from .models import OrderItem, OrderStatusHistory
+
+
+@batch_loader('order_items')
+def load_order_items(order_ids):
+    items = OrderItem.objects.filter(order_id__in=order_ids).select_related('variation__product').order_by('created_at', 'id')
+    return group_by(items, 'order_id')
+
+
+@batch_loader('order_status_history')
+def load_order_status_history(order_ids):
+    return group_by(OrderStatusHistory.objects.filter(order_id__in=order_ids).order_by('changed_at', 'id'), 'order_id')
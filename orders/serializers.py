@@ -1,9 +1,14 @@
+from django.db.models import prefetch_related_objects
 from rest_framework import serializers
+from core.loaders import BatchListSerializer, BatchSerializerMixin
+from core.shaping import SparseFieldsMixin
+from django.utils.functional import cached_property
+from . import loaders  # Registers the order batch functions
 from .models import Order, OrderItem, OrderStatusHistory, MarketTransaction
 from products.serializers import ProductSerializer
 from users.serializers import UserSerializer       
 
-class OrderItemSerializer(serializers.ModelSerializer):
+class OrderItemSerializer(SparseFieldsMixin, BatchSerializerMixin, serializers.ModelSerializer):
     product = ProductSerializer(source='variation.product', read_only=True)  # Get the product from the variation
     variation = serializers.CharField(source='variation.name', read_only=True)
     subtotal = serializers.SerializerMethodField()
@@ -11,19 +16,24 @@ class OrderItemSerializer(serializers.ModelSerializer):
     class Meta:
         model = OrderItem
         fields = ['id', 'product', 'variation', 'quantity', 'unit_price', 'subtotal', 'created_at']
+        list_serializer_class = BatchListSerializer
+
+    def collect(self, items):
+        if 'product' in self.fields:
+            self.fields['product'].collect([item.variation.product for item in items])
 
     def get_subtotal(self, obj):
         return obj.unit_price * obj.quantity
 
-class OrderStatusHistorySerializer(serializers.ModelSerializer):
+class OrderStatusHistorySerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = OrderStatusHistory
         fields = ['id', 'status', 'changed_at']
 
-class OrderSerializer(serializers.ModelSerializer):
-    items = OrderItemSerializer(many=True, read_only=True)
-    status_history = OrderStatusHistorySerializer(many=True, read_only=True)
-    buyer = UserSerializer(read_only=True)  # Or serializers.StringRelatedField()
+class OrderSerializer(SparseFieldsMixin, BatchSerializerMixin, serializers.ModelSerializer):
+    items = serializers.SerializerMethodField()
+    status_history = serializers.SerializerMethodField()
+    buyer = serializers.SerializerMethodField()  # Or serializers.StringRelatedField()
 
     class Meta:
         model = Order
@@ -31,6 +41,38 @@ class OrderSerializer(serializers.ModelSerializer):
             'id', 'order_identifier', 'buyer', 'status', 'total_price', 'shipping_address', 
             'payment_method', 'created_at', 'updated_at', 'items', 'status_history'
         ]
+        list_serializer_class = BatchListSerializer
+
+    def collect(self, orders):
+        order_ids = [order.id for order in orders]
+        if 'status_history' in self.fields:
+            self.loaders['order_status_history'].collect(order_ids)
+        if 'buyer' in self.fields:
+            # UserSerializer includes the groups and permissions
+            buyers = [buyer for buyer in self.loaders['users'].load_many({order.buyer_id for order in orders}) if buyer]
+            prefetch_related_objects(buyers, 'groups', 'user_permissions')
+        if 'items' in self.fields:
+            # Items are needed right away: their products are batched next
+            items = [item for items in self.loaders['order_items'].load_many(order_ids) for item in items or ()]
+            self.item_serializer.child.collect(items)
+
+    @cached_property
+    def item_serializer(self):
+        return OrderItemSerializer(many=True, context=self.context, shape=self.nested_shape('items'))
+
+    @cached_property
+    def status_history_serializer(self):
+        return OrderStatusHistorySerializer(many=True, shape=self.nested_shape('status_history'))
+
+    def get_items(self, obj):
+        return self.item_serializer.to_representation(self.loaders['order_items'].load(obj.id) or [])
+
+    def get_status_history(self, obj):
+        return self.status_history_serializer.to_representation(self.loaders['order_status_history'].load(obj.id) or [])
+
+    def get_buyer(self, obj):
+        buyer = self.loaders['users'].load(obj.buyer_id)
+        return UserSerializer(buyer).data if buyer else None
 
 class MarketTransactionSerializer(serializers.ModelSerializer):
     buyer = UserSerializer(read_only=True)
@@ -1,3 +1,92 @@
-from django.test import TestCase
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+from products.models import Product, ProductVariation
+from users.models import Address, CustomUser
+from .models import Order, OrderItem, OrderStatusHistory
+from .serializers import OrderSerializer
+import itertools
 
-# Create your tests here.
+contact_numbers = itertools.count(9180000000)
+
+
+def make_user(username, role):
+    return CustomUser.objects.create_user(
+        email=f'{username}@example.com', username=username, contact_no=str(next(contact_numbers)), role=role,
+    )
+
+
+def make_order(buyer, vendor, name):
+    product = Product.objects.create(vendor=vendor, name=name, description=f'{name} description')
+    variation = ProductVariation.objects.create(product=product, name='1kg', unit_price='10.00', stock=10)
+    order = Order.objects.create(buyer=buyer, total_price='20.00', shipping_address='Lipa', payment_method='cod')
+    OrderItem.objects.create(order=order, variation=variation, quantity=2, unit_price='10.00')
+    return order
+
+
+@override_settings(ROOT_URLCONF='orders.urls')
+class OrderHistoryViewTests(TestCase):
+    def setUp(self):
+        self.buyer = make_user('buyer', 'buyer')
+        self.client = APIClient()
+        self.client.force_authenticate(self.buyer)
+
+    def add_orders(self, sellers):
+        for number in range(sellers):
+            vendor = make_user(f'farmer{number}', 'farmer')
+            Address.objects.create(user=vendor, region='IV-A', province='Batangas', city='Lipa', barangay='Marawoy')
+            make_order(self.buyer, vendor, f'Product {number}')
+
+    def get_history(self, queries):
+        # Orders, their items with products, the products' images, the sellers and their addresses
+        with self.assertNumQueries(queries):
+            response = self.client.get(reverse('order-history'))
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_one_seller(self):
+        self.add_orders(1)
+
+        history = self.get_history(5)
+
+        self.assertEqual([order['sellerName'] for order in history], ['farmer0'])
+        self.assertEqual(history[0]['items'][0]['name'], 'Product 0')
+
+    def test_queries_dont_grow_with_the_sellers(self):
+        self.add_orders(5)
+
+        history = self.get_history(5)
+
+        self.assertEqual(sorted(order['sellerName'] for order in history), [f'farmer{number}' for number in range(5)])
+
+
+@override_settings(FRAGMENT_CACHE_ENABLED=False)
+class OrderSerializerQueryTests(TestCase):
+    def add_orders(self, count):
+        for number in range(count):
+            buyer = make_user(f'buyer{number}', 'buyer')
+            vendor = make_user(f'farmer{number}', 'farmer')
+            Address.objects.create(user=vendor, region='IV-A', province='Batangas', city='Lipa', barangay='Marawoy')
+            order = make_order(buyer, vendor, f'Product {number}')
+            OrderStatusHistory.objects.create(order=order, status='pending')
+
+    def serialize(self, count):
+        self.add_orders(count)
+        # Orders; buyers with addresses, groups and permissions; items with their products;
+        # the products' vendors with addresses, images, variations, variation images and
+        # ratings; status history. None of them per order
+        with self.assertNumQueries(13):
+            data = OrderSerializer(Order.objects.all(), many=True, context={}).data
+        self.assertEqual(len(data), count)
+        return data
+
+    def test_one_order(self):
+        order = self.serialize(1)[0]
+
+        self.assertEqual(order['buyer']['username'], 'buyer0')
+        self.assertEqual(order['items'][0]['product']['vendor_name'], 'farmer0')
+        self.assertEqual(order['items'][0]['product']['vendor_address']['city'], 'Lipa')
+        self.assertEqual([entry['status'] for entry in order['status_history']], ['pending'])
+
+    def test_five_orders(self):
+        self.serialize(5)
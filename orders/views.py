@@ -6,11 +6,17 @@ from django.db import transaction
 from collections import defaultdict
 from cart.models import Cart, CartItem
 from products.models import ProductVariation
+from products.tasks import enqueue_co_purchase_refresh
 from orders.serializers import OrderSerializer
+from core.loaders import get_loaders
+from core.shaping import Shape
 from .models import Order, OrderItem, OrderStatusHistory, MarketTransaction
 from users.models import CustomUser  
 from uuid import UUID
 import json
+import logging
+
+logger = logging.getLogger(__name__)
 
 class ConfirmCheckoutView(APIView):
     permission_classes = [IsAuthenticated]
@@ -35,9 +41,9 @@ class ConfirmCheckoutView(APIView):
         )
 
         # Log incoming data for debugging
-        print("Variation IDs:", variation_ids)
+        logger.debug("Variation IDs: %s", variation_ids)
         cart_variation_ids = cart_items.values_list('variation_id', flat=True)
-        print("Cart Items Variation IDs:", cart_variation_ids)
+        logger.debug("Cart Items Variation IDs: %s", cart_variation_ids)
         
         # Convert only the variation_ids to UUID, if they are not already UUIDs
         variation_ids = [UUID(v) if not isinstance(v, UUID) else v for v in variation_ids]
@@ -47,12 +53,11 @@ class ConfirmCheckoutView(APIView):
 
         # Now compare both as UUIDs
         missing_variations = [v for v in variation_ids if v not in cart_variation_ids]
-        print("Missing Variations:", missing_variations)
+        logger.debug("Missing Variations: %s", missing_variations)
 
         if missing_variations:
             return Response({"error": f"Variation(s) {missing_variations} are not in the cart."}, status=status.HTTP_400_BAD_REQUEST)
 
-        print("this loop1")
         # Group cart items by vendor
         vendor_items = defaultdict(list)
         for item in cart_items:
@@ -61,7 +66,6 @@ class ConfirmCheckoutView(APIView):
         order_ids = []
         response_orders = []
 
-        print("this loop2")
         # Each vendor gets their own order
         for vendor, items in vendor_items.items():
             order_total = 0
@@ -71,7 +75,6 @@ class ConfirmCheckoutView(APIView):
                     return Response({"error": f"Not enough stock for {item.variation.name}."}, status=status.HTTP_400_BAD_REQUEST)
                 order_total += item.quantity * item.variation.unit_price
 
-            print("order")
             # Create the order
             order = Order.objects.create(
                 buyer=buyer,
@@ -82,7 +85,6 @@ class ConfirmCheckoutView(APIView):
                 delivery_method=delivery_method
             )
 
-            print("order stats")
             # Status history
             OrderStatusHistory.objects.create(
                 order=order, 
@@ -104,7 +106,6 @@ class ConfirmCheckoutView(APIView):
                     item.variation.is_available = False
                 item.variation.save()
                 
-            print("market trans")
             # Create transaction (per vendor)
             MarketTransaction.objects.create(
                 order=order,
@@ -125,15 +126,24 @@ class ConfirmCheckoutView(APIView):
             order_ids.append(order.id)
 
         # Remove these items from cart
-        print("Cart items to be deleted:", cart_items)
+        logger.debug("Cart items to be deleted: %s", cart_items)
 
         cart_items.delete()
 
+        # Committed with the orders, so the worker always finds them
+        enqueue_co_purchase_refresh(order_ids)
+
         return Response({
             "message": "Orders created successfully.",
             "orders": response_orders
         }, status=status.HTTP_201_CREATED)
         
+# What OrderHistoryView reads of the serialized orders: nothing else is loaded
+HISTORY_SHAPE = Shape.parse(
+    'id,order_identifier,status,total_price,shipping_address,payment_method,created_at,'
+    'items.quantity,items.unit_price,items.variation,items.product.name,items.product.images,items.product.vendor'
+)
+
 class OrderHistoryView(APIView):
     permission_classes = [IsAuthenticated]
 
@@ -142,11 +152,16 @@ class OrderHistoryView(APIView):
         orders = Order.objects.filter(buyer=request.user).order_by('-created_at')
 
         # Serialize orders
-        serializer = OrderSerializer(orders, many=True)
+        serializer = OrderSerializer(orders, many=True, context={'request': request}, shape=HISTORY_SHAPE)
+        orders_data = serializer.data
+        # Every order's seller in one batch (the shape leaves out the vendor fields, so
+        # serializing didn't queue them)
+        users = get_loaders(serializer.context)['users']
+        users.collect(UUID(str(order['items'][0]['product']['vendor'])) for order in orders_data if order['items'])
 
         # Transform data to match the required response format
         order_history = []
-        for order in serializer.data:
+        for order in orders_data:
             order_data = {
                 'id': order['id'],
                 'orderId': order['order_identifier'],
@@ -179,22 +194,20 @@ class OrderHistoryView(APIView):
             # Get seller details
             if order['items']:
                 seller_id = order['items'][0]['product']['vendor']  # This is the seller's UUID
-                try:
-                    seller = CustomUser.objects.get(id=seller_id)  # Fetch the actual CustomUser instance using the UUID
+                seller = users.load(UUID(str(seller_id)))  # The actual CustomUser instance of the UUID
+                if seller is not None:
                     order_data['sellerName'] = seller.username  # Access the username
                     # Check if the seller has a profile and safely access it
                     if hasattr(seller, 'profile'):
                         order_data['sellerProfile'] = seller.profile.profile_picture
                     else:
                         order_data['sellerProfile'] = None
-                except CustomUser.DoesNotExist:
+                else:
                     order_data['sellerName'] = 'Unknown'
                     order_data['sellerProfile'] = None
 
             order_history.append(order_data)
-                # Pretty-print the order_history JSON
-        pretty_order_history = json.dumps(order_history, indent=4)
-
-        # Print the pretty-printed order history for debugging
-        print(pretty_order_history)
+        # Pretty-printing a whole history is costly: only when debug logging is on
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Order history: %s", json.dumps(order_history, indent=4, default=str))
         return Response(order_history)
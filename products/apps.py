@@ -0,0 +1,9 @@
+from django.apps import AppConfig
+
+
+class ProductsConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'products'
+
+    def ready(self):
+        from . import signals, tasks  # noqa: F401
@@ -0,0 +1,119 @@
+"""
+Content-addressed storage of processed images (ImageBlob).
+
+A blob's files are named after the SHA-256 of the uploaded bytes, so the same
+photo uploaded again, for any product or variation, is matched by hash and
+reuses the stored original and renditions without being decoded. Only exact
+matches are reused: an upload whose bytes differ but whose perceptual hash
+(dHash) matches an existing blob gets a blob of its own, linked to the other
+one through `near_duplicate_of`. A dHash match may well be another vendor's
+photo of similar produce, or a smaller copy, so it never stands in for the upload.
+"""
+from django.conf import settings
+from django.db import transaction
+from .images import process_uploads
+from .models import ImageBlob
+from .storage import upload_files
+import hashlib
+
+
+def blob_bucket():
+    return getattr(settings, 'IMAGE_BLOB_BUCKET', 'products')
+
+
+def source_sha256(source):
+    """SHA-256 of a file path (read in chunks) or of raw bytes."""
+    if isinstance(source, (bytes, bytearray)):
+        return hashlib.sha256(source).hexdigest()
+    with open(source, 'rb') as file:
+        return hashlib.file_digest(file, 'sha256').hexdigest()
+
+
+def blob_files(sha256, processed):
+    """Storage files of a new blob: {'original' or width: (name, buffer, content type)}."""
+    (content, content_type, extension), renditions, _ = processed
+    base_name = f'blobs/{sha256[:2]}/{sha256}'
+    files = {'original': (f'{base_name}.{extension}', content, content_type)}
+    for width, data in renditions.items():
+        files[str(width)] = (f'{base_name}_{width}w.webp', data, 'image/webp')
+    return files
+
+
+def is_near_duplicate(info, other):
+    """Same perceptual hash and aspect ratio. `info`/`other` hold dhash, width and height."""
+    if info['dhash'] != other['dhash']:
+        return False
+    # A flat image hashes to all zeros; and a crop of a photo isn't the same photo
+    if info['dhash'] == '0' * len(info['dhash']):
+        return False
+    return abs(info['width'] / info['height'] - other['width'] / other['height']) < 0.02
+
+
+def create_blobs(new_blobs):
+    """
+    Upload the files of new blobs ({sha256: processed}) in one concurrent batch and insert
+    their rows. Returns {sha256: ImageBlob}; a blob created meanwhile by another worker wins.
+    """
+    files = {sha256: blob_files(sha256, processed) for sha256, processed in new_blobs.items()}
+    urls = iter(upload_files(blob_bucket(), [file for blob in files.values() for file in blob.values()]))
+
+    rows = []
+    for sha256, blob in files.items():
+        uploaded = {key: next(urls) for key in blob}
+        info = new_blobs[sha256][2]
+        rows.append(ImageBlob(
+            sha256=sha256,
+            dhash=info['dhash'],
+            image=uploaded.pop('original'),
+            renditions=uploaded,
+            content_type=blob['original'][2],
+            width=info['width'],
+            height=info['height'],
+            size=sum(data.getbuffer().nbytes for _, data, _ in blob.values()),
+        ))
+    ImageBlob.objects.bulk_create(rows, ignore_conflicts=True)
+    return {blob.sha256: blob for blob in ImageBlob.objects.filter(sha256__in=files)}
+
+
+def store_images(images):
+    """
+    Point each image row at its blob, processing and uploading only the photos
+    that aren't stored yet, then save the rows.
+    """
+    sources = {image.pk: image.upload_source() for image in images}
+    hashes = {pk: source_sha256(source) for pk, source in sources.items()}
+    blobs = {blob.sha256: blob for blob in ImageBlob.objects.filter(sha256__in=set(hashes.values()))}
+
+    # One decode per distinct unknown file, even when a request repeats a photo
+    pending = {}
+    for pk, sha256 in hashes.items():
+        if sha256 not in blobs:
+            pending.setdefault(sha256, sources[pk])
+    processed = dict(zip(pending, process_uploads(list(pending.values()))))
+
+    # Near-duplicates: same perceptual hash as a stored blob, or as another new file of this batch
+    stored = {
+        blob.sha256: blob
+        for blob in ImageBlob.objects.filter(dhash__in={result[2]['dhash'] for result in processed.values()})
+    }
+    candidates = [(sha256, {'dhash': blob.dhash, 'width': blob.width, 'height': blob.height}) for sha256, blob in stored.items()]
+    near_duplicates = {}
+    for sha256, result in processed.items():
+        info = result[2]
+        match = next((other for other, other_info in candidates if is_near_duplicate(info, other_info)), None)
+        if match:
+            near_duplicates[sha256] = match
+        candidates.append((sha256, info))
+
+    if processed:
+        blobs.update(create_blobs(processed))
+    for sha256, original in near_duplicates.items():
+        # Only recorded: a blob created meanwhile by another worker keeps its own link
+        ImageBlob.objects.filter(pk=blobs[sha256].pk, near_duplicate_of=None).update(
+            near_duplicate_of=stored.get(original) or blobs[original]
+        )
+
+    with transaction.atomic():
+        for image in images:
+            image.use_blob(blobs[hashes[image.pk]])
+            image.save(update_fields=['blob', 'image', 'renditions', 'processing_state', 'updated_at'])
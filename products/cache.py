@@ -0,0 +1,174 @@
+"""
+Versioned response cache for the catalog read endpoints.
+
+Every cached response is keyed by endpoint + normalized query params + the
+current value of the version counters it depends on. Saving or deleting a
+product (or its variations, images, reviews) bumps the counters of that
+product, its vendor, its category and the global catalog, so old entries are
+simply never read again and expire on their own TTL.
+"""
+from functools import wraps
+from hashlib import sha1
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.response import Response
+from .models import Product, ProductNeighbor
+import uuid
+
+
+KEY_PREFIX = 'catalog'
+GLOBAL_VERSION_KEY = f'{KEY_PREFIX}:v:global'
+
+
+def product_version_key(product_id):
+    return f'{KEY_PREFIX}:v:product:{product_id}'
+
+
+def vendor_version_key(vendor_id):
+    return f'{KEY_PREFIX}:v:vendor:{vendor_id}'
+
+
+def category_version_key(category_id):
+    return f'{KEY_PREFIX}:v:category:{category_id}'
+
+
+def stats_key(endpoint, outcome):
+    return f'{KEY_PREFIX}:stats:{endpoint}:{outcome}'
+
+
+def cache_enabled():
+    return getattr(settings, 'CATALOG_CACHE_ENABLED', False)
+
+
+def increment(key):
+    # incr() raises on a missing key; add() is a no-op if someone else created it first
+    cache.add(key, 0, timeout=None)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, timeout=None)
+        return 1
+
+
+def bump_versions(keys):
+    for key in set(keys):
+        increment(key)
+
+
+def bump_product_versions(product_ids, vendor_ids=(), category_ids=()):
+    """Invalidate everything cached for these products, their vendors and categories."""
+    product_ids = set(product_ids)
+    vendor_ids = set(vendor_ids)
+    category_ids = set(category_ids)
+    for vendor_id, category_id in Product.objects.filter(id__in=product_ids).values_list('vendor_id', 'category_id'):
+        vendor_ids.add(vendor_id)
+        category_ids.add(category_id)
+
+    keys = [GLOBAL_VERSION_KEY]
+    keys += [product_version_key(product_id) for product_id in product_ids]
+    keys += [vendor_version_key(vendor_id) for vendor_id in vendor_ids if vendor_id]
+    keys += [category_version_key(category_id) for category_id in category_ids if category_id]
+    bump_versions(keys)
+
+
+def get_versions(keys):
+    values = cache.get_many(keys)
+    return [str(values.get(key, 0)) for key in keys]
+
+
+def normalized_params(request):
+    params = []
+    for name in sorted(request.query_params.keys()):
+        for value in sorted(request.query_params.getlist(name)):
+            params.append(f'{name}={value}')
+    return '&'.join(params)
+
+
+def build_response_key(endpoint, request, kwargs, version_keys):
+    versions = get_versions(version_keys)
+    # The host is part of the key because paginated responses embed absolute links
+    raw = '|'.join([endpoint, request.get_host(), repr(sorted(kwargs.items())), normalized_params(request), *versions])
+    return f'{KEY_PREFIX}:response:{endpoint}:{sha1(raw.encode("utf-8")).hexdigest()}'
+
+
+def record(endpoint, outcome):
+    increment(stats_key(endpoint, outcome))
+
+
+def get_stats(endpoints):
+    keys = [stats_key(endpoint, outcome) for endpoint in endpoints for outcome in ('hit', 'miss')]
+    values = cache.get_many(keys)
+    return {
+        endpoint: {
+            'hit': values.get(stats_key(endpoint, 'hit'), 0),
+            'miss': values.get(stats_key(endpoint, 'miss'), 0),
+        }
+        for endpoint in endpoints
+    }
+
+
+def list_version_keys(request, kwargs):
+    # Lists filtered to one vendor only depend on that vendor's products
+    user_id = request.query_params.get('user_id')
+    if user_id:
+        try:
+            return [vendor_version_key(uuid.UUID(user_id))]
+        except ValueError:
+            pass
+    return [GLOBAL_VERSION_KEY]
+
+
+def detail_version_keys(request, kwargs):
+    product = Product.objects.filter(slug=kwargs.get('slug')).values('id', 'category_id').first()
+    if product is None:
+        return None
+    # The related products block: co-purchase neighbors, and the category for the top-up
+    neighbor_ids = ProductNeighbor.objects.filter(product_id=product['id']).values_list('neighbor_id', flat=True)
+    return [
+        product_version_key(product['id']), category_version_key(product['category_id']),
+        *(product_version_key(neighbor_id) for neighbor_id in neighbor_ids),
+    ]
+
+
+def review_version_keys(request, kwargs):
+    product_id = Product.objects.filter(slug=kwargs.get('slug')).values_list('id', flat=True).first()
+    if product_id is None:
+        return None
+    return [product_version_key(product_id)]
+
+
+CACHED_ENDPOINTS = []
+
+
+def cache_catalog_response(endpoint, version_keys):
+    """
+    Cache a successful GET response's data. `version_keys(request, kwargs)`
+    returns the version counters the response depends on, or None to skip
+    caching (e.g. the object does not exist).
+    """
+    CACHED_ENDPOINTS.append(endpoint)
+
+    def decorator(view_method):
+        @wraps(view_method)
+        def wrapped(self, request, *args, **kwargs):
+            if not cache_enabled():
+                return view_method(self, request, *args, **kwargs)
+
+            keys = version_keys(request, kwargs)
+            if keys is None:
+                return view_method(self, request, *args, **kwargs)
+
+            key = build_response_key(endpoint, request, kwargs, keys)
+            data = cache.get(key)
+            if data is not None:
+                record(endpoint, 'hit')
+                return Response(data, headers={'X-Cache': 'HIT'})
+
+            record(endpoint, 'miss')
+            response = view_method(self, request, *args, **kwargs)
+            if response.status_code == 200:
+                cache.set(key, response.data, timeout=getattr(settings, 'CATALOG_CACHE_TIMEOUT', 300))
+            response['X-Cache'] = 'MISS'
+            return response
+        return wrapped
+    return decorator
@@ -0,0 +1,115 @@
+"""
+ETag support for the catalog read endpoints.
+
+The validators come from one cheap aggregate query (max timestamps and row
+counts), so a matching If-None-Match is answered with a 304 before anything
+is serialized. Counts are part of the ETag because deleting a row doesn't
+move any max(updated_at); for the same reason there is no Last-Modified, which
+would stay put after a delete and keep If-Modified-Since answering 304.
+"""
+from functools import wraps
+from hashlib import sha1
+from django.core.exceptions import ValidationError
+from django.db.models import Count, F, Max, OuterRef, Subquery
+from django.utils.cache import get_conditional_response
+from .models import (Product, ProductImage, ProductListingSummary, ProductNeighbor, ProductVariation, Review,
+    VariationImage)
+
+
+def child_aggregate(queryset, link, aggregate):
+    """Correlated subquery returning one aggregate over the rows linked to the outer product."""
+    return Subquery(
+        queryset.filter(**{link: OuterRef('pk')}).order_by().values(link).annotate(value=aggregate).values('value')[:1]
+    )
+
+
+def detail_state(view, request, kwargs):
+    """Validators of ProductDetailView: the product, its children, reviews and its category's listings."""
+    row = Product.objects.filter(slug=kwargs.get('slug')).annotate(
+        variations_updated=child_aggregate(ProductVariation.objects.all(), 'product', Max('updated_at')),
+        variations_count=child_aggregate(ProductVariation.objects.all(), 'product', Count('id')),
+        variation_images_updated=child_aggregate(VariationImage.objects.all(), 'variation__product', Max('updated_at')),
+        variation_images_count=child_aggregate(VariationImage.objects.all(), 'variation__product', Count('id')),
+        images_updated=child_aggregate(ProductImage.objects.all(), 'product', Max('updated_at')),
+        images_count=child_aggregate(ProductImage.objects.all(), 'product', Count('id')),
+        reviews_updated=child_aggregate(Review.objects.all(), 'product', Max('updated_at')),
+        reviews_count=child_aggregate(Review.objects.all(), 'product', Count('id')),
+        # Vendor name/address changes only show up on the product's own listing summary
+        summary_updated=F('listing_summary__updated_at'),
+        # The related products block is built from the category's listing summaries
+        related_updated=Subquery(
+            ProductListingSummary.objects.filter(category=OuterRef('category')).order_by()
+            .values('category').annotate(value=Max('updated_at')).values('value')[:1]
+        ),
+        related_count=Subquery(
+            ProductListingSummary.objects.filter(category=OuterRef('category')).order_by()
+            .values('category').annotate(value=Count('pk')).values('value')[:1]
+        ),
+        # ...and from the co-purchase neighbors' summaries
+        neighbors_updated=child_aggregate(ProductNeighbor.objects.all(), 'product', Max('updated_at')),
+        neighbors_count=child_aggregate(ProductNeighbor.objects.all(), 'product', Count('id')),
+        neighbor_summaries_updated=child_aggregate(
+            ProductListingSummary.objects.all(), 'product__neighbor_of__product', Max('updated_at')
+        ),
+    ).values(
+        'id', 'updated_at', 'variations_updated', 'variations_count', 'variation_images_updated',
+        'variation_images_count', 'images_updated', 'images_count', 'reviews_updated', 'reviews_count',
+        'summary_updated', 'related_updated', 'related_count', 'neighbors_updated', 'neighbors_count',
+        'neighbor_summaries_updated',
+    ).first()
+    if row is None:
+        return None
+    # ?fields= / ?expand= shape the body
+    row['params'] = sorted(request.query_params.lists())
+    return row
+
+
+def list_state(view, request, kwargs):
+    """Validators of the product lists: every listing row the status/vendor filter can return."""
+    summaries = ProductListingSummary.objects.all()
+    user_id = request.query_params.get('user_id')
+    if user_id:
+        summaries = summaries.filter(vendor_id=user_id)
+    status = request.query_params.get('status')
+    summaries = summaries.filter(status=status if status in view.VALID_STATUSES else 'published')
+
+    row = summaries.aggregate(updated=Max('updated_at'), count=Count('pk'))
+    # Filters, paging and facets only select from that set, so they just go into the hash
+    row['params'] = sorted(request.query_params.lists())
+    return row
+
+
+def make_etag(state, request):
+    # The Accept header picks the renderer, so it is part of the representation
+    raw = repr((sorted(state.items()), request.META.get('HTTP_ACCEPT', '')))
+    return '"%s"' % sha1(raw.encode('utf-8')).hexdigest()
+
+
+def conditional_catalog_response(state_func):
+    """
+    Answer If-None-Match with a 304 from a cheap aggregate before running the
+    view, and stamp the ETag on 200 responses. `state_func(view, request, kwargs)`
+    returns the validator dict, or None.
+    """
+    def decorator(view_method):
+        @wraps(view_method)
+        def wrapped(self, request, *args, **kwargs):
+            try:
+                state = state_func(self, request, kwargs)
+            except (ValueError, ValidationError):
+                # e.g. a malformed user_id; let the view produce its usual response
+                state = None
+            if state is None:
+                return view_method(self, request, *args, **kwargs)
+
+            etag = make_etag(state, request)
+            response = get_conditional_response(request, etag=etag)
+            if response is not None:
+                return response
+
+            response = view_method(self, request, *args, **kwargs)
+            if response.status_code == 200:
+                response['ETag'] = etag
+            return response
+        return wrapped
+    return decorator
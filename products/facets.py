@@ -0,0 +1,169 @@
+from collections import Counter
+from decimal import Decimal, InvalidOperation
+from django.conf import settings
+from django.db.models import Case, CharField, Count, Q, Value, When
+import uuid
+
+# (label, lower bound inclusive, upper bound exclusive); None means unbounded
+DEFAULT_PRICE_BANDS = [
+    ('0-50', None, 50),
+    ('50-100', 50, 100),
+    ('100-250', 100, 250),
+    ('250-500', 250, 500),
+    ('500+', 500, None),
+]
+
+FACET_DIMENSIONS = ('category', 'price_band', 'region', 'province', 'available')
+
+
+def get_price_bands():
+    return getattr(settings, 'PRODUCT_PRICE_BANDS', DEFAULT_PRICE_BANDS)
+
+
+def parse_list(value):
+    return [item.strip() for item in value.split(',') if item.strip()] if value else []
+
+
+def parse_uuid_list(value):
+    ids = []
+    for item in parse_list(value):
+        try:
+            ids.append(str(uuid.UUID(item)))
+        except ValueError:
+            continue
+    return ids
+
+
+def parse_decimal(value):
+    try:
+        return Decimal(value) if value not in (None, '') else None
+    except InvalidOperation:
+        return None
+
+
+def parse_facet_filters(query_params):
+    """
+    Read the facet filters off the query string. Multi-valued filters are
+    comma separated, e.g. ?category=<id>,<id>&price_band=0-50,50-100&region=Region III
+    """
+    available = query_params.get('available')
+    bands = {label for label, _, _ in get_price_bands()}
+    return {
+        'category': parse_uuid_list(query_params.get('category')),
+        'price_band': [band for band in parse_list(query_params.get('price_band')) if band in bands],
+        'region': parse_list(query_params.get('region')),
+        'province': parse_list(query_params.get('province')),
+        'available': [available.lower() == 'true'] if available in ('true', 'false', 'True', 'False') else [],
+        'min_price': parse_decimal(query_params.get('min_price')),
+        'max_price': parse_decimal(query_params.get('max_price')),
+    }
+
+
+def price_band_q(lower, upper, prefix=''):
+    q = Q(**{f'{prefix}min_price__isnull': False})
+    if lower is not None:
+        q &= Q(**{f'{prefix}min_price__gte': lower})
+    if upper is not None:
+        q &= Q(**{f'{prefix}min_price__lt': upper})
+    return q
+
+
+def facet_q(dimension, values, prefix=''):
+    if dimension == 'category':
+        return Q(**{f'{prefix}category_id__in': values})
+    if dimension == 'region':
+        return Q(**{f'{prefix}vendor_region__in': values})
+    if dimension == 'province':
+        return Q(**{f'{prefix}vendor_province__in': values})
+    if dimension == 'available':
+        return Q(**{f'{prefix}in_stock__in': values})
+    if dimension == 'price_band':
+        q = Q(pk__in=[])
+        for label, lower, upper in get_price_bands():
+            if label in values:
+                q |= price_band_q(lower, upper, prefix)
+        return q
+    raise ValueError(f'Unknown facet {dimension}')
+
+
+def apply_price_range(queryset, filters, prefix=''):
+    if filters['min_price'] is not None:
+        queryset = queryset.filter(**{f'{prefix}min_price__gte': filters['min_price']})
+    if filters['max_price'] is not None:
+        queryset = queryset.filter(**{f'{prefix}min_price__lte': filters['max_price']})
+    return queryset
+
+
+def apply_facet_filters(queryset, filters, prefix=''):
+    """
+    Filter a queryset by the parsed facet filters. `prefix` points at the
+    listing summary, e.g. 'listing_summary__' when filtering Product.
+    """
+    queryset = apply_price_range(queryset, filters, prefix)
+    for dimension in FACET_DIMENSIONS:
+        if filters[dimension]:
+            queryset = queryset.filter(facet_q(dimension, filters[dimension], prefix))
+    return queryset
+
+
+def compute_facets(summaries, filters):
+    """
+    Facet counts for a ProductListingSummary queryset in one aggregate query.
+
+    The rows are grouped by every facet dimension at once and rolled up in
+    Python. Each facet's counts apply all the *other* selected filters but not
+    its own, so the client can show how many results picking another value
+    of the same facet would add.
+    """
+    bands = get_price_bands()
+    band = Case(
+        *[When(price_band_q(lower, upper), then=Value(label)) for label, lower, upper in bands],
+        default=Value(None),
+        output_field=CharField(),
+    )
+    groups = list(
+        apply_price_range(summaries, filters)
+        .annotate(price_band=band)
+        .values('category_id', 'category_name', 'vendor_region', 'vendor_province', 'in_stock', 'price_band')
+        .annotate(count=Count('pk'))
+        .order_by()
+    )
+
+    def row_value(row, dimension):
+        return {
+            'category': str(row['category_id']) if row['category_id'] else None,
+            'price_band': row['price_band'],
+            'region': row['vendor_region'],
+            'province': row['vendor_province'],
+            'available': row['in_stock'],
+        }[dimension]
+
+    def matches(row, skip):
+        for dimension in FACET_DIMENSIONS:
+            if dimension != skip and filters[dimension] and row_value(row, dimension) not in filters[dimension]:
+                return False
+        return True
+
+    category_names = {str(row['category_id']): row['category_name'] for row in groups if row['category_id']}
+    band_order = {label: index for index, (label, _, _) in enumerate(bands)}
+    facets = {}
+    for dimension in FACET_DIMENSIONS:
+        counts = Counter()
+        for row in groups:
+            value = row_value(row, dimension)
+            if value is not None and matches(row, dimension):
+                counts[value] += row['count']
+
+        if dimension == 'price_band':
+            ordered = sorted(counts.items(), key=lambda item: band_order[item[0]])
+        else:
+            ordered = sorted(counts.items(), key=lambda item: (-item[1], str(item[0])))
+
+        entries = []
+        for value, count in ordered:
+            entry = {'value': value, 'count': count}
+            if dimension == 'category':
+                entry['label'] = category_names.get(value)
+            entries.append(entry)
+        facets[dimension] = entries
+    return facets
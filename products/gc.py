@@ -0,0 +1,178 @@
+"""
+Garbage collection of stored image files that no row references any more.
+
+Deleting products, variations or images only removes rows; the raw uploads in
+MEDIA_ROOT, the processed files in the storage buckets and the ImageBlob rows
+they came from stay behind. The collector streams each storage listing in
+chunks and asks the database, one query per chunk, which of those names are
+still referenced, so neither the listing nor the set of referenced names is
+ever held in full. Files newer than the grace period are always kept (they may
+belong to an upload still in flight), and files whose names it doesn't
+recognise are left alone.
+"""
+from django.db.models import Exists, OuterRef, Q
+from .models import ImageBlob, ProductImage, VariationImage
+from .storage import delete_files, get_image_storage, iter_storage_files
+import json, os, re
+
+BLOB_NAME_RE = re.compile(r'^blobs/[0-9a-f]{2}/(?P<sha256>[0-9a-f]{64})(?:_\d+w)?\.\w+$')
+# Per-image names used before blobs: <bucket>/<image id>_<timestamp>_<random>[_<width>w].<ext>
+IMAGE_NAME_RE = re.compile(r'^(?:products|variations)/(?P<id>[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12})_')
+
+IMAGE_MODELS = (ProductImage, VariationImage)
+DONE = '\0done'
+
+
+def referenced_blobs(cutoff):
+    """Blobs still in use: referenced by an image, or too recent to judge."""
+    return ImageBlob.objects.annotate(
+        in_product=Exists(ProductImage.objects.filter(blob=OuterRef('pk'))),
+        in_variation=Exists(VariationImage.objects.filter(blob=OuterRef('pk'))),
+    ).filter(Q(in_product=True) | Q(in_variation=True) | Q(created_at__gte=cutoff))
+
+
+def referenced_uploads(storage, names, cutoff):
+    """Raw uploads (`image_file`) among `names` that an image row still points at."""
+    referenced = set()
+    for model in IMAGE_MODELS:
+        referenced.update(model.objects.filter(image_file__in=names).values_list('image_file', flat=True))
+    return referenced
+
+
+def referenced_bucket_files(storage, names, cutoff):
+    """Processed files among `names` that a live blob or an image row still points at."""
+    referenced = set()
+    blob_files = {}
+    image_files = {}
+    for name in names:
+        if match := BLOB_NAME_RE.match(name):
+            blob_files[name] = match['sha256']
+        elif match := IMAGE_NAME_RE.match(name):
+            image_files[name] = match['id']
+        else:
+            referenced.add(name)
+
+    if blob_files:
+        live = set(referenced_blobs(cutoff).filter(sha256__in=set(blob_files.values())).values_list('sha256', flat=True))
+        referenced.update(name for name, sha256 in blob_files.items() if sha256 in live)
+
+    if image_files:
+        prefix = storage.url('')
+        for model in IMAGE_MODELS:
+            rows = model.objects.filter(id__in=set(image_files.values())).values_list('image', 'renditions')
+            for image, renditions in rows:
+                for url in [image, *(renditions or {}).values()]:
+                    if url and url.startswith(prefix):
+                        referenced.add(url[len(prefix):])
+    return referenced
+
+
+def gc_sources():
+    """(label, storage, path, referenced(storage, names, cutoff)) for every place images are stored."""
+    sources = []
+    for model in IMAGE_MODELS:
+        field = model._meta.get_field('image_file')
+        sources.append((f'uploads:{field.upload_to.strip("/")}', field.storage, field.upload_to.strip('/'), referenced_uploads))
+    for bucket in sorted({model.STORAGE_BUCKET for model in IMAGE_MODELS}):
+        sources.append((f'bucket:{bucket}', get_image_storage(bucket), '', referenced_bucket_files))
+    return sources
+
+
+def name_key(name):
+    # Listings are name-sorted directory by directory, which is the order of the path components
+    return name.split('/')
+
+
+class Checkpoint:
+    """Progress of a run (last name handled per source), so an interrupted run can resume."""
+
+    def __init__(self, path):
+        self.path = path
+        self.state = {}
+        if path and os.path.exists(path):
+            with open(path) as file:
+                self.state = json.load(file)
+
+    def get(self, label):
+        return self.state.get(label)
+
+    def set(self, label, value):
+        self.state[label] = value
+        if self.path:
+            with open(self.path, 'w') as file:
+                json.dump(self.state, file)
+
+    def clear(self):
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class GarbageCollector:
+    def __init__(self, cutoff, dry_run=True, chunk_size=500, checkpoint=None, log=print):
+        self.cutoff = cutoff
+        self.dry_run = dry_run
+        self.chunk_size = chunk_size
+        self.checkpoint = checkpoint or Checkpoint(None)
+        self.log = log
+        self.report = {}
+
+    def run(self, labels=None):
+        # Blob rows go first: their files are only garbage once the row is gone
+        if not labels or 'blobs' in labels:
+            self.collect_blob_rows()
+        for label, storage, path, referenced in gc_sources():
+            if not labels or label in labels:
+                self.collect_files(label, storage, path, referenced)
+        self.checkpoint.clear()
+        return self.report
+
+    def add(self, label, scanned=0, orphans=0, size=0):
+        totals = self.report.setdefault(label, {'scanned': 0, 'orphans': 0, 'bytes': 0})
+        totals['scanned'] += scanned
+        totals['orphans'] += orphans
+        totals['bytes'] += size
+
+    def collect_blob_rows(self):
+        """ImageBlob rows no image references (and older than the grace period)."""
+        if self.checkpoint.get('blobs') == DONE:
+            return
+        unreferenced = ImageBlob.objects.exclude(pk__in=referenced_blobs(self.cutoff).values('pk')).order_by('pk')
+        last = self.checkpoint.get('blobs')
+        while True:
+            chunk = unreferenced.filter(pk__gt=last) if last else unreferenced
+            chunk = list(chunk.values_list('pk', 'size')[:self.chunk_size])
+            if not chunk:
+                break
+            self.add('blobs', scanned=len(chunk), orphans=len(chunk), size=sum(size for _, size in chunk))
+            if not self.dry_run:
+                # Re-checked at delete time: an upload may have picked one of them up meanwhile
+                unreferenced.filter(pk__in=[pk for pk, _ in chunk]).delete()
+            last = str(chunk[-1][0])
+            self.checkpoint.set('blobs', last)
+        self.checkpoint.set('blobs', DONE)
+
+    def collect_files(self, label, storage, path, referenced):
+        last = self.checkpoint.get(label)
+        if last == DONE:
+            return
+        self.log(f'Scanning {label}...')
+        chunk = []
+        for name, size, modified in iter_storage_files(storage, path):
+            if last and name_key(name) <= name_key(last):
+                continue
+            chunk.append((name, size, modified))
+            if len(chunk) >= self.chunk_size:
+                self.collect_chunk(label, storage, chunk, referenced)
+                chunk = []
+        if chunk:
+            self.collect_chunk(label, storage, chunk, referenced)
+        self.checkpoint.set(label, DONE)
+
+    def collect_chunk(self, label, storage, chunk, referenced):
+        names = [name for name, _, _ in chunk]
+        keep = referenced(storage, names, self.cutoff)
+        orphans = [(name, size) for name, size, modified in chunk if name not in keep and modified < self.cutoff]
+        self.add(label, scanned=len(chunk), orphans=len(orphans), size=sum(size for _, size in orphans))
+        if orphans and not self.dry_run:
+            delete_files(storage, [name for name, _ in orphans])
+        self.checkpoint.set(label, names[-1])
@@ -0,0 +1,203 @@
+"""
+Decoding and encoding of uploaded product/variation images.
+
+Uploads are decoded with a bounded amount of memory: the header is checked
+first (format, pixel count) so decompression bombs are rejected before any
+pixel is decoded, JPEGs are decoded straight at a reduced scale with
+`draft()`, and nothing larger than IMAGE_MAX_EDGE px is ever kept. A decoded
+RGBA image costs 4 bytes per pixel, so the per-upload peak is roughly
+4 x IMAGE_MAX_EDGE² for JPEGs and 4 x IMAGE_MAX_PIXELS at worst for the rest.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from PIL import Image, ImageOps, UnidentifiedImageError
+import io, multiprocessing, os
+
+DEFAULT_RENDITION_WIDTHS = (160, 480, 1080)
+# Widths requested by the listing cards and the cart/thumbnail strips
+LISTING_WIDTH = 480
+THUMBNAIL_WIDTH = 160
+
+ALLOWED_FORMATS = {'JPEG', 'PNG', 'WEBP', 'GIF'}
+DEFAULT_MAX_PIXELS = 40_000_000
+DEFAULT_MAX_EDGE = 2048
+
+
+def rendition_widths():
+    return tuple(sorted(getattr(settings, 'IMAGE_RENDITION_WIDTHS', DEFAULT_RENDITION_WIDTHS)))
+
+
+def max_pixels():
+    return getattr(settings, 'IMAGE_MAX_PIXELS', DEFAULT_MAX_PIXELS)
+
+
+def max_edge():
+    return getattr(settings, 'IMAGE_MAX_EDGE', DEFAULT_MAX_EDGE)
+
+
+def inspect_image(file):
+    """
+    Open an image reading only its header and check it can be decoded safely.
+    Returns the (still undecoded) image; raises ValidationError otherwise.
+    """
+    try:
+        image = Image.open(file)
+    except Image.DecompressionBombError:
+        raise ValidationError("Image dimensions are too large.")
+    except (UnidentifiedImageError, OSError):
+        raise ValidationError("Unsupported or corrupt image file.")
+
+    if image.format not in ALLOWED_FORMATS:
+        raise ValidationError(f"Unsupported image format: {image.format}.")
+    width, height = image.size
+    if width * height > max_pixels():
+        raise ValidationError(f"Image dimensions are too large ({width}x{height}).")
+    return image
+
+
+def inspect_uploads(files):
+    """Request-side check of uploaded files; only their headers are read."""
+    for file in files:
+        inspect_image(file)
+        file.seek(0)
+
+
+def open_bounded(file, edge=None):
+    """
+    Decode an image with its longest side capped at `edge` px (IMAGE_MAX_EDGE by default).
+    JPEGs are decoded at a reduced scale directly; other formats are downscaled right after.
+    """
+    edge = edge or max_edge()
+    image = inspect_image(file)
+    if max(image.size) > edge:
+        # JPEG only: decodes at the smallest 1/2, 1/4 or 1/8 scale still covering the target size
+        scale = edge / max(image.size)
+        image.draft('RGB' if image.mode == 'CMYK' else None, (round(image.width * scale), round(image.height * scale)))
+    image.load()
+
+    # Phone photos are often stored sideways with an EXIF rotation flag
+    image = ImageOps.exif_transpose(image)
+    if max(image.size) > edge:
+        image.thumbnail((edge, edge), Image.LANCZOS)
+    return image
+
+
+def reencode_image(image):
+    """
+    Re-encode a decoded image: PNG when it has transparency, JPEG otherwise.
+    Returns (buffer, content type, extension); the buffer is rewound, ready to upload.
+    """
+    image_io = io.BytesIO()
+    if image.mode == 'RGBA':
+        # Save it as PNG to preserve transparency
+        image.save(image_io, format='PNG')
+        extension, content_type = 'png', 'image/png'
+    else:
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        image.save(image_io, format='JPEG')
+        extension, content_type = 'jpg', 'image/jpeg'
+    image_io.seek(0)
+    return image_io, content_type, extension
+
+
+def make_renditions(image, widths=None):
+    """
+    Resize a decoded image to each width and encode it as WebP. Returns {width: buffer}.
+    Images are never upscaled: the first width at or above the original gets an
+    original-size rendition and larger widths are left out.
+    """
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'transparency' in image.info or image.mode in ('LA', 'PA') else 'RGB')
+
+    quality = getattr(settings, 'IMAGE_RENDITION_QUALITY', 80)
+    renditions = {}
+    for width in widths or rendition_widths():
+        target = min(width, image.width)
+        height = max(round(image.height * target / image.width), 1)
+        resized = image if target == image.width else image.resize((target, height), Image.LANCZOS)
+        output = io.BytesIO()
+        resized.save(output, format='WEBP', quality=quality, method=4)
+        output.seek(0)
+        renditions[width] = output
+        if target == image.width:
+            break
+    return renditions
+
+
+def dhash(image, size=8):
+    """
+    64-bit difference hash, as 16 hex digits: compares neighbouring pixels of a tiny
+    grayscale copy, so re-encoded or resized copies of a photo get the same value.
+    """
+    small = image.convert('L').resize((size + 1, size), Image.BILINEAR)
+    pixels = list(small.getdata())
+    bits = 0
+    for row in range(size):
+        for col in range(size):
+            left = pixels[row * (size + 1) + col]
+            right = pixels[row * (size + 1) + col + 1]
+            bits = (bits << 1) | (left > right)
+    return f'{bits:0{size * size // 4}x}'
+
+
+def process_upload(file):
+    """
+    Decode an uploaded file once. Returns (re-encoded original, {width: WebP buffer}, info)
+    where info holds the perceptual hash and the stored width/height.
+    """
+    image = open_bounded(file)
+    try:
+        info = {'dhash': dhash(image), 'width': image.width, 'height': image.height}
+        return reencode_image(image), make_renditions(image), info
+    finally:
+        image.close()
+
+
+def process_upload_source(source):
+    """process_upload() for a file path or raw bytes, i.e. something that can be sent to a pool worker."""
+    if isinstance(source, (bytes, bytearray)):
+        return process_upload(io.BytesIO(source))
+    with open(source, 'rb') as file:
+        return process_upload(file)
+
+
+def process_workers():
+    return getattr(settings, 'IMAGE_PROCESS_WORKERS', min(4, os.cpu_count() or 1))
+
+
+@lru_cache(maxsize=None)
+def get_process_pool():
+    # One long-lived pool per process. Spawned rather than forked: the parent
+    # has DB connections and upload threads that a forked child would inherit
+    return ProcessPoolExecutor(max_workers=process_workers(), mp_context=multiprocessing.get_context('spawn'))
+
+
+def process_uploads(sources):
+    """
+    process_upload() for several images (paths or bytes), fanned out to the
+    process pool since the Pillow work is CPU-bound. Results keep the order of
+    `sources`; a failure in any image is raised here.
+    """
+    if len(sources) <= 1 or process_workers() <= 1:
+        return [process_upload_source(source) for source in sources]
+    return list(get_process_pool().map(process_upload_source, sources))
+
+
+def decoded_size(image):
+    """Bytes held by a decoded image's pixels."""
+    return image.width * image.height * len(image.getbands())
+
+
+def pick_rendition(renditions, width, fallback=None):
+    """
+    URL of the smallest rendition at least `width` px wide (the largest one if none is),
+    or `fallback` (usually the original) for images processed before renditions existed.
+    """
+    if not renditions:
+        return fallback
+    sizes = sorted(int(size) for size in renditions)
+    chosen = next((size for size in sizes if size >= width), sizes[-1])
+    return renditions[str(chosen)]
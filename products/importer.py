@@ -0,0 +1,396 @@
+"""
+Bulk catalog import from CSV or JSON Lines.
+
+One row per variation; rows naming the same product (by `slug` when given,
+otherwise by `product` name within the vendor's catalog) are grouped into one
+product. Existing products and variations are updated, missing ones created.
+The file is streamed and handled in batches: each batch is validated in
+memory, looked up with a handful of queries and written with
+bulk_create/bulk_update in one transaction. Invalid rows are reported with
+their line number and skipped; they never abort the rest of the file.
+
+bulk_create/bulk_update don't send signals, so the read models (listing
+summaries, search documents) and the response cache are refreshed explicitly
+for every product a batch touched.
+"""
+from decimal import Decimal, InvalidOperation
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.text import slugify
+from .models import Category, Product, ProductVariation
+from .signals import refresh_read_models
+from .slugs import allocate_slugs
+from .tasks import enqueue_content_refresh
+import csv, io, json
+
+IMPORT_COLUMNS = [
+    'product', 'slug', 'description', 'category', 'status',
+    'variation', 'unit_price', 'stock', 'unit_measurement', 'is_available', 'is_default',
+]
+PRODUCT_STATUSES = {value for value, _ in Product.STATUS_CHOICES}
+TRUE_VALUES = {'1', 'true', 'yes', 'y'}
+FALSE_VALUES = {'0', 'false', 'no', 'n', ''}
+MAX_PRICE = Decimal('99999999.99')
+# bulk_update() builds one CASE WHEN per field and row; past a few hundred rows a statement gets slower per row
+UPDATE_BATCH_SIZE = 200
+
+
+class RowError(ValueError):
+    pass
+
+
+class ImportResult:
+    def __init__(self):
+        self.rows = 0
+        self.created_products = 0
+        self.updated_products = 0
+        self.created_variations = 0
+        self.updated_variations = 0
+        self.errors = []
+
+    def counts(self):
+        return (self.created_products, self.updated_products, self.created_variations, self.updated_variations)
+
+    def restore_counts(self, counts):
+        self.created_products, self.updated_products, self.created_variations, self.updated_variations = counts
+
+    def error(self, line, message):
+        self.errors.append({'line': line, 'error': message})
+
+    def as_dict(self, max_errors=None):
+        return {
+            'rows': self.rows,
+            'created_products': self.created_products,
+            'updated_products': self.updated_products,
+            'created_variations': self.created_variations,
+            'updated_variations': self.updated_variations,
+            'error_count': len(self.errors),
+            'errors': self.errors[:max_errors] if max_errors else self.errors,
+        }
+
+
+def detect_format(filename, default='csv'):
+    if filename and filename.lower().endswith(('.jsonl', '.ndjson', '.json')):
+        return 'jsonl'
+    if filename and filename.lower().endswith('.csv'):
+        return 'csv'
+    return default
+
+
+def read_rows(stream, format):
+    """Yield (line number, row dict or None, error or None) from a binary stream."""
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    if format == 'csv':
+        reader = csv.DictReader(text)
+        for row in reader:
+            yield reader.line_num, row, None
+        return
+
+    for line_number, line in enumerate(text, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield line_number, None, f'Invalid JSON: {e}'
+            continue
+        if not isinstance(row, dict):
+            yield line_number, None, 'Each line must be a JSON object.'
+            continue
+        yield line_number, row, None
+
+
+def text_value(row, field, max_length=None, required=False):
+    value = row.get(field)
+    value = '' if value is None else str(value).strip()
+    if required and not value:
+        raise RowError(f'{field} is required.')
+    if max_length and len(value) > max_length:
+        raise RowError(f'{field} is longer than {max_length} characters.')
+    return value
+
+
+def bool_value(row, field, default):
+    value = row.get(field)
+    if value is None or value == '':
+        return default
+    if isinstance(value, bool):
+        return value
+    value = str(value).strip().lower()
+    if value in TRUE_VALUES:
+        return True
+    if value in FALSE_VALUES:
+        return False
+    raise RowError(f'{field} must be true or false.')
+
+
+def price_value(row, field, required=True):
+    """A price column as a Decimal; None for a blank optional cell."""
+    value = row.get(field)
+    value = '' if value is None else str(value).strip()
+    if not value and not required:
+        return None
+    try:
+        value = Decimal(value)
+    except InvalidOperation:
+        raise RowError(f'{field} must be a number.')
+    if not value.is_finite() or value < 0 or value > MAX_PRICE:
+        raise RowError(f'{field} must be between 0 and 99999999.99.')
+    return value.quantize(Decimal('0.01'))
+
+
+def stock_value(row, field, default=None):
+    """A stock column as an int; `default` for a blank cell."""
+    value = row.get(field)
+    if value is None or value == '':
+        return default
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        raise RowError(f'{field} must be a whole number.')
+    if value < 0:
+        raise RowError(f'{field} cannot be negative.')
+    return value
+
+
+def clean_row(row):
+    """Validate one row; returns a dict of typed values or raises RowError."""
+    unit_price = price_value(row, 'unit_price')
+    stock = stock_value(row, 'stock', default=0)
+
+    status = text_value(row, 'status')
+    if status and status not in PRODUCT_STATUSES:
+        raise RowError(f'Unknown status "{status}".')
+
+    return {
+        'product': text_value(row, 'product', max_length=200, required=True),
+        'slug': slugify(text_value(row, 'slug')),
+        'description': text_value(row, 'description'),
+        'category': text_value(row, 'category', max_length=100),
+        'status': status,
+        'variation': text_value(row, 'variation', max_length=100, required=True),
+        'unit_price': unit_price,
+        'stock': stock,
+        'unit_measurement': text_value(row, 'unit_measurement', max_length=100) or 'per kg',
+        'is_available': bool_value(row, 'is_available', True),
+        'is_default': bool_value(row, 'is_default', False),
+    }
+
+
+def assign(instance, values):
+    """Set attributes on a model instance. Returns the names of the fields whose value changed."""
+    changed = set()
+    for field, value in values.items():
+        if getattr(instance, field) != value:
+            setattr(instance, field, value)
+            changed.add(field)
+    return changed
+
+
+class CatalogImporter:
+    def __init__(self, vendor, batch_size=1000):
+        self.vendor = vendor
+        self.batch_size = batch_size
+        self.result = ImportResult()
+        self.categories = {}
+
+    def run(self, stream, format='csv'):
+        batch = []
+        for line, row, error in read_rows(stream, format):
+            self.result.rows += 1
+            if error:
+                self.result.error(line, error)
+                continue
+            try:
+                batch.append((line, clean_row(row)))
+            except RowError as e:
+                self.result.error(line, str(e))
+                continue
+            if len(batch) >= self.batch_size:
+                self.import_batch(batch)
+                batch = []
+        if batch:
+            self.import_batch(batch)
+        return self.result
+
+    def resolve_categories(self, batch):
+        names = {row['category'] for _, row in batch if row['category']} - self.categories.keys()
+        if names:
+            for category in Category.objects.filter(name__in=names):
+                self.categories[category.name] = category.id
+
+        valid = []
+        for line, row in batch:
+            if row['category'] and row['category'] not in self.categories:
+                self.result.error(line, f'Unknown category "{row["category"]}".')
+                continue
+            valid.append((line, row))
+        return valid
+
+    def product_key(self, row):
+        return ('slug', row['slug']) if row['slug'] else ('name', row['product'])
+
+    def load_products(self, keys):
+        slugs = {value for kind, value in keys if kind == 'slug'}
+        names = {value for kind, value in keys if kind == 'name'}
+        products = {}
+        # Newest first, so with several same-named products the oldest one ends up matched
+        existing = Product.objects.filter(vendor=self.vendor).filter(Q(slug__in=slugs) | Q(name__in=names))
+        for product in existing.order_by('-created_at'):
+            if product.slug in slugs:
+                products[('slug', product.slug)] = product
+            if product.name in names:
+                products[('name', product.name)] = product
+        return products
+
+    def import_batch(self, batch):
+        batch = self.resolve_categories(batch)
+        if not batch:
+            return
+
+        counts = self.result.counts()
+        try:
+            with transaction.atomic():
+                products, changed, moved_from = self.save_products(batch)
+                if changed:
+                    enqueue_content_refresh(changed)
+                changed |= self.save_variations(batch, products)
+                if changed:
+                    transaction.on_commit(lambda: refresh_read_models(
+                        list(changed), vendor_ids=[self.vendor.id], category_ids=list(moved_from),
+                    ))
+        except IntegrityError as e:
+            # e.g. a slug taken by a concurrent save; the batch is rolled back as a whole
+            self.result.restore_counts(counts)
+            for line, _ in batch:
+                self.result.error(line, f'Not imported, its batch failed: {e}')
+
+    def apply_product_fields(self, product, row):
+        """Copy a row's product columns onto `product`. Returns the fields that changed."""
+        # Blank cells leave the stored (or earlier row's) value alone
+        values = {}
+        if row['description']:
+            values['description'] = row['description']
+        if row['category']:
+            values['category_id'] = self.categories[row['category']]
+        if row['status']:
+            values['status'] = row['status']
+        return assign(product, values)
+
+    def save_products(self, batch):
+        """
+        Create/update the products of a batch. Returns ({product key: Product}, ids of the
+        products created or changed, ids of the categories updated products were moved out of).
+        """
+        keys = {self.product_key(row) for _, row in batch}
+        products = self.load_products(keys)
+        now = timezone.now()
+
+        new_products = {}
+        updated = {}
+        fields = {'updated_at'}
+        for _, row in batch:
+            key = self.product_key(row)
+            product = products.get(key)
+            if product is not None:
+                # Only changed rows and columns are written: re-importing a file is mostly reads
+                if changed := self.apply_product_fields(product, row):
+                    product.updated_at = now
+                    updated[product.pk] = product
+                    fields |= changed
+            elif key in new_products:
+                self.apply_product_fields(new_products[key], row)
+            else:
+                new_products[key] = Product(
+                    name=row['product'],
+                    slug=row['slug'] or None,
+                    description=row['description'],
+                    category_id=self.categories.get(row['category']),
+                    vendor=self.vendor,
+                    # Same as CreateProductView: new products start hidden
+                    status=row['status'] or 'hidden',
+                )
+
+        if new_products:
+            # Explicit slugs may already be taken by another vendor's product
+            needs_slug = [product for product in new_products.values() if not product.slug]
+            taken = set(Product.objects.filter(
+                slug__in=[product.slug for product in new_products.values() if product.slug]
+            ).values_list('slug', flat=True))
+            needs_slug += [product for product in new_products.values() if product.slug in taken]
+            reserved = {product.slug for product in new_products.values() if product.slug and product.slug not in taken}
+            for product, slug in zip(needs_slug, allocate_slugs(Product, [product.name for product in needs_slug], reserved=reserved)):
+                product.slug = slug
+            Product.objects.bulk_create(new_products.values())
+            self.result.created_products += len(new_products)
+
+        if updated:
+            Product.objects.bulk_update(updated.values(), sorted(fields), batch_size=UPDATE_BATCH_SIZE)
+            self.result.updated_products += len(updated)
+
+        # bulk_update() doesn't refresh the dirty-field snapshot: still the stored categories
+        moved_from = {
+            product.loaded_value('category') for product in updated.values() if product.has_changed('category')
+        } - {None}
+        products.update(new_products)
+        return products, {product.id for product in new_products.values()} | updated.keys(), moved_from
+
+    def save_variations(self, batch, products):
+        """Create/update the variations of a batch. Returns the ids of the products they belong to."""
+        product_ids = {product.id for product in products.values()}
+        existing = {
+            (variation.product_id, variation.name): variation
+            for variation in ProductVariation.objects.filter(
+                product_id__in=product_ids, name__in={row['variation'] for _, row in batch}
+            )
+        }
+        has_default = set(ProductVariation.objects.filter(
+            product_id__in=product_ids, is_default=True
+        ).values_list('product_id', flat=True))
+        now = timezone.now()
+
+        new_variations = {}
+        updated = {}
+        fields = {'updated_at'}
+        for _, row in batch:
+            product = products[self.product_key(row)]
+            key = (product.id, row['variation'])
+            variation = existing.get(key) or new_variations.get(key)
+            if variation is None:
+                variation = ProductVariation(product=product, name=row['variation'])
+                new_variations[key] = variation
+
+            values = {
+                'unit_price': row['unit_price'],
+                'stock': row['stock'],
+                'unit_measurement': row['unit_measurement'],
+                'is_available': row['is_available'],
+            }
+            if row['is_default'] and product.id not in has_default:
+                values['is_default'] = True
+                has_default.add(product.id)
+            changed = assign(variation, values)
+            if changed and key in existing:
+                variation.updated_at = now
+                updated[variation.pk] = variation
+                fields |= changed
+
+        # Like CreateVariationView: a product's first variation becomes its default
+        for (product_id, _), variation in new_variations.items():
+            if product_id not in has_default:
+                variation.is_default = True
+                has_default.add(product_id)
+
+        if new_variations:
+            ProductVariation.objects.bulk_create(new_variations.values())
+            self.result.created_variations += len(new_variations)
+        if updated:
+            ProductVariation.objects.bulk_update(updated.values(), sorted(fields), batch_size=UPDATE_BATCH_SIZE)
+            self.result.updated_variations += len(updated)
+        return {product_id for product_id, _ in new_variations} | {variation.product_id for variation in updated.values()}
+
+
+def import_catalog(vendor, stream, format='csv', batch_size=1000):
+    """Import a CSV/JSONL catalog for `vendor`. Returns an ImportResult."""
+    return CatalogImporter(vendor, batch_size=batch_size).run(stream, format)
@@ -0,0 +1,178 @@
+"""
+Batch stock/price updates of existing variations.
+
+Farmers adjust stock daily after harvest. Instead of one UpdateVariationView
+PATCH per variation, a batch of changes (JSON, or a CSV/JSONL "diff" where a
+blank cell means "leave as is") is validated as a whole and applied in one
+transaction with bulk_update. Derived status is recomputed in the same pass:
+a variation without stock goes out of stock and unavailable, a restocked one is
+published again, and a product moves to out_of_stock when none of its
+variations can be sold any more (and back when one can).
+"""
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from .importer import UPDATE_BATCH_SIZE, RowError, assign, bool_value, price_value, read_rows, stock_value, text_value
+from .models import Product, ProductVariation
+from .signals import refresh_read_models
+from .tasks import enqueue_content_refresh
+import uuid
+
+MAX_CHANGES = 10000
+
+
+class InventoryUpdateError(ValueError):
+    """The batch was rejected; `errors` lists [{'line': ..., 'error': ...}]."""
+
+    def __init__(self, errors):
+        super().__init__(f'{len(errors)} invalid change(s).')
+        self.errors = errors
+
+
+def clean_change(row):
+    """Validate one change; unchanged columns are None. Raises RowError."""
+    variation_id = text_value(row, 'variation_id')
+    if variation_id:
+        try:
+            variation_id = uuid.UUID(variation_id)
+        except ValueError:
+            raise RowError('variation_id is not a valid id.')
+
+    change = {
+        'variation_id': variation_id or None,
+        'slug': text_value(row, 'slug'),
+        'variation': text_value(row, 'variation'),
+        'stock': stock_value(row, 'stock'),
+        'unit_price': price_value(row, 'unit_price', required=False),
+        'is_available': bool_value(row, 'is_available', None),
+    }
+    if not change['variation_id'] and not (change['slug'] and change['variation']):
+        raise RowError('Either variation_id, or slug and variation, are required.')
+    if change['stock'] is None and change['unit_price'] is None and change['is_available'] is None:
+        raise RowError('Nothing to change: give stock, unit_price or is_available.')
+    return change
+
+
+def read_changes(stream, format):
+    """[(line, row)] of a CSV/JSONL diff; unreadable lines raise InventoryUpdateError."""
+    rows, errors = [], []
+    for line, row, error in read_rows(stream, format):
+        if error:
+            errors.append({'line': line, 'error': error})
+        else:
+            rows.append((line, row))
+    if errors:
+        raise InventoryUpdateError(errors)
+    return rows
+
+
+def change_key(change):
+    return change['variation_id'] or (change['slug'], change['variation'])
+
+
+def load_variations(vendor, changes):
+    """{change key: ProductVariation} for the changes, limited to the vendor's own products."""
+    ids = {change['variation_id'] for change in changes if change['variation_id']}
+    named = {(change['slug'], change['variation']) for change in changes if not change['variation_id']}
+
+    lookup = Q(id__in=ids)
+    if named:
+        lookup |= Q(product__slug__in={slug for slug, _ in named}, name__in={name for _, name in named})
+    # Locked until the batch commits, so a checkout can't decrement stock in between
+    rows = ProductVariation.objects.select_for_update(of=('self',)).filter(product__vendor=vendor).filter(lookup)
+    variations = {}
+    for variation in rows.annotate(product_slug=F('product__slug')):
+        if variation.id in ids:
+            variations[variation.id] = variation
+        if (variation.product_slug, variation.name) in named:
+            variations[(variation.product_slug, variation.name)] = variation
+    return variations
+
+
+def apply_change(variation, change):
+    """Copy a change onto `variation` and recompute its status. Returns the fields that changed."""
+    values = {field: change[field] for field in ('stock', 'unit_price', 'is_available') if change[field] is not None}
+    stock = values.get('stock', variation.stock)
+    if stock == 0:
+        # Same as checkout when it sells the last unit
+        values['is_available'] = False
+        if variation.status == 'published':
+            values['status'] = 'out_of_stock'
+    elif variation.status == 'out_of_stock':
+        values['status'] = 'published'
+        values.setdefault('is_available', True)
+    return assign(variation, values)
+
+
+def update_product_statuses(product_ids, now):
+    """Flip published <-> out_of_stock for products by whether any variation can be sold. Returns the flipped ids."""
+    sellable = set(ProductVariation.objects.filter(
+        product_id__in=product_ids, stock__gt=0, is_available=True
+    ).values_list('product_id', flat=True).distinct())
+
+    sold_out = Product.objects.filter(id__in=set(product_ids) - sellable, status='published')
+    restocked = Product.objects.filter(id__in=sellable, status='out_of_stock')
+    flipped = set(sold_out.values_list('id', flat=True)) | set(restocked.values_list('id', flat=True))
+    sold_out.update(status='out_of_stock', updated_at=now)
+    restocked.update(status='published', updated_at=now)
+    return flipped
+
+
+def apply_inventory_updates(vendor, rows):
+    """
+    Apply [(line, row)] stock/price changes to the vendor's variations, all or
+    nothing. Returns a summary dict; raises InventoryUpdateError listing every
+    invalid row, in which case nothing was changed.
+    """
+    if len(rows) > MAX_CHANGES:
+        raise InventoryUpdateError([{'line': None, 'error': f'At most {MAX_CHANGES} changes per request.'}])
+
+    changes, errors = [], []
+    for line, row in rows:
+        try:
+            changes.append((line, clean_change(row)))
+        except RowError as e:
+            errors.append({'line': line, 'error': str(e)})
+
+    with transaction.atomic():
+        variations = load_variations(vendor, [change for _, change in changes])
+        seen = {}
+        for line, change in changes:
+            variation = variations.get(change_key(change))
+            if variation is None:
+                errors.append({'line': line, 'error': 'Unknown variation.'})
+            elif variation.id in seen:
+                errors.append({'line': line, 'error': f'Same variation as line {seen[variation.id]}.'})
+            else:
+                seen[variation.id] = line
+        if errors:
+            raise InventoryUpdateError(sorted(errors, key=lambda error: error['line'] or 0))
+
+        now = timezone.now()
+        updated, fields = [], {'updated_at'}
+        for _, change in changes:
+            variation = variations[change_key(change)]
+            if changed := apply_change(variation, change):
+                variation.updated_at = now
+                updated.append(variation)
+                fields |= changed
+
+        product_ids = {variation.product_id for variation in updated}
+        flipped = set()
+        if updated:
+            ProductVariation.objects.bulk_update(updated, sorted(fields), batch_size=UPDATE_BATCH_SIZE)
+            flipped = update_product_statuses(product_ids, now)
+            # bulk_update() and update() send no signals. Prices and stock aren't in
+            # the search documents; the product status, when it flipped, is
+            transaction.on_commit(lambda: refresh_read_models(list(product_ids), search=False, vendor_ids=[vendor.id]))
+        if flipped:
+            # Out-of-stock products drop out of the similar-product lists, restocked ones return
+            enqueue_content_refresh(flipped)
+            transaction.on_commit(lambda: refresh_read_models(list(flipped), vendor_ids=[vendor.id]))
+
+    return {
+        'updated': len(updated),
+        'unchanged': len(changes) - len(updated),
+        'out_of_stock': sum(1 for variation in updated if variation.status == 'out_of_stock'),
+        'products_changed_status': len(flipped),
+    }
@@ -0,0 +1,116 @@
+from collections import defaultdict
+from users.models import Address
+from .models import Product, ProductImage, ProductListingSummary, ProductVariation, ReviewAggregate
+
+SUMMARY_UPDATE_FIELDS = [
+    'name', 'slug', 'status', 'vendor', 'vendor_name', 'category', 'category_name',
+    'min_price', 'unit_measurement', 'default_variation', 'main_image_id', 'main_image',
+    'main_image_renditions', 'in_stock', 'average_rating', 'review_count', 'vendor_region', 'vendor_province', 'created_at', 'updated_at',
+]
+
+
+def build_listing_summaries(products):
+    """
+    Build (unsaved) ProductListingSummary rows for the given products.
+    Variations, main images and vendor addresses are fetched for the whole batch at once.
+    """
+    products = list(products)
+    product_ids = [product.id for product in products]
+
+    variations = defaultdict(list)
+    for variation in ProductVariation.objects.filter(product_id__in=product_ids).order_by('created_at'):
+        variations[variation.product_id].append(variation)
+
+    main_images = {}
+    for image in ProductImage.objects.filter(product_id__in=product_ids, is_main=True).order_by('uploaded_at'):
+        main_images.setdefault(image.product_id, image)
+
+    ratings = {aggregate.product_id: aggregate for aggregate in ReviewAggregate.objects.filter(product_id__in=product_ids)}
+
+    # Listings show the vendor's first address, same as ProductSerializer.get_vendor_address
+    addresses = {}
+    vendor_ids = {product.vendor_id for product in products}
+    for address in Address.objects.filter(user_id__in=vendor_ids).order_by('id'):
+        addresses.setdefault(address.user_id, address)
+
+    summaries = []
+    for product in products:
+        product_variations = variations[product.id]
+        available = [v for v in product_variations if v.is_available]
+        cheapest = min(available, key=lambda v: v.unit_price) if available else None
+        default = next((v for v in product_variations if v.is_default), None)
+        main_image = main_images.get(product.id)
+        address = addresses.get(product.vendor_id)
+        rating = ratings.get(product.id)
+
+        summaries.append(ProductListingSummary(
+            product_id=product.id,
+            name=product.name,
+            slug=product.slug,
+            status=product.status,
+            vendor_id=product.vendor_id,
+            vendor_name=product.vendor.username if product.vendor else '',
+            category_id=product.category_id,
+            category_name=product.category.name if product.category else None,
+            min_price=cheapest.unit_price if cheapest else None,
+            # The unit of the price shown next to it (Product.unit_measurement takes the lowest id instead)
+            unit_measurement=cheapest.unit_measurement if cheapest else None,
+            default_variation=default.id if default else None,
+            main_image_id=main_image.id if main_image else None,
+            main_image=main_image.image if main_image else None,
+            main_image_renditions=main_image.renditions if main_image else {},
+            in_stock=product.is_available and any(v.stock > 0 for v in available),
+            average_rating=rating.average if rating else None,
+            review_count=rating.review_count if rating else 0,
+            vendor_region=address.region if address else None,
+            vendor_province=address.province if address else None,
+            created_at=product.created_at,
+        ))
+    return summaries
+
+
+def save_listing_summaries(summaries):
+    """Upsert summary rows in a single statement."""
+    if not summaries:
+        return
+    ProductListingSummary.objects.bulk_create(
+        summaries,
+        update_conflicts=True,
+        unique_fields=['product'],
+        update_fields=SUMMARY_UPDATE_FIELDS,
+    )
+
+
+def refresh_listing_summaries(product_ids):
+    """Recompute the listing summaries of the given products."""
+    product_ids = set(product_ids)
+    if not product_ids:
+        return
+    products = Product.objects.select_related('vendor', 'category').filter(id__in=product_ids)
+    summaries = build_listing_summaries(products)
+    save_listing_summaries(summaries)
+
+    # Products deleted in the meantime lose their summary through the cascade,
+    # this only catches rows whose product vanished mid-refresh
+    missing = product_ids - {summary.product_id for summary in summaries}
+    if missing:
+        ProductListingSummary.objects.filter(product_id__in=missing).delete()
+
+
+def rebuild_listing_summaries(batch_size=500):
+    """Rebuild every summary row, streaming the catalog in batches. Returns the row count."""
+    total = 0
+    batch = []
+    products = Product.objects.select_related('vendor', 'category').order_by('created_at', 'id')
+    for product in products.iterator(chunk_size=batch_size):
+        batch.append(product)
+        if len(batch) >= batch_size:
+            save_listing_summaries(build_listing_summaries(batch))
+            total += len(batch)
+            batch = []
+    if batch:
+        save_listing_summaries(build_listing_summaries(batch))
+        total += len(batch)
+
+    ProductListingSummary.objects.exclude(product__in=Product.objects.all()).delete()
+    return total
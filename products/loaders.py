@@ -0,0 +1,82 @@
+"""
+Batch functions of the catalog serializers (see core/loaders.py).
+"""
+from collections import defaultdict
+from django.db.models import Prefetch
+from core.loaders import batch_loader
+from users.models import Address, CustomUser
+from .models import Category, ProductImage, ProductVariation, ReviewAggregate, VariationImage
+from .reviews import review_aggregate
+
+
+def group_by(rows, attribute):
+    groups = defaultdict(list)
+    for row in rows:
+        groups[getattr(row, attribute)].append(row)
+    return groups
+
+
+@batch_loader('users')
+def load_users(ids):
+    # Addresses along, ordered like `addresses.first()`: vendor cards show the first one
+    addresses = Prefetch('addresses', queryset=Address.objects.order_by('id'))
+    users = CustomUser.objects.filter(id__in=ids).select_related('profile').prefetch_related(addresses)
+    return {user.id: user for user in users}
+
+
+@batch_loader('categories')
+def load_categories(ids):
+    return Category.objects.in_bulk(ids)
+
+
+@batch_loader('product_images')
+def load_product_images(product_ids):
+    return group_by(ProductImage.objects.filter(product_id__in=product_ids).order_by('uploaded_at', 'id'), 'product_id')
+
+
+@batch_loader('product_variations')
+def load_product_variations(product_ids):
+    return group_by(ProductVariation.objects.filter(product_id__in=product_ids).order_by('created_at', 'id'), 'product_id')
+
+
+@batch_loader('variation_images')
+def load_variation_images(variation_ids):
+    return group_by(VariationImage.objects.filter(variation_id__in=variation_ids).order_by('uploaded_at', 'id'), 'variation_id')
+
+
+@batch_loader('review_aggregates')
+def load_review_aggregates(product_ids):
+    return ReviewAggregate.objects.in_bulk(product_ids)
+
+
+def collect_products(loaders, products, fields):
+    """
+    Queue what ProductSerializer's `fields` read for `products`, reusing relations
+    already selected or prefetched. Relations of pruned fields aren't loaded.
+    """
+    for product in products:
+        # Not the vendor: the users batch brings their addresses along
+        if product.category_id and type(product).category.is_cached(product):
+            loaders['categories'].prime(product.category_id, product.category)
+        if type(product).review_aggregate.is_cached(product):
+            loaders['review_aggregates'].prime(product.id, review_aggregate(product))
+        prefetched = getattr(product, '_prefetched_objects_cache', {})
+        if 'images' in prefetched:
+            loaders['product_images'].prime(product.id, list(prefetched['images']))
+        if 'variations' in prefetched:
+            loaders['product_variations'].prime(product.id, list(prefetched['variations']))
+    product_ids = [product.id for product in products]
+    if fields & {'vendor_name', 'vendor_address'}:
+        loaders['users'].collect(product.vendor_id for product in products)
+    if 'category_name' in fields:
+        loaders['categories'].collect(product.category_id for product in products)
+    if fields & {'images', 'thumbnail'}:
+        loaders['product_images'].collect(product_ids)
+    if 'rating' in fields:
+        loaders['review_aggregates'].collect(product_ids)
+    if fields & {'variations', 'min_price'}:
+        loaders['product_variations'].collect(product_ids)
+
+
+def collect_variations(loaders, variations):
+    loaders['variation_images'].collect(variation.id for variation in variations)
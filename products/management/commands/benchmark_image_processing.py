@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+from PIL import Image
+from products.images import get_process_pool, process_upload_source, process_uploads, process_workers
+import io, time
+
+
+def sample_jpeg(width, height, seed):
+    # Noise compresses (and decodes) like a photo, a flat colour would not
+    noise = [Image.effect_noise((width, height), 40 + seed * 3 + band) for band in range(3)]
+    output = io.BytesIO()
+    Image.merge('RGB', noise).save(output, format='JPEG', quality=90)
+    return output.getvalue()
+
+
+class Command(BaseCommand):
+    help = 'Compare serial vs process-pool wall time of the upload image processing.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--counts', type=int, nargs='+', default=[1, 4, 10])
+        parser.add_argument('--width', type=int, default=4000)
+        parser.add_argument('--height', type=int, default=3000)
+        parser.add_argument('--repeat', type=int, default=3, help='Best of N runs.')
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'Generating {max(options["counts"])} {options["width"]}x{options["height"]} JPEGs...')
+        images = [sample_jpeg(options['width'], options['height'], seed) for seed in range(max(options['counts']))]
+
+        # Start the workers outside the measurements, as a long-running job worker would have them
+        list(get_process_pool().map(abs, range(process_workers())))
+
+        self.stdout.write(f'Pool workers: {process_workers()}')
+        self.stdout.write(f'{"images":>6} {"serial":>10} {"pooled":>10} {"speedup":>8}')
+        for count in options['counts']:
+            batch = images[:count]
+            serial = self.best_of(options['repeat'], lambda: [process_upload_source(data) for data in batch])
+            pooled = self.best_of(options['repeat'], lambda: process_uploads(batch))
+            self.stdout.write(f'{count:>6} {serial:>9.2f}s {pooled:>9.2f}s {serial / pooled:>7.2f}x')
+
+    def best_of(self, repeat, func):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - start)
+        return min(timings)
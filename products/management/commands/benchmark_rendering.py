@@ -0,0 +1,56 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.text import compress_string
+from rest_framework.renderers import JSONRenderer
+from core.middleware import brotli
+from core.renderers import ORJSONRenderer
+from products.models import Product
+from products.serializers import ProductSerializer
+import time
+
+
+class Command(BaseCommand):
+    help = 'Compare DRF vs orjson rendering time of a product list, and its gzip/brotli sizes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=100, help='Products per response.')
+        parser.add_argument('--repeat', type=int, default=5, help='Best of N runs.')
+
+    def handle(self, *args, **options):
+        products = list(Product.objects.order_by('-created_at')[:options['products']])
+        if not products:
+            raise CommandError('No products to render.')
+        # Serialize once: only the rendering is measured
+        data = ProductSerializer(products, many=True, context={}).data
+        # Several pages' worth when the catalog is small
+        data = (list(data) * (options['products'] // len(products) + 1))[:options['products']]
+        self.stdout.write(f'Rendering {len(data)} products...')
+
+        drf, fast = JSONRenderer(), ORJSONRenderer()
+        if drf.render(data) != fast.render(data):
+            raise CommandError('orjson output differs from DRF.')
+        drf_time = self.best_of(options['repeat'], lambda: drf.render(data))
+        fast_time = self.best_of(options['repeat'], lambda: fast.render(data))
+        self.stdout.write(f'{"renderer":>8} {"time":>10}')
+        self.stdout.write(f'{"drf":>8} {drf_time * 1000:>8.2f}ms')
+        self.stdout.write(f'{"orjson":>8} {fast_time * 1000:>8.2f}ms {drf_time / fast_time:>7.2f}x')
+
+        body = fast.render(data)
+        self.stdout.write(f'{"encoding":>8} {"bytes":>10} {"time":>10}')
+        self.stdout.write(f'{"identity":>8} {len(body):>10}')
+        gzip_time = self.best_of(options['repeat'], lambda: compress_string(body))
+        self.stdout.write(f'{"gzip":>8} {len(compress_string(body)):>10} {gzip_time * 1000:>8.2f}ms')
+        if brotli is None:
+            self.stdout.write(f'{"br":>8} {"(brotli not installed)":>10}')
+        else:
+            quality = settings.BROTLI_QUALITY
+            br_time = self.best_of(options['repeat'], lambda: brotli.compress(body, quality=quality))
+            self.stdout.write(f'{"br":>8} {len(brotli.compress(body, quality=quality)):>10} {br_time * 1000:>8.2f}ms')
+
+    def best_of(self, repeat, func):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - start)
+        return min(timings)
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from products.recommendations import rebuild_co_purchase_neighbors
+from products.similarity import rebuild_content_neighbors
+import time
+
+BUILDERS = {
+    'co_purchase': rebuild_co_purchase_neighbors,
+    'content': rebuild_content_neighbors,
+}
+
+
+class Command(BaseCommand):
+    help = ('Recompute every product\'s "frequently bought together" (co_purchase) and similar-product '
+            '(content) neighbors. Checkouts and product saves refresh the products they touch; run this '
+            'periodically to settle the rest.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--kind', choices=sorted(BUILDERS), help='Only rebuild this kind of neighbors.')
+
+    def handle(self, *args, **options):
+        for kind, build in BUILDERS.items():
+            if options['kind'] and kind != options['kind']:
+                continue
+            start = time.perf_counter()
+            rows = build()
+            self.stdout.write(self.style.SUCCESS(f'Stored {rows} {kind} neighbors in {time.perf_counter() - start:.1f}s.'))
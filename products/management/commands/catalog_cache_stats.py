@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from products import views  # noqa: F401  (registers the cached endpoints)
+from products.cache import CACHED_ENDPOINTS, get_stats
+
+
+class Command(BaseCommand):
+    # With the default per-process memory cache the counters live in each worker, so this
+    # is only meaningful against a shared backend (REDIS_URL)
+    help = 'Show hit/miss counters of the catalog response cache.'
+
+    def handle(self, *args, **options):
+        for endpoint, counts in get_stats(CACHED_ENDPOINTS).items():
+            total = counts['hit'] + counts['miss']
+            ratio = counts['hit'] / total * 100 if total else 0
+            self.stdout.write(f"{endpoint}: {counts['hit']} hits, {counts['miss']} misses ({ratio:.1f}% hit rate)")
@@ -0,0 +1,35 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from products.gc import Checkpoint, GarbageCollector
+
+
+class Command(BaseCommand):
+    help = 'Delete stored image files and ImageBlob rows that nothing references any more.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would be reclaimed.')
+        parser.add_argument('--chunk-size', type=int, default=500)
+        parser.add_argument('--min-age-hours', type=float, default=24,
+                            help='Keep anything newer than this, it may belong to an upload in progress.')
+        parser.add_argument('--checkpoint', help='Progress file; an interrupted run resumes from it.')
+        parser.add_argument('--source', action='append', dest='sources',
+                            help='Only collect this source (blobs, uploads:products, bucket:products...). Repeatable.')
+
+    def handle(self, *args, **options):
+        collector = GarbageCollector(
+            cutoff=timezone.now() - timedelta(hours=options['min_age_hours']),
+            dry_run=options['dry_run'],
+            chunk_size=options['chunk_size'],
+            checkpoint=Checkpoint(options['checkpoint']),
+            log=self.stdout.write,
+        )
+        report = collector.run(options['sources'])
+
+        verb = 'reclaimable' if options['dry_run'] else 'deleted'
+        total = 0
+        for label, totals in report.items():
+            total += totals['bytes']
+            self.stdout.write(f'{label}: {totals["scanned"]} scanned, {totals["orphans"]} orphaned, '
+                              f'{totals["bytes"] / 2 ** 20:.1f} MB {verb}')
+        self.stdout.write(self.style.SUCCESS(f'Total {verb}: {total / 2 ** 20:.1f} MB'))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from jobs.queue import enqueue
+from products.tasks import IMAGE_MODELS
+
+
+class Command(BaseCommand):
+    help = 'Queue rendition generation for processed images that have none yet.'
+
+    def handle(self, *args, **options):
+        total = 0
+        for kind, model in IMAGE_MODELS.items():
+            missing = model.objects.filter(processing_state='ready', renditions={}).exclude(image__isnull=True)
+            for image_id in missing.values_list('id', flat=True).iterator():
+                enqueue('products.generate_renditions', {'model': kind, 'id': str(image_id)})
+                total += 1
+        self.stdout.write(self.style.SUCCESS(f'Queued {total} images. Run `manage.py run_jobs` to process them.'))
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+from users.models import CustomUser
+from products.importer import IMPORT_COLUMNS, detect_format, import_catalog
+import time
+
+
+class Command(BaseCommand):
+    help = ('Import products and variations for a vendor from a CSV or JSONL file, one row per variation. '
+            f'Columns: {", ".join(IMPORT_COLUMNS)}.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--vendor', required=True, help='Email of the farmer the products belong to.')
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help='Defaults to the file extension.')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        vendor = CustomUser.objects.filter(email=options['vendor']).first()
+        if vendor is None or vendor.role != 'farmer':
+            raise CommandError(f'No farmer with email {options["vendor"]}.')
+
+        format = options['format'] or detect_format(options['path'])
+        start = time.perf_counter()
+        with open(options['path'], 'rb') as file:
+            result = import_catalog(vendor, file, format=format, batch_size=options['batch_size'])
+        elapsed = time.perf_counter() - start
+
+        for error in result.errors:
+            self.stderr.write(f'Line {error["line"]}: {error["error"]}')
+        self.stdout.write(self.style.SUCCESS(
+            f'{result.rows} rows in {elapsed:.1f}s ({result.rows / max(elapsed, 1e-6):.0f} rows/s): '
+            f'{result.created_products} products created, {result.updated_products} updated, '
+            f'{result.created_variations} variations created, {result.updated_variations} updated, '
+            f'{len(result.errors)} errors.'
+        ))
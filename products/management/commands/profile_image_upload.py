@@ -0,0 +1,38 @@
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from products.images import decoded_size, inspect_image, make_renditions, open_bounded, reencode_image
+import resource
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class Command(BaseCommand):
+    help = 'Process one image like the upload job does and report its size and the peak RSS it took.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--max-edge', type=int, help='Override IMAGE_MAX_EDGE.')
+
+    def handle(self, *args, **options):
+        baseline = peak_rss_mb()
+        try:
+            with open(options['path'], 'rb') as file:
+                header = inspect_image(file)
+                self.stdout.write(f'Header: {header.format} {header.mode} {header.width}x{header.height} '
+                                  f'({decoded_size(header) / 2 ** 20:.1f} MB if decoded in full)')
+                file.seek(0)
+                image = open_bounded(file, options['max_edge'])
+        except ValidationError as e:
+            raise CommandError(e.messages[0])
+
+        self.stdout.write(f'Decoded: {image.mode} {image.width}x{image.height} ({decoded_size(image) / 2 ** 20:.1f} MB)')
+        original, content_type, _ = reencode_image(image)
+        self.stdout.write(f'Original: {content_type}, {original.getbuffer().nbytes / 1024:.0f} KB')
+        for width, rendition in make_renditions(image).items():
+            self.stdout.write(f'Rendition {width}w: {rendition.getbuffer().nbytes / 1024:.0f} KB')
+
+        peak = peak_rss_mb()
+        self.stdout.write(self.style.SUCCESS(f'Peak RSS: {peak:.1f} MB ({peak - baseline:+.1f} MB over the idle process)'))
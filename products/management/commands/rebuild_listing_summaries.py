@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from products.listing import rebuild_listing_summaries
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the denormalized product listing summary table from scratch.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        total = rebuild_listing_summaries(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {total} listing summaries.'))
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from products.reviews import rebuild_review_aggregates
+
+
+class Command(BaseCommand):
+    help = 'Recompute every product\'s review aggregate (count, average, star histogram) from its reviews.'
+
+    def handle(self, *args, **options):
+        total = rebuild_review_aggregates()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt review aggregates of {total} products.'))
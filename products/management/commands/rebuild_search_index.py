@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from products.search import rebuild_search_documents
+
+
+class Command(BaseCommand):
+    help = 'Re-index every product in the full-text search index.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        total = rebuild_search_documents(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Indexed {total} products.'))
@@ -0,0 +1,19 @@
+# Generated by Django 5.1.7 on 2026-10-18 08:42
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0011_remove_productimage_image_url_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['status', 'created_at', 'id'], name='product_status_created_idx'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.1.7 on 2026-10-18 08:43
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0012_product_status_created_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductListingSummary',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='listing_summary', serialize=False, to='products.product')),
+                ('name', models.CharField(max_length=200)),
+                ('slug', models.SlugField(blank=True, null=True)),
+                ('status', models.CharField(choices=[('published', 'Published'), ('out_of_stock', 'Out of Stock'), ('hidden', 'Hidden'), ('pending_approval', 'Pending Approval'), ('deleted', 'Deleted'), ('rejected', 'Rejected')], default='published', max_length=20)),
+                ('vendor_name', models.TextField(blank=True)),
+                ('category_name', models.CharField(blank=True, max_length=100, null=True)),
+                ('min_price', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('unit_measurement', models.CharField(blank=True, max_length=100, null=True)),
+                ('default_variation', models.UUIDField(blank=True, null=True)),
+                ('main_image_id', models.UUIDField(blank=True, null=True)),
+                ('main_image', models.URLField(blank=True, null=True)),
+                ('created_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('category', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='products.category')),
+                ('vendor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'created_at', 'product'], name='summary_status_created_idx')],
+            },
+        ),
+    ]
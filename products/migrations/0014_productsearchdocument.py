@@ -0,0 +1,105 @@
+# Generated by Django 5.1.7 on 2026-10-18 08:44
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+TABLE = 'products_productsearchdocument'
+FTS_TABLE = 'products_productsearch_fts'
+
+POSTGRES_FORWARD = [
+    f"""
+    ALTER TABLE {TABLE} ADD COLUMN search_vector tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('simple', coalesce(name, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(category_name, '')), 'B') ||
+        setweight(to_tsvector('simple', coalesce(variation_names, '')), 'B') ||
+        setweight(to_tsvector('simple', coalesce(description, '')), 'C')
+    ) STORED
+    """,
+    f'CREATE INDEX products_search_vector_gin ON {TABLE} USING GIN (search_vector)',
+]
+POSTGRES_REVERSE = [
+    'DROP INDEX IF EXISTS products_search_vector_gin',
+    f'ALTER TABLE {TABLE} DROP COLUMN IF EXISTS search_vector',
+]
+
+# External-content FTS5 table: the triggers keep it in step with the document table
+SQLITE_FORWARD = [
+    f"""
+    CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(
+        name, category_name, variation_names, description,
+        content='{TABLE}', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )
+    """,
+    f"""
+    CREATE TRIGGER {FTS_TABLE}_ai AFTER INSERT ON {TABLE} BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, name, category_name, variation_names, description)
+        VALUES (new.id, new.name, new.category_name, new.variation_names, new.description);
+    END
+    """,
+    f"""
+    CREATE TRIGGER {FTS_TABLE}_ad AFTER DELETE ON {TABLE} BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, category_name, variation_names, description)
+        VALUES ('delete', old.id, old.name, old.category_name, old.variation_names, old.description);
+    END
+    """,
+    f"""
+    CREATE TRIGGER {FTS_TABLE}_au AFTER UPDATE ON {TABLE} BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, category_name, variation_names, description)
+        VALUES ('delete', old.id, old.name, old.category_name, old.variation_names, old.description);
+        INSERT INTO {FTS_TABLE}(rowid, name, category_name, variation_names, description)
+        VALUES (new.id, new.name, new.category_name, new.variation_names, new.description);
+    END
+    """,
+]
+SQLITE_REVERSE = [
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_ai',
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_ad',
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_au',
+    f'DROP TABLE IF EXISTS {FTS_TABLE}',
+]
+
+
+def run_statements(schema_editor, statements):
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        run_statements(schema_editor, POSTGRES_FORWARD)
+    elif vendor == 'sqlite':
+        run_statements(schema_editor, SQLITE_FORWARD)
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        run_statements(schema_editor, POSTGRES_REVERSE)
+    elif vendor == 'sqlite':
+        run_statements(schema_editor, SQLITE_REVERSE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0013_productlistingsummary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductSearchDocument',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('status', models.CharField(choices=[('published', 'Published'), ('out_of_stock', 'Out of Stock'), ('hidden', 'Hidden'), ('pending_approval', 'Pending Approval'), ('deleted', 'Deleted'), ('rejected', 'Rejected')], default='published', max_length=20)),
+                ('name', models.CharField(max_length=200)),
+                ('category_name', models.CharField(blank=True, max_length=100)),
+                ('variation_names', models.TextField(blank=True)),
+                ('description', models.TextField(blank=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='search_document', to='products.product')),
+            ],
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
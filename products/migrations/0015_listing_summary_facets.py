@@ -0,0 +1,28 @@
+# Generated by Django 5.1.7 on 2026-10-18 08:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0014_productsearchdocument'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productlistingsummary',
+            name='in_stock',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='productlistingsummary',
+            name='vendor_province',
+            field=models.CharField(blank=True, max_length=50, null=True),
+        ),
+        migrations.AddField(
+            model_name='productlistingsummary',
+            name='vendor_region',
+            field=models.CharField(blank=True, max_length=50, null=True),
+        ),
+    ]
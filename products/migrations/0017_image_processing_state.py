@@ -0,0 +1,30 @@
+# Generated by Django 5.1.7 on 2026-10-18 08:50
+
+from django.db import migrations, models
+
+
+def mark_existing_ready(apps, schema_editor):
+    # Rows created before the job queue were uploaded synchronously
+    for model_name in ('ProductImage', 'VariationImage'):
+        apps.get_model('products', model_name).objects.update(processing_state='ready')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0016_image_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productimage',
+            name='processing_state',
+            field=models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing'), ('ready', 'Ready'), ('failed', 'Failed')], default='pending', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='variationimage',
+            name='processing_state',
+            field=models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing'), ('ready', 'Ready'), ('failed', 'Failed')], default='pending', max_length=20),
+        ),
+        migrations.RunPython(mark_existing_ready, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.1.7 on 2026-10-18 08:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0017_image_processing_state'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productimage',
+            name='renditions',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='productlistingsummary',
+            name='main_image_renditions',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='variationimage',
+            name='renditions',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
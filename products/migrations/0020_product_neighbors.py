@@ -0,0 +1,30 @@
+# Generated by Django 5.1.7 on 2026-10-18 09:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0019_image_blobs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductNeighbor',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('kind', models.CharField(choices=[('co_purchase', 'Frequently bought together')], max_length=20)),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('score', models.FloatField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('neighbor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='neighbor_of', to='products.product')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='neighbors', to='products.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['product', 'kind', 'rank'], name='neighbor_product_rank_idx')],
+                'unique_together': {('product', 'kind', 'neighbor')},
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-18 09:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0020_product_neighbors'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='productneighbor',
+            name='kind',
+            field=models.CharField(choices=[('co_purchase', 'Frequently bought together'), ('content', 'Similar name, description or category')], max_length=20),
+        ),
+    ]
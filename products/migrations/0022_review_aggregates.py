@@ -0,0 +1,64 @@
+# Generated by Django 5.1.7 on 2026-10-18 09:26
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+
+
+def aggregate_existing_reviews(apps, schema_editor):
+    # Same as products.reviews.rebuild_review_aggregates, against the historical models
+    Review = apps.get_model('products', 'Review')
+    ReviewAggregate = apps.get_model('products', 'ReviewAggregate')
+    ProductListingSummary = apps.get_model('products', 'ProductListingSummary')
+    now = timezone.now()
+    rows = Review.objects.values('product_id').annotate(
+        review_count=Count('id'), rating_total=Sum('rating'),
+        **{f'stars_{star}': Count('id', filter=Q(rating=star)) for star in range(1, 6)},
+    )
+    for row in rows:
+        ReviewAggregate.objects.create(updated_at=now, **row)
+        ProductListingSummary.objects.filter(product_id=row['product_id']).update(
+            average_rating=round(row['rating_total'] / row['review_count'], 2), review_count=row['review_count'],
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0021_content_neighbors'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReviewAggregate',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='review_aggregate', serialize=False, to='products.product')),
+                ('review_count', models.PositiveIntegerField(default=0)),
+                ('rating_total', models.PositiveIntegerField(default=0)),
+                ('stars_1', models.PositiveIntegerField(default=0)),
+                ('stars_2', models.PositiveIntegerField(default=0)),
+                ('stars_3', models.PositiveIntegerField(default=0)),
+                ('stars_4', models.PositiveIntegerField(default=0)),
+                ('stars_5', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='productlistingsummary',
+            name='average_rating',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=3, null=True),
+        ),
+        migrations.AddField(
+            model_name='productlistingsummary',
+            name='review_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['product', 'created_at', 'id'], name='review_product_created_idx'),
+        ),
+        migrations.RunPython(aggregate_existing_reviews, migrations.RunPython.noop),
+    ]
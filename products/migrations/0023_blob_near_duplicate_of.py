@@ -0,0 +1,19 @@
+# Generated by Django 5.1.7 on 2026-10-18 09:44
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0022_review_aggregates'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='imageblob',
+            name='near_duplicate_of',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='near_duplicates', to='products.imageblob'),
+        ),
+    ]
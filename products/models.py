@@ -1,33 +1,13 @@
 from django.db import models
 from django.core.validators import MinValueValidator, MaxValueValidator
 from users.models import CustomUser
-from django.utils.text import slugify
+from core.mixins import DirtyFieldsMixin
 from django.core.exceptions import ValidationError
-from supabase import create_client, Client
-from django.conf import settings
-from dotenv import load_dotenv
-from datetime import datetime
-import uuid, os
+from .images import pick_rendition
+from .slugs import save_with_unique_slug
+import uuid
 
-load_dotenv()
-
-def generate_unique_slug(instance, field_value, slug_field_name='slug'):
-    """
-    Generate a unique slug for a model instance.
-    """
-    base_slug = slugify(field_value)
-    slug = base_slug
-    ModelClass = instance.__class__
-    n = 1
-
-    # Check for duplicates
-    while ModelClass.objects.filter(**{slug_field_name: slug}).exclude(pk=instance.pk).exists():
-        slug = f"{base_slug}-{n}"
-        n += 1
-
-    return slug
-
-class Category(models.Model):
+class Category(DirtyFieldsMixin, models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     name = models.CharField(max_length=100, unique=True)
     slug = models.SlugField(unique=True, blank=True,null=True)
@@ -38,21 +18,16 @@ class Category(models.Model):
     class Meta:
         verbose_name_plural = 'Categories'
         
-    def name_has_changed(self):
-        if not self.pk:
-            return True
-        original = Category.objects.filter(pk=self.pk).first()
-        return original and original.name != self.name
-        
     def save(self, *args, **kwargs):
-        if not self.slug or self.name_has_changed():
-            self.slug = generate_unique_slug(self, self.name)
-        super().save(*args, **kwargs)
+        if not self.slug or self.has_changed('name'):
+            save_with_unique_slug(self, self.name, super().save, *args, **kwargs)
+        else:
+            super().save(*args, **kwargs)
 
     def __str__(self):
         return self.name
 
-class Product(models.Model):
+class Product(DirtyFieldsMixin, models.Model):
     STATUS_CHOICES = (
         ('published', 'Published'),
         ('out_of_stock', 'Out of Stock'),
@@ -78,19 +53,21 @@ class Product(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # Backs the keyset pagination on the product list endpoints
+            models.Index(fields=['status', 'created_at', 'id'], name='product_status_created_idx'),
+        ]
+
     def __str__(self):
         return self.name
 
-    def name_has_changed(self):
-        if not self.pk:
-            return True
-        original = Product.objects.filter(pk=self.pk).first()
-        return original and original.name != self.name
 
     def save(self, *args, **kwargs):
-        if not self.slug or self.name_has_changed():
-            self.slug = generate_unique_slug(self, self.name)
-        super().save(*args, **kwargs)
+        if not self.slug or self.has_changed('name'):
+            save_with_unique_slug(self, self.name, super().save, *args, **kwargs)
+        else:
+            super().save(*args, **kwargs)
 
     @property
     def min_price(self):
@@ -135,113 +112,227 @@ class ProductVariation(models.Model):
         # You can add custom save logic if needed (e.g., logging, updating related products)
         super().save(*args, **kwargs)
 
-class ProductImage(models.Model):
+class ImageBlob(models.Model):
+    """
+    A processed image in storage, addressed by the SHA-256 of the uploaded file.
+    Product and variation images of the same photo (same bytes) share one blob
+    instead of being re-encoded and re-uploaded. A blob with the same perceptual
+    hash as an older one is linked to it, not merged.
+    """
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
-    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='images')
-    image_file = models.ImageField(upload_to='products/', null=True, blank=True)  # Store the image locally or in a different bucket
-    image = models.URLField(null=True, blank=True)  # Store URL of the image from Supabase
+    sha256 = models.CharField(max_length=64, unique=True)  # Of the raw upload
+    dhash = models.CharField(max_length=16, db_index=True)  # Perceptual hash, for near-duplicates
+    image = models.URLField()  # Public URL of the processed original
+    renditions = models.JSONField(default=dict, blank=True)  # {width: URL} of the resized WebP copies
+    content_type = models.CharField(max_length=50)
+    width = models.PositiveIntegerField()
+    height = models.PositiveIntegerField()
+    size = models.PositiveIntegerField()  # Bytes stored, original and renditions together
+    near_duplicate_of = models.ForeignKey(
+        'self', on_delete=models.SET_NULL, null=True, blank=True, related_name='near_duplicates'
+    )  # An older blob with the same perceptual hash and aspect ratio
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f'{self.sha256[:12]} ({self.width}x{self.height})'
+
+class UploadedImage(models.Model):
+    """
+    Fields shared by ProductImage and VariationImage. The raw upload is kept in
+    `image_file`; the products.process_image job points the row at its ImageBlob
+    and copies the blob's `image` (the original) and `renditions` (resized WebP copies).
+    """
+    PROCESSING_STATES = (
+        ('pending', 'Pending'),
+        ('processing', 'Processing'),
+        ('ready', 'Ready'),
+        ('failed', 'Failed'),
+    )
+    STORAGE_BUCKET = None
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    blob = models.ForeignKey(ImageBlob, on_delete=models.PROTECT, null=True, blank=True, related_name='%(class)ss')
+    image = models.URLField(null=True, blank=True)  # Public URL of the processed original
     uploaded_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
     is_main = models.BooleanField(default=False)
+    processing_state = models.CharField(max_length=20, choices=PROCESSING_STATES, default='pending')  # Set by the background upload job
+    renditions = models.JSONField(default=dict, blank=True)  # {width: URL} of the resized WebP copies
 
-    def save(self, *args, **kwargs):
-        if self.is_main:
-            existing_main = ProductImage.objects.filter(product=self.product, is_main=True).exclude(id=self.id).first()
-            if existing_main:
-                raise ValidationError(f'Product {self.product.name} already has a main image (ID: {existing_main.id}). Unset it before setting a new main image.')
-        
-        super().save(*args, **kwargs)
-        
-        # Now upload the image to Supabase
-        self.upload_image_to_supabase()
+    class Meta:
+        abstract = True
 
-    def upload_image_to_supabase(self):
+    def upload_source(self):
+        """The raw upload as a local path, or its bytes when the storage has no paths."""
         if not self.image_file:
             raise ValidationError("No image provided.")
-        
-        # Load environment variables for Supabase
-        supabase_url = os.getenv("SUPABASE_URL")
-        supabase_key = os.getenv("SUPABASE_API_KEY")
+        try:
+            return self.image_file.path
+        except NotImplementedError:
+            with self.image_file.open('rb') as file:
+                return file.read()
 
-        # Create a Supabase client
-        supabase: Client = create_client(supabase_url, supabase_key)
+    def use_blob(self, blob):
+        self.blob = blob
+        self.image = blob.image
+        self.renditions = blob.renditions
+        self.processing_state = 'ready'
 
-        # Open the image file and upload it to Supabase Storage
-        bucket_name = "products"
-        file_path = self.image_file.path  # Path to the image file
+    def rendition_url(self, width):
+        """URL of the rendition best suited to `width` px, or the original."""
+        return pick_rendition(self.renditions, width, fallback=self.image)
 
-        # Generate unique filename
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        unique_id = str(uuid.uuid4())[:8]
-        unique_filename = f'products/{self.id}_{timestamp}_{unique_id}.jpg'
+class ProductImage(UploadedImage):
+    STORAGE_BUCKET = 'products'
 
-        with open(file_path, "rb") as file:
-            response = supabase.storage.from_(bucket_name).upload(unique_filename, file)
-
-        # Get the URL of the uploaded image from Supabase
-        self.image = f'{supabase_url}/storage/v1/object/public/{bucket_name}/{unique_filename}'
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='images')
+    image_file = models.ImageField(upload_to='products/', null=True, blank=True)  # Store the image locally or in a different bucket
 
-        # Save the URL in the model
-        super().save()
+    def save(self, *args, **kwargs):
+        if self.is_main:
+            existing_main = ProductImage.objects.filter(product=self.product, is_main=True).exclude(id=self.id).first()
+            if existing_main:
+                raise ValidationError(f'Product {self.product.name} already has a main image (ID: {existing_main.id}). Unset it before setting a new main image.')
+        
+        # The upload to Supabase happens in the background (products.process_image job)
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f'Image for {self.product.name}{" (Main)" if self.is_main else ""}'
 
-class VariationImage(models.Model):
-    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+class VariationImage(UploadedImage):
+    STORAGE_BUCKET = 'variations'
+
     variation = models.ForeignKey(ProductVariation, on_delete=models.CASCADE, related_name='images')
     image_file = models.ImageField(upload_to='variations/', null=True, blank=True)  # Store the image locally or in a different bucket
-    image = models.URLField(null=True, blank=True)  # Full URL to access the image
-    uploaded_at = models.DateTimeField(auto_now_add=True)
-    is_main = models.BooleanField(default=False)
 
-    def save(self, *args, **kwargs):
-        # Save the image first to make sure it's available
-        super().save(*args, **kwargs)
+    def __str__(self):
+        return f'Image for {self.variation}{" (Main)" if self.is_main else ""}'
 
-        # Now, upload the image to Supabase
-        if self.image_file:
-            self.upload_image_to_supabase()
+class Review(DirtyFieldsMixin, models.Model):
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='reviews')
+    buyer = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='product_reviews')
+    rating = models.IntegerField(validators=[MinValueValidator(1), MaxValueValidator(5)])
+    comment = models.TextField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
-    def upload_image_to_supabase(self):
-        if not self.image_file:
-            raise ValidationError("No image provided.")
-        
-        # Load environment variables for Supabase
-        supabase_url = os.getenv("SUPABASE_URL")
-        supabase_key = os.getenv("SUPABASE_API_KEY")
+    class Meta:
+        indexes = [
+            # A product's reviews, newest first, keyset paginated
+            models.Index(fields=['product', 'created_at', 'id'], name='review_product_created_idx'),
+        ]
+
+    def __str__(self):
+        return f'Review by {self.buyer.username} for {self.product.name}' 
+
+class ReviewAggregate(models.Model):
+    """
+    Rating summary of a product's reviews, maintained incrementally from Review
+    saves and deletes (see products/reviews.py) instead of aggregating them per request.
+    """
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True, related_name='review_aggregate')
+    review_count = models.PositiveIntegerField(default=0)
+    rating_total = models.PositiveIntegerField(default=0)
+    # Histogram: number of reviews with 1, 2, ... 5 stars
+    stars_1 = models.PositiveIntegerField(default=0)
+    stars_2 = models.PositiveIntegerField(default=0)
+    stars_3 = models.PositiveIntegerField(default=0)
+    stars_4 = models.PositiveIntegerField(default=0)
+    stars_5 = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    @property
+    def average(self):
+        return round(self.rating_total / self.review_count, 2) if self.review_count else None
 
-        # Create a Supabase client
-        supabase: Client = create_client(supabase_url, supabase_key)
+    @property
+    def histogram(self):
+        return {str(star): getattr(self, f'stars_{star}') for star in range(1, 6)}
 
-        # Open the image file and upload it to Supabase Storage
-        bucket_name = "variations"
-        file_path = self.image_file.path  # Path to the image file
+    def __str__(self):
+        return f'Review aggregate for {self.product_id}'
 
-        # Generate unique filename
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        unique_id = str(uuid.uuid4())[:8]
-        unique_filename = f'variations/{self.id}_{timestamp}_{unique_id}.jpg'
+class ProductListingSummary(models.Model):
+    """
+    Denormalized read model for product listings, one row per product.
+    Kept in sync from Product/ProductVariation/ProductImage saves and deletes
+    (see products/signals.py) so listing endpoints need a single query.
+    """
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True, related_name='listing_summary')
+    name = models.CharField(max_length=200)
+    slug = models.SlugField(blank=True, null=True)
+    status = models.CharField(max_length=20, choices=Product.STATUS_CHOICES, default='published')
+    vendor = models.ForeignKey('users.CustomUser', on_delete=models.CASCADE, related_name='+')
+    vendor_name = models.TextField(blank=True)
+    category = models.ForeignKey(Category, on_delete=models.SET_NULL, related_name='+', blank=True, null=True)
+    category_name = models.CharField(max_length=100, blank=True, null=True)
+    min_price = models.DecimalField(max_digits=10, decimal_places=2, blank=True, null=True)
+    unit_measurement = models.CharField(max_length=100, blank=True, null=True)
+    default_variation = models.UUIDField(blank=True, null=True)
+    main_image_id = models.UUIDField(blank=True, null=True)
+    main_image = models.URLField(blank=True, null=True)
+    main_image_renditions = models.JSONField(default=dict, blank=True)
+    in_stock = models.BooleanField(default=False)  # Any available variation with stock left
+    average_rating = models.DecimalField(max_digits=3, decimal_places=2, blank=True, null=True)  # From ReviewAggregate
+    review_count = models.PositiveIntegerField(default=0)
+    vendor_region = models.CharField(max_length=50, blank=True, null=True)  # From the vendor's first address
+    vendor_province = models.CharField(max_length=50, blank=True, null=True)
+    created_at = models.DateTimeField()  # Copied from the product so listings can be keyset paginated
+    updated_at = models.DateTimeField(auto_now=True)
 
-        with open(file_path, "rb") as file:
-            response = supabase.storage.from_(bucket_name).upload(unique_filename, file)
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'created_at', 'product'], name='summary_status_created_idx'),
+        ]
 
-        # Get the URL of the uploaded image from Supabase
-        self.image = f'{supabase_url}/storage/v1/object/public/{bucket_name}/{unique_filename}'
+    def __str__(self):
+        return f'Listing summary for {self.name}'
 
-        # Save the URL in the model
-        super().save()
+class ProductSearchDocument(models.Model):
+    """
+    Flattened text of a product for full-text search. The actual index lives
+    next to this table and is backend specific (a generated tsvector column
+    with a GIN index on Postgres, an FTS5 table kept in sync by triggers on
+    SQLite); see products/search.py and migration 0014.
+    """
+    id = models.BigAutoField(primary_key=True)
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, related_name='search_document')
+    status = models.CharField(max_length=20, choices=Product.STATUS_CHOICES, default='published')
+    name = models.CharField(max_length=200)
+    category_name = models.CharField(max_length=100, blank=True)
+    variation_names = models.TextField(blank=True)
+    description = models.TextField(blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
-        return f'Image for {self.variation}{" (Main)" if self.is_main else ""}'
+        return f'Search document for {self.name}'
 
-class Review(models.Model):
-    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
-    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='reviews')
-    buyer = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='product_reviews')
-    rating = models.IntegerField(validators=[MinValueValidator(1), MaxValueValidator(5)])
-    comment = models.TextField()
-    created_at = models.DateTimeField(auto_now_add=True)
+class ProductNeighbor(models.Model):
+    """
+    Precomputed recommendation: `neighbor` is one of the top-k products related
+    to `product`, by `kind` (see products/recommendations.py). Rebuilt in bulk,
+    never edited by hand.
+    """
+    KIND_CHOICES = (
+        ('co_purchase', 'Frequently bought together'),
+        ('content', 'Similar name, description or category'),
+    )
+
+    id = models.BigAutoField(primary_key=True)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='neighbors')
+    neighbor = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='neighbor_of')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    rank = models.PositiveSmallIntegerField()  # 0 = strongest
+    score = models.FloatField()
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        unique_together = ('product', 'kind', 'neighbor')
+        indexes = [
+            models.Index(fields=['product', 'kind', 'rank'], name='neighbor_product_rank_idx'),
+        ]
+
     def __str__(self):
-        return f'Review by {self.buyer.username} for {self.product.name}' 
+        return f'{self.product_id} -> {self.neighbor_id} ({self.kind} #{self.rank})'
@@ -0,0 +1,125 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime
+from django.conf import settings
+from django.db.models import Q
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+import json, uuid
+
+
+class KeysetPagination(BasePagination):
+    """
+    Opaque-cursor pagination keyed on the indexed (created_at, pk) pair.
+
+    Rows are returned newest first. The cursor stores the boundary row's
+    (created_at, pk) and the paging direction, so rows inserted while a client
+    is paging never shift or duplicate the pages it has not fetched yet.
+    A malformed cursor is a 400.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def __init__(self):
+        self.page_size = getattr(settings, 'PRODUCT_PAGE_SIZE', 20)
+        self.max_page_size = getattr(settings, 'PRODUCT_MAX_PAGE_SIZE', 100)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        created_at, pk, reverse = self.decode_cursor(request)
+
+        if created_at is None:
+            # First page
+            queryset = queryset.order_by('-created_at', '-pk')
+        elif reverse:
+            # Walking back towards newer rows: read ascending and flip afterwards
+            queryset = queryset.filter(
+                Q(created_at__gt=created_at) | Q(created_at=created_at, pk__gt=pk)
+            ).order_by('created_at', 'pk')
+        else:
+            queryset = queryset.filter(
+                Q(created_at__lt=created_at) | Q(created_at=created_at, pk__lt=pk)
+            ).order_by('-created_at', '-pk')
+
+        # Fetch one extra row to know whether there is another page in this direction
+        rows = list(queryset[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+
+        self.page = rows
+        if reverse:
+            self.has_next = created_at is not None
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = created_at is not None
+        return rows
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if size <= 0:
+            return self.page_size
+        return min(size, self.max_page_size)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, None, False
+        try:
+            padded = encoded + '=' * (-len(encoded) % 4)
+            payload = json.loads(urlsafe_b64decode(padded.encode('ascii')).decode('utf-8'))
+            created_at = datetime.fromisoformat(payload['c'])
+            pk = uuid.UUID(payload['i'])
+            reverse = bool(payload.get('r', False))
+        except (TypeError, ValueError, KeyError, UnicodeDecodeError):
+            raise ValidationError({self.cursor_query_param: [self.invalid_cursor_message]})
+        return created_at, pk, reverse
+
+    def encode_cursor(self, row, reverse):
+        payload = {'c': row.created_at.isoformat(), 'i': str(row.pk)}
+        if reverse:
+            payload['r'] = 1
+        encoded = urlsafe_b64encode(json.dumps(payload, separators=(',', ':')).encode('utf-8'))
+        return encoded.decode('ascii').rstrip('=')
+
+    def get_link(self, row, reverse):
+        url = self.request.build_absolute_uri()
+        url = replace_query_param(url, self.page_size_query_param, self.page_size)
+        if row is None:
+            return remove_query_param(url, self.cursor_query_param)
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(row, reverse))
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.get_link(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return self.get_link(None, reverse=True)
+        return self.get_link(self.page[0], reverse=True)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+
+class ReviewPagination(KeysetPagination):
+    """Keyset pagination of a product's reviews."""
+
+    def __init__(self):
+        self.page_size = getattr(settings, 'REVIEW_PAGE_SIZE', 10)
+        self.max_page_size = getattr(settings, 'REVIEW_MAX_PAGE_SIZE', 50)
@@ -0,0 +1,201 @@
+"""
+"Frequently bought together" recommendations from co-purchases.
+
+A basket is what one buyer ordered on one day (checkout splits a cart into
+one order per vendor, so single orders would never pair products of
+different farms). Two products co-occur when they share a basket; their
+score is the cosine of their basket sets, count(A and B) / sqrt(count(A) *
+count(B)), so staples bought by everyone don't top every list. The sparse
+co-occurrence matrix is built with vectorized NumPy (every basket's item
+pairs at once, then a unique-count over encoded pairs) and the top-k
+neighbors of each product are stored as ProductNeighbor rows, which the
+detail view reads with one query.
+
+`rebuild_co_purchase_neighbors()` recomputes everything (`manage.py
+build_recommendations`). After a checkout only the products in the buyer's
+baskets of that day are recomputed (`refresh_co_purchase_neighbors`, run as
+a job). Scores of other products drift slightly as counts grow until the
+next full rebuild.
+"""
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, Value, When
+from django.db.models.functions import TruncDate
+from orders.models import Order, OrderItem
+from .cache import bump_versions, product_version_key
+from .models import ProductListingSummary, ProductNeighbor
+import numpy as np
+
+CO_PURCHASE = 'co_purchase'
+CONTENT = 'content'  # products/similarity.py
+DEFAULT_NEIGHBORS = 10
+DEFAULT_MAX_BASKET_SIZE = 50
+
+
+def neighbor_count():
+    return getattr(settings, 'RECOMMENDATION_NEIGHBORS', DEFAULT_NEIGHBORS)
+
+
+def max_basket_size():
+    return getattr(settings, 'RECOMMENDATION_MAX_BASKET_SIZE', DEFAULT_MAX_BASKET_SIZE)
+
+
+def basket_items(items):
+    """Distinct (buyer, day, product) of order items, cancelled orders left out."""
+    return items.exclude(order__status='cancelled').annotate(day=TruncDate('order__created_at')).values_list(
+        'order__buyer_id', 'day', 'variation__product_id'
+    ).distinct()
+
+
+def encode_items(triples):
+    """(basket index array, product index array, product ids by index) of (buyer, day, product) triples."""
+    baskets, products = {}, {}
+    basket_index, product_index = [], []
+    for buyer, day, product in triples:
+        basket_index.append(baskets.setdefault((buyer, day), len(baskets)))
+        product_index.append(products.setdefault(product, len(products)))
+    return np.array(basket_index, dtype=np.int64), np.array(product_index, dtype=np.int64), list(products)
+
+
+def co_occurrence(baskets, products, n_products, max_size):
+    """
+    Sparse product x product co-occurrence matrix of distinct (basket, product) items,
+    as COO arrays (row, column, count) over ordered pairs of different products.
+    """
+    order = np.argsort(baskets, kind='stable')
+    baskets, products = baskets[order], products[order]
+    starts = np.flatnonzero(np.r_[True, baskets[1:] != baskets[:-1]]) if len(baskets) else np.array([], dtype=np.int64)
+    sizes = np.diff(np.r_[starts, len(baskets)])
+
+    # Pairs grow with the square of a basket's size; wholesale-sized baskets say little anyway
+    kept = sizes <= max_size
+    starts, sizes = starts[kept], sizes[kept]
+    item_start = np.repeat(starts, sizes)
+    item_size = np.repeat(sizes, sizes)
+    items = item_start + (np.arange(item_size.size) - np.repeat(np.cumsum(sizes) - sizes, sizes))
+
+    # Every item paired with every item of its basket, itself included
+    left = np.repeat(products[items], item_size)
+    pair_start = np.repeat(item_start, item_size)
+    offsets = np.arange(left.size) - np.repeat(np.cumsum(item_size) - item_size, item_size)
+    right = products[pair_start + offsets]
+
+    distinct = left != right
+    keys, counts = np.unique(left[distinct] * n_products + right[distinct], return_counts=True)
+    return keys // n_products, keys % n_products, counts
+
+
+def top_neighbors(rows, columns, scores, k, tiebreak):
+    """
+    Indices into the COO arrays of each row's k best entries, and their ranks.
+    Equal scores are ordered by `tiebreak[column]`.
+    """
+    order = np.lexsort((tiebreak[columns], -scores, rows))
+    rows = rows[order]
+    starts = np.flatnonzero(np.r_[True, rows[1:] != rows[:-1]]) if len(rows) else np.array([], dtype=np.int64)
+    ranks = np.arange(rows.size) - np.repeat(starts, np.diff(np.r_[starts, rows.size]))
+    best = ranks < k
+    return order[best], ranks[best]
+
+
+def compute_neighbors(triples, basket_counts=None, targets=None):
+    """
+    {product id: [(neighbor id, score), ...]} best first, from (buyer, day, product) triples.
+    `basket_counts` ({product id: baskets}) replaces the counts of the triples when they
+    are only a slice of all baskets; `targets` limits the products whose lists are built.
+    """
+    baskets, products, product_ids = encode_items(triples)
+    if not product_ids:
+        return {}
+    rows, columns, counts = co_occurrence(baskets, products, len(product_ids), max_basket_size())
+
+    if basket_counts is None:
+        frequency = np.bincount(products, minlength=len(product_ids))
+    else:
+        frequency = np.array([basket_counts.get(product_id, 1) for product_id in product_ids])
+    scores = counts / np.sqrt(frequency[rows] * frequency[columns])
+
+    if targets is not None:
+        wanted = np.isin(rows, [index for index, product_id in enumerate(product_ids) if product_id in targets])
+        rows, columns, scores = rows[wanted], columns[wanted], scores[wanted]
+
+    neighbors = {}
+    # Ties go by product id, so a refresh and a full rebuild agree
+    tiebreak = np.argsort(np.argsort(np.array([str(product_id) for product_id in product_ids])))
+    best, ranks = top_neighbors(rows, columns, scores, neighbor_count(), tiebreak)
+    for row, column, score in zip(rows[best].tolist(), columns[best].tolist(), scores[best].tolist()):
+        neighbors.setdefault(product_ids[row], []).append((product_ids[column], score))
+    return neighbors
+
+
+def save_neighbors(neighbors, product_ids=None, kind=CO_PURCHASE):
+    """Replace the `kind` rows of `product_ids` (all of them when None) with `neighbors`."""
+    rows = [
+        ProductNeighbor(product_id=product_id, neighbor_id=neighbor_id, kind=kind, rank=rank, score=score)
+        for product_id, ranked in neighbors.items()
+        for rank, (neighbor_id, score) in enumerate(ranked)
+    ]
+    stale = ProductNeighbor.objects.filter(kind=kind)
+    if product_ids is not None:
+        stale = stale.filter(product_id__in=product_ids)
+    with transaction.atomic():
+        changed = set(stale.values_list('product_id', flat=True)) | neighbors.keys()
+        stale.delete()
+        ProductNeighbor.objects.bulk_create(rows, batch_size=1000)
+        # Detail responses embed the neighbors
+        transaction.on_commit(lambda: bump_versions([product_version_key(product_id) for product_id in changed]))
+    return len(rows)
+
+
+def rebuild_co_purchase_neighbors():
+    """Recompute every product's co-purchase neighbors. Returns the number of rows stored."""
+    return save_neighbors(compute_neighbors(basket_items(OrderItem.objects.all())))
+
+
+def refresh_co_purchase_neighbors(order_ids):
+    """Recompute the neighbors of the products in the baskets the given (new) orders belong to."""
+    keys = set(Order.objects.filter(id__in=order_ids).annotate(day=TruncDate('created_at')).values_list('buyer_id', 'day'))
+    if not keys:
+        return 0
+    buyers, days = {buyer for buyer, _ in keys}, {day for _, day in keys}
+    in_baskets = OrderItem.objects.filter(order__buyer__in=buyers, order__created_at__date__in=days)
+    targets = {product for buyer, day, product in basket_items(in_baskets) if (buyer, day) in keys}
+
+    # Every basket a target product is in, then all the items of those baskets
+    baskets = {(buyer, day) for buyer, day, _ in basket_items(OrderItem.objects.filter(variation__product__in=targets))}
+    buyers, days = {buyer for buyer, _ in baskets}, {day for _, day in baskets}
+    in_baskets = OrderItem.objects.filter(order__buyer__in=buyers, order__created_at__date__in=days)
+    triples = [triple for triple in basket_items(in_baskets) if triple[:2] in baskets]
+
+    # Scores need the partners' basket counts over all orders, not just these baskets
+    involved = {product for _, _, product in triples}
+    basket_counts = {}
+    for _, _, product in basket_items(OrderItem.objects.filter(variation__product__in=involved)):
+        basket_counts[product] = basket_counts.get(product, 0) + 1
+
+    return save_neighbors(compute_neighbors(triples, basket_counts, targets), targets)
+
+
+def related_products(product, limit=4):
+    """
+    Listing summaries shown next to a product: its co-purchase neighbors, best first,
+    then its content neighbors for products with little or no order history, and
+    the product's category when both run short.
+    """
+    # Both kinds in one query; a product can be in both lists, hence the extra rows
+    neighbors = ProductListingSummary.objects.filter(
+        product__neighbor_of__product=product, product__neighbor_of__kind__in=[CO_PURCHASE, CONTENT],
+        status='published',
+    ).annotate(
+        kind_order=Case(When(product__neighbor_of__kind=CO_PURCHASE, then=Value(0)), default=Value(1)),
+    ).order_by('kind_order', 'product__neighbor_of__rank')[:limit * 2]
+    related, seen = [], set()
+    for summary in neighbors:
+        if summary.product_id not in seen and len(related) < limit:
+            seen.add(summary.product_id)
+            related.append(summary)
+    if len(related) < limit:
+        related += ProductListingSummary.objects.filter(category=product.category).exclude(
+            product__in=[product.id, *(summary.product_id for summary in related)]
+        )[:limit - len(related)]
+    return related
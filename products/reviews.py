@@ -0,0 +1,83 @@
+"""
+Per-product review aggregates: count, rating total and 1-5 star histogram.
+
+Rather than aggregating a product's reviews on every request (or shipping them
+all to the client to average), each Review save or delete applies its +1/-1 to
+the product's ReviewAggregate row with one F() UPDATE, in the same transaction
+as the review itself. Concurrent reviews of a product can't lose updates since
+the database does the arithmetic. The average and count are copied onto the
+listing summary so listings show ratings without another query per product.
+
+`bulk_create()` and `QuerySet.update()` of reviews send no signals; rebuild
+with `manage.py rebuild_review_aggregates` after such writes.
+"""
+from collections import Counter, defaultdict
+from django.db.models import Count, F, Q, Sum
+from django.utils import timezone
+from .models import ProductListingSummary, Review, ReviewAggregate
+
+STARS = range(1, 6)
+
+
+def adjust_review_aggregates(changes):
+    """Apply [(product id, rating, +1 or -1)] review changes to the aggregates."""
+    deltas = defaultdict(Counter)
+    for product_id, rating, delta in changes:
+        deltas[product_id][rating] += delta
+
+    now = timezone.now()
+    for product_id, stars in deltas.items():
+        stars = {rating: delta for rating, delta in stars.items() if delta}
+        if not stars:
+            # A rating changed back and forth, or a review moved within the same product
+            continue
+        if any(delta > 0 for delta in stars.values()):
+            # Only additions create the row: a delete may be part of the product's own cascade
+            ReviewAggregate.objects.bulk_create([ReviewAggregate(product_id=product_id)], ignore_conflicts=True)
+        ReviewAggregate.objects.filter(product_id=product_id).update(
+            review_count=F('review_count') + sum(stars.values()),
+            rating_total=F('rating_total') + sum(rating * delta for rating, delta in stars.items()),
+            updated_at=now,
+            **{f'stars_{rating}': F(f'stars_{rating}') + delta for rating, delta in stars.items()},
+        )
+        aggregate = ReviewAggregate.objects.filter(product_id=product_id).first()
+        if aggregate is not None:
+            ProductListingSummary.objects.filter(product_id=product_id).update(
+                average_rating=aggregate.average, review_count=aggregate.review_count, updated_at=now,
+            )
+
+
+def rebuild_review_aggregates():
+    """Recompute every product's aggregate from its reviews. Returns the number of products with reviews."""
+    rows = Review.objects.values('product_id').annotate(
+        review_count=Count('id'), rating_total=Sum('rating'),
+        **{f'stars_{star}': Count('id', filter=Q(rating=star)) for star in STARS},
+    )
+    aggregates = [ReviewAggregate(**row) for row in rows]
+    fields = ['review_count', 'rating_total', *(f'stars_{star}' for star in STARS), 'updated_at']
+    now = timezone.now()
+    for aggregate in aggregates:
+        aggregate.updated_at = now
+    ReviewAggregate.objects.bulk_create(
+        aggregates, update_conflicts=True, unique_fields=['product'], update_fields=fields, batch_size=500,
+    )
+    ReviewAggregate.objects.exclude(product__in=Review.objects.values('product_id')).delete()
+
+    summaries = {aggregate.product_id: aggregate for aggregate in aggregates}
+    updated = []
+    for summary in ProductListingSummary.objects.only('product_id', 'average_rating', 'review_count'):
+        aggregate = summaries.get(summary.product_id)
+        summary.average_rating = aggregate.average if aggregate else None
+        summary.review_count = aggregate.review_count if aggregate else 0
+        updated.append(summary)
+    ProductListingSummary.objects.bulk_update(updated, ['average_rating', 'review_count'], batch_size=500)
+    return len(aggregates)
+
+
+def review_aggregate(product):
+    """The product's aggregate, or an empty (unsaved) one for a product without reviews."""
+    try:
+        return product.review_aggregate
+    except ReviewAggregate.DoesNotExist:
+        return ReviewAggregate(product=product)
+
@@ -0,0 +1,151 @@
+from collections import defaultdict
+from django.db import connection
+from django.db.models import Q
+from .models import Product, ProductSearchDocument, ProductVariation
+import re, uuid
+
+DOCUMENT_UPDATE_FIELDS = ['status', 'name', 'category_name', 'variation_names', 'description', 'updated_at']
+MAX_QUERY_TERMS = 8
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def build_search_documents(products):
+    """Build (unsaved) search documents for the given products, one query for all variations."""
+    products = list(products)
+    variation_names = defaultdict(list)
+    rows = ProductVariation.objects.filter(product_id__in=[p.id for p in products]).values_list('product_id', 'name')
+    for product_id, name in rows:
+        variation_names[product_id].append(name)
+
+    return [
+        ProductSearchDocument(
+            product_id=product.id,
+            status=product.status,
+            name=product.name,
+            category_name=product.category.name if product.category else '',
+            variation_names=' '.join(variation_names[product.id]),
+            description=product.description or '',
+        )
+        for product in products
+    ]
+
+
+def save_search_documents(documents):
+    if not documents:
+        return
+    ProductSearchDocument.objects.bulk_create(
+        documents,
+        update_conflicts=True,
+        unique_fields=['product'],
+        update_fields=DOCUMENT_UPDATE_FIELDS,
+    )
+
+
+def refresh_search_documents(product_ids):
+    """Re-index only the given products."""
+    product_ids = set(product_ids)
+    if not product_ids:
+        return
+    products = Product.objects.select_related('category').filter(id__in=product_ids)
+    save_search_documents(build_search_documents(products))
+
+
+def rebuild_search_documents(batch_size=500):
+    """Re-index the whole catalog in batches. Returns the number of documents written."""
+    total = 0
+    batch = []
+    for product in Product.objects.select_related('category').order_by('id').iterator(chunk_size=batch_size):
+        batch.append(product)
+        if len(batch) >= batch_size:
+            save_search_documents(build_search_documents(batch))
+            total += len(batch)
+            batch = []
+    if batch:
+        save_search_documents(build_search_documents(batch))
+        total += len(batch)
+    get_backend().optimize()
+    return total
+
+
+def tokenize(query):
+    return TOKEN_RE.findall(query.lower())[:MAX_QUERY_TERMS]
+
+
+class PostgresSearchBackend:
+    """Ranks against the generated `search_vector` column (GIN indexed)."""
+
+    def search(self, terms, status, limit, offset):
+        # Every term must match, each as a prefix so results update while the user types
+        tsquery = ' & '.join(f'{term}:*' for term in terms)
+        sql = f"""
+            SELECT product_id, ts_rank(search_vector, query) AS rank
+            FROM {ProductSearchDocument._meta.db_table}, to_tsquery('simple', %s) query
+            WHERE search_vector @@ query AND status = %s
+            ORDER BY rank DESC, product_id
+            LIMIT %s OFFSET %s
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [tsquery, status, limit, offset])
+            return cursor.fetchall()
+
+    def optimize(self):
+        pass
+
+
+class SqliteSearchBackend:
+    """Ranks with bm25() over the FTS5 table kept in sync by triggers."""
+    fts_table = 'products_productsearch_fts'
+
+    def search(self, terms, status, limit, offset):
+        match = ' '.join(f'"{term}"*' for term in terms)
+        # bm25 weights follow the column order: name, category_name, variation_names, description
+        sql = f"""
+            SELECT d.product_id, -bm25({self.fts_table}, 10.0, 4.0, 4.0, 1.0) AS rank
+            FROM {self.fts_table} f
+            JOIN {ProductSearchDocument._meta.db_table} d ON d.id = f.rowid
+            WHERE {self.fts_table} MATCH %s AND d.status = %s
+            ORDER BY rank DESC, d.product_id
+            LIMIT %s OFFSET %s
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [match, status, limit, offset])
+            return cursor.fetchall()
+
+    def optimize(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {self.fts_table}({self.fts_table}) VALUES ('optimize')")
+
+
+class FallbackSearchBackend:
+    """Unindexed substring match for databases without a full-text backend."""
+
+    def search(self, terms, status, limit, offset):
+        documents = ProductSearchDocument.objects.filter(status=status)
+        for term in terms:
+            documents = documents.filter(
+                Q(name__icontains=term) | Q(category_name__icontains=term)
+                | Q(variation_names__icontains=term) | Q(description__icontains=term)
+            )
+        rows = documents.order_by('name', 'product_id').values_list('product_id', flat=True)[offset:offset + limit]
+        return [(product_id, 0.0) for product_id in rows]
+
+    def optimize(self):
+        pass
+
+
+def get_backend():
+    if connection.vendor == 'postgresql':
+        return PostgresSearchBackend()
+    if connection.vendor == 'sqlite':
+        return SqliteSearchBackend()
+    return FallbackSearchBackend()
+
+
+def search_products(query, status='published', limit=20, offset=0):
+    """Return [(product_id, rank), ...] best match first."""
+    terms = tokenize(query)
+    if not terms:
+        return []
+    hits = get_backend().search(terms, status, limit, offset)
+    # Raw cursors hand back UUIDs as strings on SQLite
+    return [(uuid.UUID(str(product_id)), rank) for product_id, rank in hits]
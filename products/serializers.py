@@ -5,39 +5,80 @@ from .models import (
     ProductImage,
     ProductVariation,
     VariationImage,
-    Review
+    Review,
+    ReviewAggregate,
+    ProductListingSummary
 )
+from core.fragments import FragmentCacheMixin
+from core.loaders import BatchListSerializer, BatchSerializerMixin
+from core.shaping import SparseFieldsMixin
+from django.utils.functional import cached_property
+from .cache import product_version_key
+from .images import LISTING_WIDTH, THUMBNAIL_WIDTH, pick_rendition
+from .loaders import collect_products, collect_variations
 
-class ProductImageSerializer(serializers.ModelSerializer):
-    product_id = serializers.UUIDField(source='product.id', read_only=True)
+PRICE_FIELD = serializers.DecimalField(max_digits=10, decimal_places=2)
+
+class ProductImageSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    product_id = serializers.UUIDField(read_only=True)
 
     class Meta:
         model = ProductImage
-        fields = ['id', 'image', 'product_id', 'is_main']
+        fields = ['id', 'image', 'product_id', 'is_main', 'processing_state', 'renditions']
         
-class VariationImageSerializer(serializers.ModelSerializer):
-    variation_id = serializers.UUIDField(source='variation.id', read_only=True)
+class VariationImageSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    variation_id = serializers.UUIDField(read_only=True)
     class Meta:
         model = VariationImage
-        fields = ['id', 'image', 'variation_id', 'is_main']
+        fields = ['id', 'image', 'variation_id', 'is_main', 'processing_state', 'renditions']
 
-class ProductVariationSerializer(serializers.ModelSerializer):
-    images = VariationImageSerializer(many=True, read_only=True)
+class ProductVariationSerializer(SparseFieldsMixin, FragmentCacheMixin, BatchSerializerMixin, serializers.ModelSerializer):
+    images = serializers.SerializerMethodField()
     class Meta:
         model = ProductVariation
         fields = ['id', 'product', 'name', 'unit_price', 'stock','unit_measurement', 'is_available', 'images']
+        list_serializer_class = BatchListSerializer
 
-class ProductSerializer(serializers.ModelSerializer):
-    images = ProductImageSerializer(many=True, read_only=True)
-    variations = ProductVariationSerializer(many=True, read_only=True)
-    min_price = serializers.DecimalField(
-        max_digits=10,
-        decimal_places=2,
-        read_only=True
-    )
+    def collect(self, variations):
+        variations = self.uncached(variations)
+        if 'images' in self.fields:
+            collect_variations(self.loaders, variations)
+
+    def fragment_counter_key(self, obj):
+        # Bumped by image changes too
+        return product_version_key(obj.product_id)
+
+    @cached_property
+    def image_serializer(self):
+        return VariationImageSerializer(many=True, shape=self.nested_shape('images'))
+
+    def get_images(self, obj):
+        return self.image_serializer.to_representation(self.loaders['variation_images'].load(obj.id) or [])
+
+class ReviewAggregateSerializer(serializers.ModelSerializer):
+    average = serializers.FloatField(read_only=True)
+    count = serializers.IntegerField(source='review_count', read_only=True)
+    histogram = serializers.DictField(child=serializers.IntegerField(), read_only=True)
+
+    class Meta:
+        model = ReviewAggregate
+        fields = ['average', 'count', 'histogram']
+
+class ProductSerializer(SparseFieldsMixin, FragmentCacheMixin, BatchSerializerMixin, serializers.ModelSerializer):
+    """
+    Vendors (with their addresses), categories, images, variations and ratings are
+    read through the request's batch loaders: one query per kind for a whole list,
+    none for the fields left out with ?fields=. Products whose representation is
+    in the fragment cache aren't serialized (nor their relations loaded) at all.
+    """
+    images = serializers.SerializerMethodField()
+    variations = serializers.SerializerMethodField()
+    min_price = serializers.SerializerMethodField()
     vendor_name = serializers.SerializerMethodField()
     vendor_address = serializers.SerializerMethodField()
     category_name = serializers.SerializerMethodField()
+    rating = serializers.SerializerMethodField()
+    thumbnail = serializers.SerializerMethodField()
     
     
     class Meta:
@@ -46,18 +87,67 @@ class ProductSerializer(serializers.ModelSerializer):
             'id', 'name', 'slug', 'description',
             'category', 'category_name','vendor', 'vendor_name', 'vendor_address', 'status',
             'is_available', 'created_at', 'updated_at',
-            'images', 'variations', 'min_price'
+            'images', 'variations', 'min_price', 'rating', 'thumbnail'
         ]
+        # Only with ?expand=thumbnail or ?fields=...,thumbnail
+        expandable_fields = ['thumbnail']
+        list_serializer_class = BatchListSerializer
+
+    def collect(self, products):
+        products = self.uncached(products)
+        if not products:
+            return
+        collect_products(self.loaders, products, set(self.fields))
+        if 'variations' in self.fields:
+            # Variation images are keyed by variation, so the variations are needed right away
+            variations = self.loaders['product_variations'].load_many(product.id for product in products)
+            self.variation_serializer.child.collect([variation for group in variations for variation in group or ()])
+
+    def fragment_counter_key(self, obj):
+        # Bumped by changes to its variations, images, reviews, category and vendor
+        return product_version_key(obj.id)
+
+    @cached_property
+    def image_serializer(self):
+        return ProductImageSerializer(many=True, shape=self.nested_shape('images'))
+
+    @cached_property
+    def variation_serializer(self):
+        return ProductVariationSerializer(many=True, context=self.context, shape=self.nested_shape('variations'))
+
+    def get_images(self, obj):
+        return self.image_serializer.to_representation(self.loaders['product_images'].load(obj.id) or [])
+
+    def get_variations(self, obj):
+        return self.variation_serializer.to_representation(self.loaders['product_variations'].load(obj.id) or [])
+
+    def get_thumbnail(self, obj):
+        images = self.loaders['product_images'].load(obj.id) or []
+        main_image = next((image for image in images if image.is_main), None)
+        return main_image.rendition_url(THUMBNAIL_WIDTH) if main_image else None
+
+    def get_min_price(self, obj):
+        available = [v for v in self.loaders['product_variations'].load(obj.id) or [] if v.is_available]
+        if not available:
+            return None
+        return PRICE_FIELD.to_representation(min(v.unit_price for v in available))
 
     def get_vendor_name(self, obj):
-        return obj.vendor.username if obj.vendor else None
+        vendor = self.loaders['users'].load(obj.vendor_id)
+        return vendor.username if vendor else None
     
     def get_category_name(self, obj):
-        return obj.category.name if obj.vendor else None
+        category = self.loaders['categories'].load(obj.category_id)
+        return category.name if category else None
     
+    def get_rating(self, obj):
+        aggregate = self.loaders['review_aggregates'].load(obj.id) or ReviewAggregate(product_id=obj.id)
+        return ReviewAggregateSerializer(aggregate).data
+
     def get_vendor_address(self, obj):
-        # Get the first address for the vendor (user)
-        address = obj.vendor.addresses.first()
+        # The vendor's first address (the users batch prefetches them in id order)
+        vendor = self.loaders['users'].load(obj.vendor_id)
+        address = next(iter(vendor.addresses.all()), None) if vendor else None
         if address:
             return {
                 "region": address.region,
@@ -68,7 +158,7 @@ class ProductSerializer(serializers.ModelSerializer):
         return None
         
         
-class LandingProductSerializer(serializers.ModelSerializer):
+class LandingProductSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     images = serializers.SerializerMethodField()
     min_price = serializers.DecimalField(
         max_digits=10,
@@ -87,13 +177,47 @@ class LandingProductSerializer(serializers.ModelSerializer):
     def get_images(self, obj):
         main_image = obj.images.filter(is_main=True).first()
         if main_image:
-            return ProductImageSerializer(main_image).data
+            data = ProductImageSerializer(main_image).data
+            # Cards don't need the full-size original
+            data['image'] = main_image.rendition_url(LISTING_WIDTH)
+            return data
         return None
 
+class ProductListingSummarySerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    """
+    Same payload as LandingProductSerializer, read straight from the
+    denormalized ProductListingSummary row (no per-product queries).
+    """
+    id = serializers.UUIDField(source='product_id', read_only=True)
+    images = serializers.SerializerMethodField()
+    category = serializers.UUIDField(source='category_id', read_only=True)
+
+    class Meta:
+        model = ProductListingSummary
+        fields = [
+            'id', 'name', 'slug',
+            'images', 'min_price', 'category', 'category_name', 'unit_measurement', 'default_variation',
+            'average_rating', 'review_count'
+        ]
+
+    def get_images(self, obj):
+        if not obj.main_image_id:
+            return None
+        return {
+            'id': str(obj.main_image_id),
+            'image': pick_rendition(obj.main_image_renditions, LISTING_WIDTH, fallback=obj.main_image),
+            'product_id': str(obj.product_id),
+            'is_main': True,
+            'renditions': obj.main_image_renditions,
+        }
+
 class ProductReviewSerializer(serializers.ModelSerializer):
+    buyer_name = serializers.ReadOnlyField(source='buyer.username')
+
     class Meta:
         model = Review
-        fields = ['id', 'user', 'rating', 'comment', 'created_at']
+        fields = ['id', 'buyer', 'buyer_name', 'rating', 'comment', 'created_at', 'updated_at']
+        read_only_fields = ['buyer']
 
 
 class ProductDetailSerializer(serializers.Serializer):
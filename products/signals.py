@@ -0,0 +1,162 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+from users.models import Address, CustomUser
+from .cache import bump_product_versions
+from .listing import refresh_listing_summaries
+from .models import (Category, Product, ProductImage, ProductListingSummary, ProductSearchDocument, ProductVariation,
+    Review, VariationImage)
+from .reviews import adjust_review_aggregates
+from .search import refresh_search_documents
+from .tasks import enqueue_content_refresh, enqueue_image_processing
+
+
+def refresh_read_models(product_ids, search=True, vendor_ids=(), category_ids=()):
+    refresh_listing_summaries(product_ids)
+    if search:
+        refresh_search_documents(product_ids)
+    # Bumped last so no request can cache a response built from the old read models
+    bump_product_versions(product_ids, vendor_ids, category_ids)
+
+
+def schedule_product_refresh(product_id, search=True, vendor_id=None, category_ids=()):
+    # Deferred so cascaded deletes don't re-insert rows for a product that
+    # is about to disappear, and so the refresh sees the committed rows
+    category_ids = [category_id for category_id in category_ids if category_id]
+    transaction.on_commit(lambda: refresh_read_models(
+        [product_id], search=search, vendor_ids=[vendor_id] if vendor_id else [], category_ids=category_ids,
+    ))
+
+
+def schedule_version_bump(product_ids):
+    product_ids = list(product_ids)
+    transaction.on_commit(lambda: bump_product_versions(product_ids))
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def product_changed(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    # Vendor and category are passed along since a deleted product can't be looked up afterwards.
+    # A product moved to another category leaves that one's cached lists too (still the value from
+    # before this save: the dirty-field snapshot is only taken after post_save)
+    schedule_product_refresh(
+        instance.id, vendor_id=instance.vendor_id,
+        category_ids=[instance.category_id, instance.loaded_value('category')],
+    )
+
+
+@receiver(post_save, sender=Product)
+def product_text_changed(sender, instance, created=False, raw=False, **kwargs):
+    if raw:
+        return
+    # Still the values from before this save: the dirty-field snapshot is only taken after post_save
+    if created or instance.has_changed('name', 'description', 'category', 'status'):
+        enqueue_content_refresh([instance.id])
+
+
+@receiver(post_save, sender=ProductVariation)
+@receiver(post_delete, sender=ProductVariation)
+def variation_changed(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    schedule_product_refresh(instance.product_id)
+
+
+@receiver(post_save, sender=ProductImage)
+@receiver(post_save, sender=VariationImage)
+def image_uploaded(sender, instance, created=False, raw=False, **kwargs):
+    if raw or not created or not instance.image_file:
+        return
+    # Same transaction as the row, so the worker never sees a job without its image
+    enqueue_image_processing(instance)
+
+
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+def product_image_changed(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    # Images don't affect the search document
+    schedule_product_refresh(instance.product_id, search=False)
+
+
+@receiver(post_save, sender=VariationImage)
+@receiver(post_delete, sender=VariationImage)
+def variation_image_changed(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    product_id = ProductVariation.objects.filter(pk=instance.variation_id).values_list('product_id', flat=True).first()
+    if product_id:
+        # Touches the summary's updated_at too, which the list ETags are built from
+        schedule_product_refresh(product_id, search=False)
+
+
+@receiver(post_save, sender=Category)
+def category_saved(sender, instance, created=False, raw=False, **kwargs):
+    # Only the name is copied into the read models; a new category has no products yet
+    if raw or created or not instance.has_changed('name'):
+        return
+    # The category name is one of the terms of its products' content vectors
+    enqueue_content_refresh(Product.objects.filter(category=instance).values_list('id', flat=True))
+    ProductListingSummary.objects.filter(category=instance).exclude(category_name=instance.name).update(
+        category_name=instance.name, updated_at=timezone.now()
+    )
+    ProductSearchDocument.objects.filter(product__category=instance).exclude(category_name=instance.name).update(
+        category_name=instance.name, updated_at=timezone.now()
+    )
+    schedule_version_bump(Product.objects.filter(category=instance).values_list('id', flat=True))
+
+
+@receiver(post_save, sender=CustomUser)
+def vendor_saved(sender, instance, created=False, raw=False, **kwargs):
+    # Only the username is copied into the summaries (not e.g. the last_login written on every login);
+    # a new user has no products yet
+    if raw or created or not instance.has_changed('username'):
+        return
+    updated = ProductListingSummary.objects.filter(vendor=instance).exclude(vendor_name=instance.username).update(
+        vendor_name=instance.username, updated_at=timezone.now()
+    )
+    if updated:
+        schedule_version_bump(Product.objects.filter(vendor=instance).values_list('id', flat=True))
+
+
+@receiver(post_save, sender=Address)
+@receiver(post_delete, sender=Address)
+def vendor_address_changed(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    vendor_id = instance.user_id
+
+    def refresh():
+        product_ids = list(Product.objects.filter(vendor_id=vendor_id).values_list('id', flat=True))
+        refresh_listing_summaries(product_ids)
+        bump_product_versions(product_ids, vendor_ids=[vendor_id])
+
+    transaction.on_commit(refresh)
+
+
+@receiver(post_save, sender=Review)
+def review_saved(sender, instance, created=False, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        adjust_review_aggregates([(instance.product_id, instance.rating, 1)])
+    elif instance.has_changed('rating', 'product'):
+        # Still the values from before this save: the dirty-field snapshot is only taken after post_save
+        old_product_id = instance.loaded_value('product')
+        adjust_review_aggregates([
+            (old_product_id, instance.loaded_value('rating'), -1), (instance.product_id, instance.rating, 1),
+        ])
+        if old_product_id != instance.product_id:
+            schedule_version_bump([old_product_id])
+    schedule_version_bump([instance.product_id])
+
+
+@receiver(post_delete, sender=Review)
+def review_deleted(sender, instance, **kwargs):
+    # The rating stored in the row, even if it was changed in memory before delete()
+    adjust_review_aggregates([(instance.product_id, instance.loaded_value('rating'), -1)])
+    schedule_version_bump([instance.product_id])
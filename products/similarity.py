@@ -0,0 +1,157 @@
+"""
+Content-based "similar products" from name, description and category.
+
+Every product is a TF-IDF vector over the words of its text: name words and
+the category count several times, so "Cherry tomatoes" in Vegetables is
+closer to "Tomatoes" than to a description merely mentioning tomatoes.
+Weights are sublinear (1 + log tf) times a smoothed idf, and the rows are
+L2-normalized, so a dot product is the cosine similarity. The vocabulary is
+capped to the MAX_TERMS most widespread words seen in at least two products;
+rarer ones can't make two products similar anyway. Similarities are computed
+as dense float32 matrix products, BATCH_SIZE rows at a time against every
+published product, and the top-k per product are stored as `content`
+ProductNeighbor rows.
+
+They cover products without order history: related_products() uses them
+after the co-purchase neighbors. `rebuild_content_neighbors()` does the
+whole catalog in one pass; `refresh_content_neighbors(ids)` (run as a job
+when a product's text, category or status changes) recomputes only those
+products' lists, plus the lists they now enter or leave.
+"""
+from collections import Counter
+from django.db.models import Count, Min
+from .models import Product, ProductNeighbor
+from .recommendations import CONTENT, neighbor_count, save_neighbors
+import math, re, uuid
+import numpy as np
+
+TOKEN_RE = re.compile(r'[a-z0-9]{2,}')
+STOP_WORDS = {
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from', 'in', 'is', 'it', 'of', 'on', 'or', 'our',
+    'the', 'this', 'to', 'with', 'we', 'you', 'your', 'per', 'kg', 'fresh',
+}
+NAME_WEIGHT = 3
+CATEGORY_WEIGHT = 3
+MAX_TERMS = 2048
+MIN_SIMILARITY = 0.05
+BATCH_SIZE = 256
+
+
+def tokens(text):
+    return [token for token in TOKEN_RE.findall((text or '').lower()) if token not in STOP_WORDS]
+
+
+def document_terms(name, description, category):
+    terms = Counter()
+    for token in tokens(name):
+        terms[token] += NAME_WEIGHT
+    terms.update(tokens(description))
+    if category:
+        # Its own term, so sharing a category counts even when no word matches
+        terms[f'category:{category.lower()}'] += CATEGORY_WEIGHT
+    return terms
+
+
+class ContentIndex:
+    """TF-IDF matrix of the whole catalog: `vectors[i]` is product `ids[i]`."""
+
+    def __init__(self, products):
+        self.ids = []
+        self.published = []
+        documents = []
+        for product_id, name, description, category, status in products:
+            self.ids.append(product_id)
+            self.published.append(status == 'published')
+            documents.append(document_terms(name, description, category))
+        self.position = {product_id: index for index, product_id in enumerate(self.ids)}
+        self.published = np.array(self.published, dtype=bool)
+        self.vectors = self.vectorize(documents)
+
+    @classmethod
+    def load(cls):
+        return cls(Product.objects.exclude(status='deleted').values_list(
+            'id', 'name', 'description', 'category__name', 'status'
+        ).iterator())
+
+    def vectorize(self, documents):
+        frequency = Counter(term for terms in documents for term in terms)
+        common = [term for term, count in frequency.most_common(MAX_TERMS) if count >= 2]
+        vocabulary = {term: index for index, term in enumerate(common)}
+        idf = np.array([math.log((1 + len(documents)) / (1 + frequency[term])) + 1 for term in common], dtype=np.float32)
+
+        vectors = np.zeros((len(documents), len(vocabulary)), dtype=np.float32)
+        for row, terms in enumerate(documents):
+            for term, count in terms.items():
+                column = vocabulary.get(term)
+                if column is not None:
+                    vectors[row, column] = 1 + math.log(count)
+        vectors *= idf
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        # Products without a single known word stay all zeros: similar to nothing
+        return vectors / np.where(norms > 0, norms, 1)
+
+    def neighbors(self, product_ids):
+        """{product id: [(neighbor id, similarity), ...]} best first, among published products."""
+        k = neighbor_count()
+        candidates = np.flatnonzero(self.published)
+        candidate_ids = [self.ids[index] for index in candidates]
+        rows = [self.position[product_id] for product_id in product_ids if product_id in self.position]
+        result = {}
+        for start in range(0, len(rows), BATCH_SIZE):
+            batch = rows[start:start + BATCH_SIZE]
+            similarity = self.vectors[batch] @ self.vectors[candidates].T
+            # A product isn't its own neighbor
+            similarity[candidates[None, :] == np.array(batch)[:, None]] = 0
+            top = min(k, len(candidates))
+            best = np.argpartition(-similarity, top - 1, axis=1)[:, :top] if top else np.empty((len(batch), 0), dtype=int)
+            for offset, (row, columns) in enumerate(zip(batch, best)):
+                scores = similarity[offset, columns].tolist()
+                # Ties go by product id, like the co-purchase lists
+                ranked = sorted(zip(scores, columns.tolist()), key=lambda pair: (-pair[0], str(candidate_ids[pair[1]])))
+                result[self.ids[row]] = [
+                    (candidate_ids[column], score) for score, column in ranked if score >= MIN_SIMILARITY
+                ]
+        return result
+
+    def entering(self, product_ids):
+        """
+        Products whose stored list the given products should now enter: they are
+        similar enough to beat the list's weakest entry (or the list isn't full).
+        """
+        # Only published products are anyone's neighbor
+        rows = [self.position[product_id] for product_id in product_ids
+                if product_id in self.position and self.published[self.position[product_id]]]
+        if not rows:
+            return set()
+        best = (self.vectors @ self.vectors[rows].T).max(axis=1)
+        best[rows] = 0
+        stored = {
+            row['product_id']: row for row in ProductNeighbor.objects.filter(kind=CONTENT)
+            .values('product_id').annotate(weakest=Min('score'), count=Count('id'))
+        }
+        entering = set()
+        for index in np.flatnonzero(best >= MIN_SIMILARITY).tolist():
+            row = stored.get(self.ids[index])
+            if row is None or row['count'] < neighbor_count() or best[index] > row['weakest']:
+                entering.add(self.ids[index])
+        return entering
+
+
+def rebuild_content_neighbors():
+    """Recompute every product's content neighbors. Returns the number of rows stored."""
+    index = ContentIndex.load()
+    return save_neighbors(index.neighbors(index.ids), kind=CONTENT)
+
+
+def refresh_content_neighbors(product_ids):
+    """
+    Recompute the content neighbors of `product_ids` after their text, category or
+    status changed, and of the products whose lists they enter or leave.
+    """
+    index = ContentIndex.load()
+    product_ids = {uuid.UUID(str(product_id)) for product_id in product_ids}
+    affected = set(product_ids)
+    # Lists they're in now (they may have to leave) and lists they should now enter
+    affected.update(ProductNeighbor.objects.filter(kind=CONTENT, neighbor__in=product_ids).values_list('product_id', flat=True))
+    affected.update(index.entering(product_ids))
+    return save_neighbors(index.neighbors(affected), affected, kind=CONTENT)
@@ -0,0 +1,90 @@
+"""
+Unique slug allocation for Category and Product.
+
+Slugs are `<base>` or `<base>-<n>`. Rather than probing `base-1`, `base-2`, ...
+with one exists() each, one query fetches the slugs already taken for a base
+(prefix match, narrowed to exactly `base` or `base-<digits>`) and the next
+suffix is one past the highest. A whole batch of names is allocated with the
+same single query. Allocation takes no lock, so two concurrent saves can pick
+the same slug; the unique constraint rejects the second one, which allocates
+again (`save_with_unique_slug`).
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils.text import slugify
+import re
+
+# Room kept at the end of the field for the "-<n>" suffix
+SUFFIX_ROOM = 8
+SAVE_ATTEMPTS = 3
+
+
+def slug_base(model, value, field='slug'):
+    max_length = model._meta.get_field(field).max_length
+    return slugify(value)[:max_length - SUFFIX_ROOM].strip('-') or model._meta.model_name
+
+
+def allocate_slugs(model, values, field='slug', exclude_pk=None, reserved=()):
+    """
+    Unique slugs for `values` (in order), with one query for the whole batch.
+    `reserved` slugs are about to be used by other rows and are avoided too.
+    """
+    bases = [slug_base(model, value, field) for value in values]
+    if not bases:
+        return []
+
+    taken = Q()
+    for base in set(bases):
+        # The prefix lookup can use the index; the regex drops e.g. "tomato-sauce" for "tomato"
+        taken |= Q(**{f'{field}__startswith': base, f'{field}__regex': rf'^{re.escape(base)}(-[0-9]+)?$'})
+    rows = model.objects.filter(taken)
+    if exclude_pk is not None:
+        rows = rows.exclude(pk=exclude_pk)
+
+    # Highest suffix in use per base; 0 stands for the bare base. "tomato-3" can be
+    # both a suffix of "tomato" and the bare slug of a product named "Tomato 3"
+    wanted = set(bases)
+    used = {*rows.values_list(field, flat=True), *reserved}
+    highest = {}
+    for slug in used:
+        base, _, suffix = slug.rpartition('-')
+        if suffix.isdigit() and base in wanted:
+            highest[base] = max(highest.get(base, -1), int(suffix))
+        if slug in wanted:
+            highest[slug] = max(highest.get(slug, -1), 0)
+
+    slugs = []
+    for base in bases:
+        n = highest.get(base, -1) + 1
+        slug = f'{base}-{n}' if n else base
+        # Only clashes with a slug allocated earlier in this batch ("tomato" twice, then "Tomato 1")
+        while slug in used:
+            n += 1
+            slug = f'{base}-{n}'
+        highest[base] = n
+        used.add(slug)
+        slugs.append(slug)
+    return slugs
+
+
+def allocate_slug(model, value, field='slug', exclude_pk=None):
+    return allocate_slugs(model, [value], field, exclude_pk)[0]
+
+
+def save_with_unique_slug(instance, value, save, *args, **kwargs):
+    """
+    Allocate `instance`'s slug from `value`, then `save(*args, **kwargs)` (the
+    model's super().save). If a concurrent save took the same slug meanwhile,
+    allocate again and retry.
+    """
+    model = type(instance)
+    for attempt in range(SAVE_ATTEMPTS):
+        instance.slug = allocate_slug(model, value, exclude_pk=instance.pk)
+        try:
+            with transaction.atomic():
+                return save(*args, **kwargs)
+        except IntegrityError:
+            # Some other constraint, or out of attempts
+            taken = model.objects.filter(slug=instance.slug).exclude(pk=instance.pk).exists()
+            if not taken or attempt == SAVE_ATTEMPTS - 1:
+                raise
@@ -0,0 +1,168 @@
+"""
+Storage for the processed product/variation images.
+
+`get_image_storage(bucket)` returns a Django Storage for one Supabase bucket
+(or a local-disk stand-in with IMAGE_STORAGE_BACKEND=local). The Supabase
+client is created once per process and shared, so uploads reuse its HTTP
+connections instead of reconnecting per file.
+"""
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from functools import lru_cache
+from django.conf import settings
+from django.core.files.base import ContentFile, File
+from django.core.files.storage import FileSystemStorage, Storage
+from django.utils.dateparse import parse_datetime
+from django.utils.deconstruct import deconstructible
+from supabase import create_client, Client
+import mimetypes, os
+
+
+@lru_cache(maxsize=None)
+def get_supabase_client() -> Client:
+    # Created lazily, so each gunicorn/worker process gets its own after forking
+    return create_client(os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_API_KEY"))
+
+
+@deconstructible
+class SupabaseStorage(Storage):
+    """
+    A public Supabase bucket. Names are unique or content-addressed, so
+    `exists()` doesn't ask the API and saving never renames.
+    """
+
+    def __init__(self, bucket):
+        self.bucket = bucket
+        self.base_url = f'{os.getenv("SUPABASE_URL")}/storage/v1/object/public/{bucket}/'
+        # Deletions per folder, so a listing in progress can keep its page offsets right
+        self.deleted = Counter()
+
+    @property
+    def client(self):
+        return get_supabase_client().storage.from_(self.bucket)
+
+    def _open(self, name, mode='rb'):
+        return ContentFile(self.client.download(name), name=name)
+
+    def _save(self, name, content):
+        content_type = getattr(content, 'content_type', None) or mimetypes.guess_type(name)[0]
+        content.seek(0)
+        # Blob names are content hashes, so writing an existing name again is harmless
+        self.client.upload(name, content.read(), {'content-type': content_type or 'application/octet-stream', 'upsert': 'true'})
+        return name
+
+    def exists(self, name):
+        return False
+
+    def delete(self, name):
+        self.delete_many([name])
+
+    def delete_many(self, names):
+        if names:
+            self.client.remove(list(names))
+            self.deleted.update(os.path.dirname(name) for name in names)
+
+    def iter_files(self, path='', page_size=1000):
+        """Yield (name, size, modified) under `path`, one page of the name-sorted listing at a time."""
+        offset = 0
+        while True:
+            deleted_before = self.deleted[path]
+            page = self.client.list(path or None, {
+                'limit': page_size, 'offset': offset, 'sortBy': {'column': 'name', 'order': 'asc'},
+            })
+            for entry in page:
+                name = f'{path}/{entry["name"]}' if path else entry['name']
+                if entry.get('id') is None:
+                    # Folders have no object id
+                    yield from self.iter_files(name, page_size)
+                else:
+                    size = (entry.get('metadata') or {}).get('size', 0)
+                    yield name, size, parse_datetime(entry.get('updated_at') or entry['created_at'])
+            if len(page) < page_size:
+                return
+            # Files of this page deleted while it was being consumed shift the next ones back
+            offset += len(page) - (self.deleted[path] - deleted_before)
+
+    def url(self, name):
+        return f'{self.base_url}{name}'
+
+
+@deconstructible
+class LocalImageStorage(FileSystemStorage):
+    """Local-disk stand-in for the Supabase buckets (tests and offline development)."""
+
+    def __init__(self, bucket):
+        self.bucket = bucket
+        super().__init__(
+            location=os.path.join(settings.LOCAL_STORAGE_ROOT, bucket),
+            base_url=f'{settings.LOCAL_STORAGE_URL}{bucket}/',
+            allow_overwrite=True,
+        )
+
+
+def iter_local_files(storage, path=''):
+    directory = storage.path(path)
+    if not os.path.isdir(directory):
+        return
+    # Only one directory's entries are held at a time, sorted so a run can be resumed by name
+    with os.scandir(directory) as entries:
+        entries = sorted(entries, key=lambda entry: entry.name)
+    for entry in entries:
+        name = f'{path}/{entry.name}' if path else entry.name
+        if entry.is_dir(follow_symlinks=False):
+            yield from iter_local_files(storage, name)
+        elif entry.is_file(follow_symlinks=False):
+            stat = entry.stat()
+            yield name, stat.st_size, datetime.fromtimestamp(stat.st_mtime, tz=timezone.utc)
+
+
+def iter_storage_files(storage, path=''):
+    """
+    Yield (name, size, modified) of every file under `path` of a local or Supabase
+    storage, streamed directory by directory in name order.
+    """
+    if isinstance(storage, FileSystemStorage):
+        return iter_local_files(storage, path)
+    return storage.iter_files(path)
+
+
+def delete_files(storage, names):
+    if hasattr(storage, 'delete_many'):
+        storage.delete_many(names)
+    else:
+        for name in names:
+            storage.delete(name)
+
+
+@lru_cache(maxsize=None)
+def get_image_storage(bucket):
+    if getattr(settings, 'IMAGE_STORAGE_BACKEND', 'supabase') == 'local':
+        return LocalImageStorage(bucket)
+    return SupabaseStorage(bucket)
+
+
+def save_file(storage, name, content, content_type):
+    # Encoded buffers are handed over as they are rather than copied into a new one
+    file = File(content, name=name) if hasattr(content, 'read') else ContentFile(content, name=name)
+    file.content_type = content_type
+    return storage.url(storage.save(name, file))
+
+
+def upload_files(bucket, files):
+    """
+    Upload [(name, bytes or file-like, content type)] to `bucket` concurrently.
+    Returns their public URLs, in the same order.
+    """
+    storage = get_image_storage(bucket)
+    if len(files) <= 1:
+        return [save_file(storage, *file) for file in files]
+
+    workers = min(getattr(settings, 'IMAGE_UPLOAD_CONCURRENCY', 8), len(files))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(lambda file: save_file(storage, *file), files))
+
+
+def upload_file(bucket, name, content, content_type):
+    """Upload `content` (bytes) to `bucket` under `name` and return its public URL."""
+    return upload_files(bucket, [(name, content, content_type)])[0]
@@ -0,0 +1,112 @@
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime
+from urllib.request import urlopen
+from jobs.queue import enqueue, register
+from .blobs import store_images
+from .images import make_renditions, open_bounded
+from .models import ProductImage, VariationImage
+from .recommendations import refresh_co_purchase_neighbors
+from .similarity import refresh_content_neighbors
+from .storage import upload_files
+import io, threading, uuid
+
+IMAGE_MODELS = {
+    'product': ProductImage,
+    'variation': VariationImage,
+}
+
+_batch = threading.local()
+
+
+def image_kind(image):
+    return 'product' if isinstance(image, ProductImage) else 'variation'
+
+
+def payload_ids(payload):
+    # Jobs queued before batching carried a single 'id'
+    return payload.get('ids') or [payload['id']]
+
+
+@contextmanager
+def batch_image_processing():
+    """Queue one processing job for all the images created inside the block instead of one per image."""
+    if getattr(_batch, 'pending', None) is not None:
+        yield
+        return
+    _batch.pending = defaultdict(list)
+    try:
+        yield
+        for kind, ids in _batch.pending.items():
+            enqueue('products.process_image', {'model': kind, 'ids': ids})
+    finally:
+        _batch.pending = None
+
+
+def enqueue_image_processing(image):
+    pending = getattr(_batch, 'pending', None)
+    if pending is not None:
+        pending[image_kind(image)].append(str(image.id))
+        return None
+    return enqueue('products.process_image', {'model': image_kind(image), 'ids': [str(image.id)]})
+
+
+def mark_image_failed(payload, error):
+    IMAGE_MODELS[payload['model']].objects.filter(pk__in=payload_ids(payload)).exclude(
+        processing_state='ready'
+    ).update(processing_state='failed')
+
+
+@register('products.process_image', on_failure=mark_image_failed)
+def process_image(payload):
+    """Store a request's uploaded images: re-encoded original and WebP renditions, shared by content hash."""
+    model = IMAGE_MODELS[payload['model']]
+    # Deleted images are simply gone; ready ones were done by an earlier attempt
+    images = list(model.objects.filter(pk__in=payload_ids(payload)).exclude(processing_state='ready'))
+    if not images:
+        return
+    model.objects.filter(pk__in=[image.pk for image in images]).update(processing_state='processing')
+    # Known photos reuse their blob; the rest are processed in the pool and uploaded together
+    store_images(images)
+
+
+@register('products.generate_renditions')
+def generate_renditions(payload):
+    """Backfill renditions of an image uploaded before they existed, from its public URL."""
+    model = IMAGE_MODELS[payload['model']]
+    image = model.objects.filter(pk=payload['id']).first()
+    if image is None or image.renditions or not image.image:
+        return
+
+    with urlopen(image.image, timeout=30) as response:
+        original = open_bounded(io.BytesIO(response.read()))
+
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    base_name = f'{model.STORAGE_BUCKET}/{image.id}_{timestamp}_{str(uuid.uuid4())[:8]}'
+    renditions = make_renditions(original)
+    urls = upload_files(model.STORAGE_BUCKET, [
+        (f'{base_name}_{width}w.webp', data, 'image/webp') for width, data in renditions.items()
+    ])
+    image.renditions = {str(width): url for width, url in zip(renditions, urls)}
+    image.save(update_fields=['renditions', 'updated_at'])
+
+
+def enqueue_co_purchase_refresh(order_ids):
+    """Call inside the checkout transaction, once for all the orders it created."""
+    return enqueue('products.refresh_co_purchases', {'order_ids': [str(order_id) for order_id in order_ids]})
+
+
+@register('products.refresh_co_purchases')
+def refresh_co_purchases(payload):
+    """Recompute the "frequently bought together" neighbors touched by a checkout's orders."""
+    refresh_co_purchase_neighbors(payload['order_ids'])
+
+
+def enqueue_content_refresh(product_ids):
+    return enqueue('products.refresh_content_neighbors', {'ids': [str(product_id) for product_id in product_ids]})
+
+
+@register('products.refresh_content_neighbors')
+def refresh_similar_products(payload):
+    """Recompute the content-based neighbors of products whose text, category or status changed."""
+    refresh_content_neighbors(payload['ids'])
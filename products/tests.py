@@ -0,0 +1,1661 @@
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.db import IntegrityError, connection
+from django.db.models.signals import post_save
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.http import http_date
+from rest_framework.test import APIClient
+from PIL import Image, ImageDraw
+from core.shaping import Shape
+from jobs.models import Job
+from jobs.queue import enqueue, run_pending
+from orders.models import Order, OrderItem
+from users.models import Address, CustomUser
+from .facets import FACET_DIMENSIONS, apply_facet_filters, compute_facets, parse_facet_filters
+from .importer import CatalogImporter, import_catalog
+from .inventory import InventoryUpdateError, apply_inventory_updates, read_changes
+from .models import (Category, ImageBlob, Product, ProductImage, ProductListingSummary, ProductNeighbor,
+    ProductSearchDocument, ProductVariation, Review, ReviewAggregate, VariationImage)
+from .recommendations import compute_neighbors, rebuild_co_purchase_neighbors, refresh_co_purchase_neighbors
+from .reviews import rebuild_review_aggregates
+from .search import FallbackSearchBackend, search_products
+from .serializers import ProductSerializer
+from .similarity import ContentIndex, rebuild_content_neighbors, refresh_content_neighbors
+from . import slugs
+from .storage import get_image_storage
+from .tasks import batch_image_processing
+import io, itertools, json, random, shutil, tempfile, uuid
+
+contact_numbers = itertools.count(9170000000)
+
+
+def make_vendor(username='farmer'):
+    return CustomUser.objects.create_user(
+        email=f'{username}@example.com', username=username, contact_no=str(next(contact_numbers)), role='farmer',
+    )
+
+
+def make_product(vendor, name='Tomato', **fields):
+    fields.setdefault('description', f'{name} description')
+    return Product.objects.create(vendor=vendor, name=name, **fields)
+
+
+def sample_image(width=1200, height=900, seed=0, format='JPEG'):
+    # Noise, so every seed is a different photo with a non-trivial perceptual hash
+    noise = [Image.effect_noise((width, height), 40 + seed * 3 + band) for band in range(3)]
+    output = io.BytesIO()
+    Image.merge('RGB', noise).save(output, format=format)
+    return output.getvalue()
+
+
+def block_image(width=1080, height=960, seed=0, format='JPEG'):
+    # A 9x8 grid of gray blocks, distinct along each row: its perceptual hash survives resizing
+    rnd = random.Random(seed)
+    image = Image.new('RGB', (width, height))
+    draw = ImageDraw.Draw(image)
+    block_width, block_height = width / 9, height / 8
+    for row in range(8):
+        for col, level in enumerate(rnd.sample(range(0, 252, 28), 9)):
+            draw.rectangle((
+                round(col * block_width), round(row * block_height),
+                round((col + 1) * block_width) - 1, round((row + 1) * block_height) - 1,
+            ), fill=(level,) * 3)
+    output = io.BytesIO()
+    image.save(output, format=format, **({'quality': 90} if format == 'JPEG' else {}))
+    return output.getvalue()
+
+
+class MediaTestCase(TestCase):
+    """Uploads and processed images go to a temporary directory."""
+
+    def setUp(self):
+        media_root = self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings = override_settings(
+            MEDIA_ROOT=media_root, IMAGE_STORAGE_BACKEND='local', LOCAL_STORAGE_ROOT=f'{media_root}/storage',
+            # In-process: no pool workers to spawn in tests
+            IMAGE_PROCESS_WORKERS=1,
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+        get_image_storage.cache_clear()
+        self.addCleanup(get_image_storage.cache_clear)
+
+    def add_image(self, product, data, name='photo.jpg', **fields):
+        return ProductImage.objects.create(product=product, image_file=ContentFile(data, name=name), **fields)
+
+
+class ImageProcessingTests(MediaTestCase):
+    def setUp(self):
+        super().setUp()
+        self.product = make_product(make_vendor())
+        # Only the image jobs are looked at here, not the new product's similarity refresh
+        Job.objects.all().delete()
+
+    def test_upload_enqueues_a_processing_job(self):
+        image = self.add_image(self.product, sample_image())
+
+        job = Job.objects.get(name='products.process_image')
+        self.assertEqual(job.payload, {'model': 'product', 'ids': [str(image.id)]})
+        self.assertEqual(job.status, 'queued')
+        self.assertEqual(image.processing_state, 'pending')
+
+    def test_job_stores_the_image_in_a_blob_with_renditions(self):
+        image = self.add_image(self.product, sample_image())
+
+        self.assertEqual(run_pending(), 1)
+
+        image.refresh_from_db()
+        self.assertEqual(image.processing_state, 'ready')
+        self.assertEqual(Job.objects.get().status, 'done')
+        blob = image.blob
+        self.assertEqual((blob.width, blob.height), (1200, 900))
+        self.assertEqual(sorted(blob.renditions, key=int), ['160', '480', '1080'])
+        self.assertEqual(image.image, blob.image)
+        self.assertEqual(image.renditions, blob.renditions)
+        storage = get_image_storage('products')
+        for width in (160, 480, 1080):
+            with storage.open(f'blobs/{blob.sha256[:2]}/{blob.sha256}_{width}w.webp') as file:
+                self.assertEqual(Image.open(file).width, width)
+
+    def test_same_photo_reuses_its_blob(self):
+        data = sample_image()
+        first = self.add_image(self.product, data)
+        run_pending()
+        variation = ProductVariation.objects.create(product=self.product, name='1kg', unit_price='10.00')
+        second = VariationImage.objects.create(variation=variation, image_file=ContentFile(data, name='again.jpg'))
+        run_pending()
+
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual(second.blob_id, first.blob_id)
+        self.assertEqual(ImageBlob.objects.count(), 1)
+
+    def test_small_image_is_not_upscaled(self):
+        image = self.add_image(self.product, sample_image(width=400, height=300))
+        run_pending()
+
+        image.refresh_from_db()
+        # 480 and up would be larger than the photo: one original-size rendition stands in for them
+        self.assertEqual(list(image.renditions), ['160', '480'])
+        self.assertEqual(image.blob.width, 400)
+
+    def test_failed_attempt_is_retried_later(self):
+        image = self.add_image(self.product, b'not an image', name='broken.jpg')
+
+        run_pending()
+
+        job = Job.objects.get()
+        self.assertEqual(job.status, 'queued')
+        self.assertEqual(job.attempts, 1)
+        self.assertGreater(job.run_at, timezone.now())
+        self.assertIn('Unsupported or corrupt image file', job.last_error)
+        image.refresh_from_db()
+        self.assertEqual(image.processing_state, 'processing')
+        # Backed off: not picked up again right away
+        self.assertEqual(run_pending(), 0)
+
+    def test_last_failed_attempt_marks_the_image_failed(self):
+        image = self.add_image(self.product, b'not an image', name='broken.jpg')
+        Job.objects.update(max_attempts=2)
+        run_pending()
+        Job.objects.update(run_at=timezone.now())
+
+        run_pending()
+
+        job = Job.objects.get()
+        self.assertEqual((job.status, job.attempts), ('failed', 2))
+        image.refresh_from_db()
+        self.assertEqual(image.processing_state, 'failed')
+        self.assertIsNone(image.blob)
+
+    def test_generate_renditions_backfills_an_older_image(self):
+        path = f'{self.media_root}/original.jpg'
+        with open(path, 'wb') as file:
+            file.write(sample_image())
+        # Processed before renditions existed: an original URL and nothing else
+        image = ProductImage.objects.create(product=self.product, image=f'file://{path}', processing_state='ready')
+        enqueue('products.generate_renditions', {'model': 'product', 'id': str(image.id)})
+
+        run_pending()
+
+        image.refresh_from_db()
+        self.assertEqual(sorted(image.renditions, key=int), ['160', '480', '1080'])
+        self.assertEqual(image.image, f'file://{path}')
+
+    def test_deleted_image_job_is_a_no_op(self):
+        image = self.add_image(self.product, sample_image())
+        image.delete()
+
+        run_pending()
+
+        self.assertEqual(Job.objects.get().status, 'done')
+        self.assertFalse(ImageBlob.objects.exists())
+
+
+class BatchImageProcessingTests(MediaTestCase):
+    def setUp(self):
+        super().setUp()
+        self.product = make_product(make_vendor())
+        # Only the image jobs are looked at here, not the new product's similarity refresh
+        Job.objects.all().delete()
+
+    def test_one_job_for_the_images_of_a_block(self):
+        with batch_image_processing():
+            images = [self.add_image(self.product, sample_image(seed=seed)) for seed in range(3)]
+            self.assertFalse(Job.objects.exists())
+
+        job = Job.objects.get()
+        self.assertEqual(job.payload, {'model': 'product', 'ids': [str(image.id) for image in images]})
+
+    def test_one_job_per_kind_of_image(self):
+        variation = ProductVariation.objects.create(product=self.product, name='1kg', unit_price='10.00')
+        with batch_image_processing():
+            self.add_image(self.product, sample_image(seed=1))
+            VariationImage.objects.create(variation=variation, image_file=ContentFile(sample_image(seed=2), name='v.jpg'))
+
+        self.assertEqual(sorted(job.payload['model'] for job in Job.objects.all()), ['product', 'variation'])
+
+    def test_nested_blocks_queue_with_the_outer_one(self):
+        with batch_image_processing():
+            self.add_image(self.product, sample_image(seed=1))
+            with batch_image_processing():
+                self.add_image(self.product, sample_image(seed=2))
+            self.assertFalse(Job.objects.exists())
+
+        self.assertEqual(len(Job.objects.get().payload['ids']), 2)
+
+    def test_nothing_queued_when_the_block_raises(self):
+        with self.assertRaises(RuntimeError):
+            with batch_image_processing():
+                self.add_image(self.product, sample_image())
+                raise RuntimeError
+
+        self.assertFalse(Job.objects.exists())
+        # Outside a block again: one job per image
+        self.add_image(self.product, sample_image(seed=1))
+        self.add_image(self.product, sample_image(seed=2))
+        self.assertEqual(Job.objects.count(), 2)
+
+    def test_batched_images_are_processed_together(self):
+        with batch_image_processing():
+            images = [self.add_image(self.product, sample_image(seed=seed)) for seed in range(3)]
+
+        self.assertEqual(run_pending(), 1)
+
+        states = ProductImage.objects.filter(pk__in=[image.pk for image in images]).values_list('processing_state', flat=True)
+        self.assertEqual(list(states), ['ready'] * 3)
+        self.assertEqual(ImageBlob.objects.count(), 3)
+
+
+class NearDuplicateImageTests(MediaTestCase):
+    def setUp(self):
+        super().setUp()
+        self.product = make_product(make_vendor())
+        self.other_product = make_product(make_vendor('other'), name='Tomatoes')
+        Job.objects.all().delete()
+
+    def test_near_duplicate_gets_its_own_blob(self):
+        original = self.add_image(self.product, block_image(seed=1))
+        run_pending()
+        # Another vendor's smaller copy of the same picture
+        copy = self.add_image(self.other_product, block_image(540, 480, seed=1, format='PNG'), name='copy.png')
+        run_pending()
+
+        original.refresh_from_db()
+        copy.refresh_from_db()
+        self.assertEqual(copy.blob.dhash, original.blob.dhash)
+        self.assertNotEqual(copy.blob_id, original.blob_id)
+        self.assertEqual((copy.blob.width, copy.image), (540, copy.blob.image))
+        self.assertEqual(copy.blob.near_duplicate_of, original.blob)
+        self.assertIsNone(original.blob.near_duplicate_of)
+
+    def test_near_duplicates_within_a_batch(self):
+        with batch_image_processing():
+            first = self.add_image(self.product, block_image(seed=1))
+            second = self.add_image(self.product, block_image(540, 480, seed=1, format='PNG'), name='copy.png')
+        run_pending()
+
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertNotEqual(second.blob_id, first.blob_id)
+        # Whichever of the two was handled first is the one the other is linked to
+        blobs = {first.blob, second.blob}
+        linked = [blob for blob in blobs if blob.near_duplicate_of]
+        self.assertEqual(len(linked), 1)
+        self.assertEqual(linked[0].near_duplicate_of, (blobs - set(linked)).pop())
+
+    def test_different_photos_are_not_linked(self):
+        self.add_image(self.product, block_image(seed=1))
+        self.add_image(self.product, block_image(seed=2))
+        run_pending()
+
+        self.assertFalse(ImageBlob.objects.filter(near_duplicate_of__isnull=False).exists())
+        self.assertEqual(ImageBlob.objects.count(), 2)
+
+
+def csv_upload(*lines):
+    return io.BytesIO('\n'.join(lines).encode('utf-8'))
+
+
+def jsonl_upload(*rows):
+    return io.BytesIO(''.join(json.dumps(row) + '\n' for row in rows).encode('utf-8'))
+
+
+class CatalogImportTests(TestCase):
+    def setUp(self):
+        self.vendor = make_vendor()
+        self.category = Category.objects.create(name='Vegetables')
+
+    def test_csv_creates_products_and_variations(self):
+        result = import_catalog(self.vendor, csv_upload(
+            'product,description,category,variation,unit_price,stock',
+            'Tomato,Red,Vegetables,1kg,80,10',
+            'Tomato,,Vegetables,500g,45.5,3',
+            'Onion,White,,1kg,60,0',
+        ))
+
+        self.assertEqual(result.errors, [])
+        self.assertEqual(result.counts(), (2, 0, 3, 0))
+        tomato = Product.objects.get(name='Tomato')
+        self.assertEqual((tomato.vendor, tomato.category, tomato.status), (self.vendor, self.category, 'hidden'))
+        variations = {variation.name: variation for variation in tomato.variations.all()}
+        self.assertEqual(variations['500g'].unit_price, Decimal('45.50'))
+        self.assertEqual(variations['500g'].stock, 3)
+        # The first variation of a product becomes its default
+        self.assertEqual([name for name, variation in variations.items() if variation.is_default], ['1kg'])
+        self.assertIsNone(Product.objects.get(name='Onion').category)
+
+    def test_jsonl_input(self):
+        result = import_catalog(self.vendor, jsonl_upload(
+            {'product': 'Tomato', 'category': 'Vegetables', 'variation': '1kg', 'unit_price': 80, 'stock': 10},
+            {'product': 'Tomato', 'variation': '500g', 'unit_price': '45.50', 'is_default': True, 'is_available': False},
+        ), format='jsonl')
+
+        self.assertEqual(result.errors, [])
+        self.assertEqual(result.counts(), (1, 0, 2, 0))
+        half = ProductVariation.objects.get(name='500g')
+        # Marked default in the file, so the first variation isn't made the default
+        self.assertEqual((half.is_default, half.is_available), (True, False))
+        self.assertFalse(ProductVariation.objects.get(name='1kg').is_default)
+
+    def test_invalid_rows_are_reported_with_their_line(self):
+        result = import_catalog(self.vendor, csv_upload(
+            'product,category,variation,unit_price,stock',
+            'Tomato,Vegetables,1kg,80,10',
+            'Tomato,Vegetables,2kg,cheap,10',
+            'Carrot,Fruit,1kg,50,10',
+            ',Vegetables,1kg,50,10',
+            'Onion,,1kg,60,-1',
+            'Onion,,500g,30,5',
+        ))
+
+        self.assertEqual(result.errors, [
+            {'line': 3, 'error': 'unit_price must be a number.'},
+            {'line': 5, 'error': 'product is required.'},
+            {'line': 6, 'error': 'stock cannot be negative.'},
+            {'line': 4, 'error': 'Unknown category "Fruit".'},
+        ])
+        # The rest of the file is imported
+        self.assertEqual(result.rows, 6)
+        self.assertEqual(
+            sorted(ProductVariation.objects.values_list('product__name', 'name')), [('Onion', '500g'), ('Tomato', '1kg')]
+        )
+
+    def test_invalid_jsonl_lines_are_reported(self):
+        upload = io.BytesIO(b'{"product": "Tomato", "variation": "1kg", "unit_price": 80}\nnot json\n\n[1, 2]\n')
+
+        result = import_catalog(self.vendor, upload, format='jsonl')
+
+        self.assertEqual([error['line'] for error in result.errors], [2, 4])
+        self.assertTrue(result.errors[0]['error'].startswith('Invalid JSON'))
+        self.assertEqual(result.errors[1]['error'], 'Each line must be a JSON object.')
+        self.assertEqual(result.created_variations, 1)
+
+    def test_reimport_updates_only_what_changed(self):
+        lines = [
+            'product,slug,description,category,variation,unit_price,stock',
+            'Tomato,tomato,Red,Vegetables,1kg,80,10',
+            'Tomato,tomato,,Vegetables,500g,45,3',
+        ]
+        import_catalog(self.vendor, csv_upload(*lines))
+        unchanged = ProductVariation.objects.get(name='1kg')
+
+        result = import_catalog(self.vendor, csv_upload(*lines))
+        self.assertEqual(result.counts(), (0, 0, 0, 0))
+
+        lines[2] = 'Tomato,tomato,,Vegetables,500g,50,3'
+        with CaptureQueriesContext(connection) as queries:
+            result = import_catalog(self.vendor, csv_upload(*lines))
+
+        self.assertEqual(result.counts(), (0, 0, 0, 1))
+        self.assertEqual(ProductVariation.objects.get(name='500g').unit_price, Decimal('50.00'))
+        self.assertEqual(ProductVariation.objects.get(name='1kg').updated_at, unchanged.updated_at)
+        updates = [query['sql'] for query in queries.captured_queries if query['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 1)
+        self.assertIn('"unit_price"', updates[0])
+        self.assertNotIn('"stock"', updates[0])
+        self.assertEqual(Product.objects.count(), 1)
+
+    def test_reimport_updates_product_fields(self):
+        other = Category.objects.create(name='Fruits')
+        import_catalog(self.vendor, csv_upload('product,category,variation,unit_price', 'Tomato,Vegetables,1kg,80'))
+
+        result = import_catalog(self.vendor, csv_upload(
+            'product,category,status,variation,unit_price', 'Tomato,Fruits,published,1kg,80',
+        ))
+
+        self.assertEqual(result.counts(), (0, 1, 0, 0))
+        tomato = Product.objects.get()
+        self.assertEqual((tomato.category, tomato.status), (other, 'published'))
+
+    def test_slugs_avoid_taken_ones(self):
+        make_product(make_vendor('other'), name='Tomato')  # slug "tomato"
+
+        result = import_catalog(self.vendor, csv_upload(
+            'product,slug,variation,unit_price',
+            'Tomato,,1kg,80',
+            'Cherry tomato,tomato,1kg,120',
+            'Onion,onion,1kg,60',
+        ))
+
+        self.assertEqual(result.errors, [])
+        slugs = dict(Product.objects.filter(vendor=self.vendor).values_list('name', 'slug'))
+        self.assertEqual(slugs['Onion'], 'onion')
+        self.assertEqual(slugs['Tomato'], 'tomato-1')
+        # The requested slug belongs to another vendor's product: one is allocated from the name instead
+        self.assertEqual(slugs['Cherry tomato'], 'cherry-tomato')
+
+    def test_failed_batch_is_rolled_back_alone(self):
+        save_variations = CatalogImporter.save_variations
+        calls = []
+
+        def failing_second_batch(importer, batch, products):
+            calls.append(batch)
+            changed = save_variations(importer, batch, products)
+            if len(calls) == 2:
+                raise IntegrityError('duplicate key value violates unique constraint')
+            return changed
+
+        with mock.patch.object(CatalogImporter, 'save_variations', failing_second_batch):
+            result = import_catalog(self.vendor, csv_upload(
+                'product,variation,unit_price',
+                'Tomato,1kg,80',
+                'Onion,1kg,60',
+                'Carrot,1kg,50',
+                'Potato,1kg,40',
+                'Garlic,1kg,200',
+            ), batch_size=2)
+
+        self.assertEqual(sorted(Product.objects.values_list('name', flat=True)), ['Garlic', 'Onion', 'Tomato'])
+        self.assertEqual(ProductVariation.objects.count(), 3)
+        # The failed batch's rows don't count as imported
+        self.assertEqual(result.counts(), (3, 0, 3, 0))
+        self.assertEqual([error['line'] for error in result.errors], [4, 5])
+        self.assertTrue(all(error['error'].startswith('Not imported, its batch failed') for error in result.errors))
+
+
+class InventoryUpdateTests(TestCase):
+    def setUp(self):
+        self.vendor = make_vendor()
+        self.product = make_product(self.vendor)
+        self.kilo = ProductVariation.objects.create(product=self.product, name='1kg', unit_price='80.00', stock=5)
+        self.half = ProductVariation.objects.create(product=self.product, name='500g', unit_price='45.00', stock=2)
+
+    def update(self, *changes, vendor=None):
+        return apply_inventory_updates(vendor or self.vendor, list(enumerate(changes, start=1)))
+
+    def test_selling_out_every_variation_flips_the_product(self):
+        self.update({'variation_id': str(self.kilo.id), 'stock': 0})
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.status, 'published')
+
+        summary = self.update({'slug': self.product.slug, 'variation': '500g', 'stock': 0})
+
+        self.assertEqual(summary, {'updated': 1, 'unchanged': 0, 'out_of_stock': 1, 'products_changed_status': 1})
+        self.product.refresh_from_db()
+        self.half.refresh_from_db()
+        self.assertEqual(self.product.status, 'out_of_stock')
+        self.assertEqual((self.half.stock, self.half.is_available, self.half.status), (0, False, 'out_of_stock'))
+
+    def test_restocking_flips_the_product_back(self):
+        self.update({'variation_id': str(self.kilo.id), 'stock': 0}, {'variation_id': str(self.half.id), 'stock': 0})
+
+        summary = self.update({'variation_id': str(self.half.id), 'stock': 7})
+
+        self.assertEqual(summary['products_changed_status'], 1)
+        self.product.refresh_from_db()
+        self.half.refresh_from_db()
+        self.assertEqual(self.product.status, 'published')
+        self.assertEqual((self.half.stock, self.half.is_available, self.half.status), (7, True, 'published'))
+
+    def test_hidden_product_is_not_published_by_a_restock(self):
+        self.update({'variation_id': str(self.kilo.id), 'stock': 0}, {'variation_id': str(self.half.id), 'stock': 0})
+        Product.objects.filter(pk=self.product.pk).update(status='hidden')
+
+        self.update({'variation_id': str(self.half.id), 'stock': 7})
+
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.status, 'hidden')
+
+    def test_any_invalid_change_rejects_the_whole_batch(self):
+        with self.assertRaises(InventoryUpdateError) as raised:
+            self.update(
+                {'variation_id': str(self.kilo.id), 'stock': 50},
+                {'variation_id': str(self.half.id), 'unit_price': 'free'},
+                {'variation_id': str(uuid.uuid4()), 'stock': 1},
+                {'variation_id': str(self.half.id)},
+            )
+
+        self.assertEqual(raised.exception.errors, [
+            {'line': 2, 'error': 'unit_price must be a number.'},
+            {'line': 3, 'error': 'Unknown variation.'},
+            {'line': 4, 'error': 'Nothing to change: give stock, unit_price or is_available.'},
+        ])
+        self.kilo.refresh_from_db()
+        self.assertEqual(self.kilo.stock, 5)
+
+    def test_same_variation_twice_is_rejected(self):
+        with self.assertRaises(InventoryUpdateError) as raised:
+            self.update(
+                {'variation_id': str(self.kilo.id), 'stock': 50},
+                {'variation_id': str(self.half.id), 'stock': 1},
+                # The same one by slug and name
+                {'slug': self.product.slug, 'variation': '1kg', 'stock': 60},
+            )
+
+        self.assertEqual(raised.exception.errors, [{'line': 3, 'error': 'Same variation as line 1.'}])
+        self.half.refresh_from_db()
+        self.assertEqual(self.half.stock, 2)
+
+    def test_other_vendors_variations_are_unknown(self):
+        other = make_product(make_vendor('other'), name='Onion')
+        theirs = ProductVariation.objects.create(product=other, name='1kg', unit_price='60.00', stock=5)
+
+        with self.assertRaises(InventoryUpdateError) as raised:
+            self.update(
+                {'variation_id': str(theirs.id), 'stock': 0},
+                {'slug': other.slug, 'variation': '1kg', 'stock': 0},
+            )
+
+        self.assertEqual([error['error'] for error in raised.exception.errors], ['Unknown variation.'] * 2)
+        theirs.refresh_from_db()
+        self.assertEqual(theirs.stock, 5)
+        # Their owner can
+        self.assertEqual(self.update({'variation_id': str(theirs.id), 'stock': 0}, vendor=other.vendor)['updated'], 1)
+
+    def test_csv_diff_leaves_blank_cells_alone(self):
+        rows = read_changes(csv_upload(
+            'variation_id,stock,unit_price',
+            f'{self.kilo.id},9,',
+            f'{self.half.id},,50',
+        ), 'csv')
+
+        summary = apply_inventory_updates(self.vendor, rows)
+
+        self.assertEqual(summary['updated'], 2)
+        self.kilo.refresh_from_db()
+        self.half.refresh_from_db()
+        self.assertEqual((self.kilo.stock, self.kilo.unit_price), (9, Decimal('80.00')))
+        self.assertEqual((self.half.stock, self.half.unit_price), (2, Decimal('50.00')))
+
+
+def table_queries(queries, table):
+    """The captured statements reading or writing `table`."""
+    statements = [query['sql'] for query in queries]
+    return [
+        sql for sql in statements
+        if sql.startswith(f'UPDATE "{table}"') or (sql.startswith('SELECT') and f' FROM "{table}"' in sql)
+    ]
+
+
+class DirtyFieldsTests(TestCase):
+    def setUp(self):
+        # Loaded from the database, as views and jobs get their rows
+        self.product = Product.objects.get(pk=make_product(make_vendor(), description='Red').pk)
+        Job.objects.all().delete()
+
+    def capture_post_save(self):
+        """(changed fields, loaded name, update_fields) seen by post_save receivers of Product."""
+        calls = []
+
+        def receiver(sender, instance, update_fields=None, **kwargs):
+            calls.append((instance.changed_fields, instance.loaded_value('name'), update_fields))
+
+        post_save.connect(receiver, sender=Product, weak=False)
+        self.addCleanup(post_save.disconnect, receiver, sender=Product)
+        return calls
+
+    def test_unchanged_save_is_skipped(self):
+        calls = self.capture_post_save()
+        updated_at = self.product.updated_at
+
+        with self.assertNumQueries(0):
+            self.product.save()
+
+        self.assertEqual(calls, [])
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.updated_at, updated_at)
+
+    def test_save_writes_only_the_changed_columns(self):
+        calls = self.capture_post_save()
+        self.product.description = 'Green'
+
+        with CaptureQueriesContext(connection) as queries:
+            self.product.save()
+
+        # No SELECT: the name didn't change, so the slug isn't allocated again
+        [update] = table_queries(queries, 'products_product')
+        self.assertTrue(update.startswith('UPDATE'))
+        self.assertIn('"description"', update)
+        self.assertIn('"updated_at"', update)
+        self.assertNotIn('"name"', update)
+        self.assertEqual([update_fields for _, _, update_fields in calls], [{'description', 'updated_at'}])
+        self.assertEqual(Product.objects.get(pk=self.product.pk).description, 'Green')
+
+    def test_new_row_is_clean_once_saved(self):
+        product = Product(vendor=self.product.vendor, name='Onion', description='White')
+        self.assertIn('name', product.changed_fields)
+        product.save()
+
+        self.assertEqual(product.changed_fields, set())
+        with self.assertNumQueries(0):
+            product.save()
+
+    def test_explicit_update_fields_snapshot_only_those_fields(self):
+        self.product.name = 'Cherry tomato'
+        self.product.description = 'Green'
+
+        self.product.save(update_fields=['description'])
+
+        self.assertFalse(self.product.has_changed('description'))
+        self.assertTrue(self.product.has_changed('name'))
+        self.assertEqual(self.product.loaded_value('name'), 'Tomato')
+        self.assertEqual(Product.objects.get(pk=self.product.pk).name, 'Tomato')
+
+    def test_explicit_update_fields_save_always_runs(self):
+        calls = self.capture_post_save()
+
+        with self.assertNumQueries(1):
+            self.product.save(update_fields=['status'])
+
+        self.assertEqual(len(calls), 1)
+
+    def test_post_save_sees_the_values_from_before_the_save(self):
+        calls = self.capture_post_save()
+        self.product.name = 'Cherry tomato'
+
+        self.product.save()
+
+        changed, loaded_name, _ = calls[0]
+        self.assertIn('name', changed)
+        self.assertEqual(loaded_name, 'Tomato')
+        # Snapshot taken once the receivers ran
+        self.assertEqual(self.product.changed_fields, set())
+        self.assertEqual(self.product.loaded_value('name'), 'Cherry tomato')
+        self.assertEqual(self.product.slug, 'cherry-tomato')
+
+    def test_content_refresh_only_for_text_changes(self):
+        self.product.is_available = False
+        self.product.save()
+        self.assertFalse(Job.objects.exists())
+
+        self.product.name = 'Cherry tomato'
+        self.product.save()
+        job = Job.objects.get()
+        self.assertEqual((job.name, job.payload), ('products.refresh_content_neighbors', {'ids': [str(self.product.id)]}))
+
+    def test_deferred_fields_count_as_changed_once_assigned(self):
+        product = Product.objects.only('id', 'name').get(pk=self.product.pk)
+        self.assertEqual(product.changed_fields, set())
+
+        product.description = 'Green'
+
+        self.assertTrue(product.has_changed('description'))
+        product.save()
+        self.assertEqual(Product.objects.get(pk=product.pk).description, 'Green')
+
+    def test_refresh_from_db_takes_a_new_snapshot(self):
+        Product.objects.filter(pk=self.product.pk).update(description='Green')
+        self.product.refresh_from_db()
+
+        self.assertEqual(self.product.loaded_value('description'), 'Green')
+        with self.assertNumQueries(0):
+            self.product.save()
+
+    def test_category_save_without_name_change_reads_nothing(self):
+        category = Category.objects.get(pk=Category.objects.create(name='Vegetables').pk)
+        category.description = 'Leafy and otherwise'
+
+        with CaptureQueriesContext(connection) as queries:
+            category.save()
+
+        # Its receivers aside, just the UPDATE: the name isn't read back to compare
+        [update] = table_queries(queries, 'products_category')
+        self.assertTrue(update.startswith('UPDATE'))
+
+        category.name = 'Greens'
+        category.save()
+        self.assertEqual(category.slug, 'greens')
+
+    def test_user_save_keeps_its_username(self):
+        user = CustomUser.objects.get(pk=self.product.vendor_id)
+        user.contact_no = '9179999999'
+
+        # No uniqueness check of the unchanged username, which used to rename the user
+        with CaptureQueriesContext(connection) as queries:
+            user.save()
+
+        [update] = table_queries(queries, 'users_customuser')
+        self.assertTrue(update.startswith('UPDATE'))
+
+        user.refresh_from_db()
+        self.assertEqual(user.username, 'farmer')
+
+    def test_changed_username_is_made_unique(self):
+        make_vendor('alice')
+        user = CustomUser.objects.get(pk=self.product.vendor_id)
+
+        user.username = 'alice'
+        user.save()
+
+        self.assertEqual(user.username, 'alice1')
+
+
+def make_buyer(username='buyer'):
+    return CustomUser.objects.create_user(
+        email=f'{username}@example.com', username=username, contact_no=str(next(contact_numbers)), role='buyer',
+    )
+
+
+class ReviewAggregateTests(TestCase):
+    def setUp(self):
+        vendor = make_vendor()
+        # The listing summaries are written once the product's transaction commits
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product = make_product(vendor)
+            self.other_product = make_product(vendor, name='Onion')
+
+    def review(self, rating, product=None, buyer=None):
+        buyer = buyer or make_buyer(f'buyer{next(contact_numbers)}')
+        return Review.objects.create(product=product or self.product, buyer=buyer, rating=rating, comment='Fresh')
+
+    def aggregate(self, product=None):
+        return ReviewAggregate.objects.get(product=product or self.product)
+
+    def assertAggregate(self, product, count, total, stars):
+        aggregate = self.aggregate(product)
+        self.assertEqual((aggregate.review_count, aggregate.rating_total), (count, total))
+        self.assertEqual(aggregate.histogram, {str(star): stars.get(star, 0) for star in range(1, 6)})
+
+    def test_reviews_are_counted(self):
+        self.review(5)
+        self.review(3)
+
+        self.assertAggregate(self.product, 2, 8, {5: 1, 3: 1})
+        self.assertEqual(self.aggregate().average, 4)
+        summary = ProductListingSummary.objects.get(product=self.product)
+        self.assertEqual((summary.average_rating, summary.review_count), (Decimal('4.00'), 2))
+
+    def test_rating_change_moves_the_review_between_stars(self):
+        review = self.review(5)
+        self.review(4)
+
+        review = Review.objects.get(pk=review.pk)
+        review.rating = 2
+        review.save()
+
+        self.assertAggregate(self.product, 2, 6, {4: 1, 2: 1})
+
+    def test_unchanged_save_counts_nothing(self):
+        review = Review.objects.get(pk=self.review(5).pk)
+        review.comment = 'Still fresh'
+        review.save()
+        review.save()
+
+        self.assertAggregate(self.product, 1, 5, {5: 1})
+
+    def test_moving_a_review_adjusts_both_products(self):
+        review = Review.objects.get(pk=self.review(5).pk)
+        self.review(3)
+
+        review.product = self.other_product
+        review.rating = 4
+        review.save()
+
+        self.assertAggregate(self.product, 1, 3, {3: 1})
+        self.assertAggregate(self.other_product, 1, 4, {4: 1})
+        summary = ProductListingSummary.objects.get(product=self.product)
+        self.assertEqual((summary.average_rating, summary.review_count), (Decimal('3.00'), 1))
+
+    def test_delete_removes_the_stored_rating(self):
+        review = Review.objects.get(pk=self.review(5).pk)
+        self.review(2)
+
+        # Changed in memory only: the aggregate counted the stored 5
+        review.rating = 1
+        review.delete()
+
+        self.assertAggregate(self.product, 1, 2, {2: 1})
+
+    def test_last_review_deleted(self):
+        self.review(5).delete()
+
+        self.assertAggregate(self.product, 0, 0, {})
+        self.assertIsNone(self.aggregate().average)
+
+    def test_rebuild_matches_the_incremental_aggregates(self):
+        self.review(5)
+        self.review(1)
+        self.review(4, product=self.other_product)
+        incremental = {aggregate.product_id: aggregate.histogram for aggregate in ReviewAggregate.objects.all()}
+        ReviewAggregate.objects.all().delete()
+
+        self.assertEqual(rebuild_review_aggregates(), 2)
+
+        self.assertEqual(
+            {aggregate.product_id: aggregate.histogram for aggregate in ReviewAggregate.objects.all()}, incremental
+        )
+        self.assertAggregate(self.product, 2, 6, {5: 1, 1: 1})
+
+
+# core.urls ends up with only the health check, so route the app's own URLs
+@override_settings(ROOT_URLCONF='products.urls')
+class ProductReviewsViewTests(TestCase):
+    def setUp(self):
+        self.vendor = make_vendor()
+        self.product = make_product(self.vendor)
+        self.buyer = make_buyer()
+        self.client = APIClient()
+        self.url = reverse('product-reviews', kwargs={'slug': self.product.slug})
+
+    def post_review(self, user, rating=5):
+        self.client.force_authenticate(user)
+        return self.client.post(self.url, {'rating': rating, 'comment': 'Fresh'}, format='json')
+
+    def test_review_is_created_with_the_new_rating(self):
+        response = self.post_review(self.buyer, rating=4)
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['review']['buyer'], self.buyer.id)
+        self.assertEqual(response.data['rating']['count'], 1)
+        self.assertEqual(response.data['rating']['average'], 4)
+
+    def test_second_review_of_a_buyer_is_rejected(self):
+        self.post_review(self.buyer, rating=4)
+
+        response = self.post_review(self.buyer, rating=1)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data, {'error': 'You have already reviewed this product.'})
+        self.assertEqual(Review.objects.count(), 1)
+        self.assertEqual(ReviewAggregate.objects.get(product=self.product).rating_total, 4)
+
+    def test_vendor_cannot_review_their_own_product(self):
+        response = self.post_review(self.vendor)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Review.objects.exists())
+
+    def test_anonymous_review_is_rejected(self):
+        response = self.client.post(self.url, {'rating': 5, 'comment': 'Fresh'}, format='json')
+
+        self.assertEqual(response.status_code, 401)
+
+
+@override_settings(ROOT_URLCONF='products.urls', CATALOG_CACHE_ENABLED=True)
+class CatalogCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product = make_product(make_vendor())
+            self.variation = ProductVariation.objects.create(
+                product=self.product, name='1kg', unit_price='10.00', stock=5,
+            )
+        self.client = APIClient()
+        self.detail_url = reverse('product-detail', kwargs={'slug': self.product.slug})
+
+    def test_repeated_request_is_a_hit(self):
+        self.assertEqual(self.client.get(self.detail_url)['X-Cache'], 'MISS')
+
+        response = self.client.get(self.detail_url)
+
+        self.assertEqual(response['X-Cache'], 'HIT')
+        self.assertEqual(response.data['product']['id'], str(self.product.id))
+
+    def test_product_write_invalidates_the_detail(self):
+        self.client.get(self.detail_url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.description = 'Vine ripened'
+            self.product.save()
+        response = self.client.get(self.detail_url)
+
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['product']['description'], 'Vine ripened')
+
+    def test_variation_write_invalidates_the_lists(self):
+        url = reverse('landing-products')
+        self.assertEqual(self.client.get(url).data['results'][0]['min_price'], '10.00')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.variation.unit_price = Decimal('8.00')
+            self.variation.save()
+        response = self.client.get(url)
+
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['results'][0]['min_price'], '8.00')
+
+    @override_settings(CATALOG_CACHE_ENABLED=False)
+    def test_disabled_cache_is_bypassed(self):
+        self.client.get(self.detail_url)
+
+        self.assertNotIn('X-Cache', self.client.get(self.detail_url))
+
+
+@override_settings(FRAGMENT_CACHE_ENABLED=True)
+class FragmentCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product = make_product(make_vendor())
+            self.variation = ProductVariation.objects.create(
+                product=self.product, name='1kg', unit_price='10.00', stock=5,
+            )
+
+    def serialize(self):
+        # A new serializer and loaders each time, as in separate requests
+        serializer = ProductSerializer(self.product, context={})
+        return serializer.fragment_key(self.product), serializer.data
+
+    def test_unchanged_product_is_read_from_the_cache(self):
+        key, data = self.serialize()
+        # Not through the ORM signals: nothing bumps the version
+        ProductVariation.objects.filter(pk=self.variation.pk).update(stock=1)
+
+        self.assertEqual(self.serialize(), (key, data))
+        self.assertEqual(cache.get(key), data)
+
+    def test_variation_write_changes_the_fragment(self):
+        key, data = self.serialize()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.variation.stock = 0
+            self.variation.save()
+        new_key, new_data = self.serialize()
+
+        self.assertNotEqual(new_key, key)
+        self.assertEqual(data['variations'][0]['stock'], 5)
+        self.assertEqual(new_data['variations'][0]['stock'], 0)
+
+    def test_image_write_changes_the_fragment(self):
+        key, data = self.serialize()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            image = ProductImage.objects.create(
+                product=self.product, image='https://example.com/tomato.jpg', processing_state='ready',
+            )
+        new_key, new_data = self.serialize()
+
+        self.assertNotEqual(new_key, key)
+        self.assertEqual(data['images'], [])
+        self.assertEqual([item['id'] for item in new_data['images']], [str(image.id)])
+
+    @override_settings(FRAGMENT_CACHE_ENABLED=False)
+    def test_disabled_cache_is_bypassed(self):
+        self.serialize()
+        ProductVariation.objects.filter(pk=self.variation.pk).update(stock=1)
+
+        self.assertEqual(self.serialize()[1]['variations'][0]['stock'], 1)
+
+
+@override_settings(ROOT_URLCONF='products.urls')
+class ConditionalResponseTests(TestCase):
+    def setUp(self):
+        vendor = make_vendor()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.kept = make_product(vendor, name='Tomato')
+            self.deleted = make_product(vendor, name='Eggplant')
+            self.variation = ProductVariation.objects.create(product=self.kept, name='1kg', unit_price='10.00')
+        self.client = APIClient()
+        self.url = reverse('landing-products')
+
+    def test_unchanged_list_is_not_modified(self):
+        etag = self.client.get(self.url)['ETag']
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 304)
+
+    def test_deleted_product_is_revalidated(self):
+        response = self.client.get(self.url)
+        self.assertEqual(len(response.data['results']), 2)
+        # Deleting moves no max(updated_at): a date validator would stay the same
+        self.assertNotIn('Last-Modified', response)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.deleted.delete()
+        by_etag = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        by_date = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=http_date(timezone.now().timestamp() + 60))
+
+        self.assertEqual(by_etag.status_code, 200)
+        self.assertEqual([item['id'] for item in by_etag.data['results']], [str(self.kept.id)])
+        self.assertEqual(by_date.status_code, 200)
+
+    def test_deleted_variation_is_revalidated_on_the_detail(self):
+        url = reverse('product-detail', kwargs={'slug': self.kept.slug})
+        etag = self.client.get(url)['ETag']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.variation.delete()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['product']['variations'], [])
+
+
+class CategorySyncTests(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name='Vegetables')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product = make_product(make_vendor(), category=self.category)
+        Job.objects.all().delete()
+
+    def test_rename_is_copied_to_the_read_models(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            self.category.name = 'Greens'
+            self.category.save()
+
+        self.assertEqual(ProductListingSummary.objects.get(product=self.product).category_name, 'Greens')
+        self.assertEqual(ProductSearchDocument.objects.get(product=self.product).category_name, 'Greens')
+        self.assertEqual(len(callbacks), 1)  # The version bump
+        self.assertTrue(Job.objects.filter(name='products.refresh_content_neighbors').exists())
+
+    def test_other_changes_leave_the_read_models_alone(self):
+        self.category.description = 'Leafy and root'
+        with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks() as callbacks:
+            self.category.save()
+
+        self.assertEqual(table_queries(queries, 'products_productlistingsummary'), [])
+        self.assertEqual(table_queries(queries, 'products_productsearchdocument'), [])
+        self.assertEqual(callbacks, [])
+        self.assertFalse(Job.objects.exists())
+
+
+class VendorSyncTests(TestCase):
+    def setUp(self):
+        self.vendor = CustomUser.objects.get(pk=make_vendor().pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product = make_product(self.vendor)
+
+    def test_rename_is_copied_to_the_summaries(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            self.vendor.username = 'grower'
+            self.vendor.save()
+
+        self.assertEqual(ProductListingSummary.objects.get(product=self.product).vendor_name, 'grower')
+        self.assertEqual(len(callbacks), 1)  # The version bump
+
+    def test_login_leaves_the_summaries_alone(self):
+        self.vendor.last_login = timezone.now()
+        with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks() as callbacks:
+            self.vendor.save(update_fields=['last_login'])
+
+        self.assertEqual(table_queries(queries, 'products_productlistingsummary'), [])
+        self.assertEqual(callbacks, [])
+
+    def test_new_user_leaves_the_summaries_alone(self):
+        with CaptureQueriesContext(connection) as queries:
+            make_buyer()
+
+        self.assertEqual(table_queries(queries, 'products_productlistingsummary'), [])
+
+
+@override_settings(ROOT_URLCONF='products.urls', PRODUCT_PAGE_SIZE=2)
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        vendor = make_vendor()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.products = [make_product(vendor, name=f'Product {number}') for number in range(5)]
+        # Newest first: product 4 down to product 0
+        self.start = timezone.now() - timedelta(hours=1)
+        for number, product in enumerate(self.products):
+            self.set_created_at(product, self.start + timedelta(minutes=number))
+        self.client = APIClient()
+
+    def set_created_at(self, product, created_at):
+        Product.objects.filter(pk=product.pk).update(created_at=created_at)
+        ProductListingSummary.objects.filter(pk=product.pk).update(created_at=created_at)
+
+    def names(self, response):
+        self.assertEqual(response.status_code, 200)
+        return [item['name'] for item in response.data['results']]
+
+    def test_lists_are_paginated_by_default(self):
+        for name in ('all-products', 'landing-products'):
+            with self.subTest(name):
+                response = self.client.get(reverse(name))
+
+                self.assertEqual(self.names(response), ['Product 4', 'Product 3'])
+                self.assertIsNone(response.data['previous'])
+                self.assertIsNotNone(response.data['next'])
+
+    def test_forward_and_back(self):
+        first = self.client.get(reverse('landing-products'))
+        second = self.client.get(first.data['next'])
+        third = self.client.get(second.data['next'])
+
+        self.assertEqual(self.names(second), ['Product 2', 'Product 1'])
+        self.assertEqual(self.names(third), ['Product 0'])
+        self.assertIsNone(third.data['next'])
+        self.assertEqual(self.names(self.client.get(third.data['previous'])), ['Product 2', 'Product 1'])
+        back = self.client.get(second.data['previous'])
+        self.assertEqual(self.names(back), ['Product 4', 'Product 3'])
+        self.assertIsNone(back.data['previous'])
+
+    def test_insert_while_paging_doesnt_shift_pages(self):
+        first = self.client.get(reverse('landing-products'))
+        with self.captureOnCommitCallbacks(execute=True):
+            newest = make_product(self.products[0].vendor, name='Product 5')
+        self.set_created_at(newest, self.start + timedelta(minutes=10))
+
+        self.assertEqual(self.names(self.client.get(reverse('landing-products'))), ['Product 5', 'Product 4'])
+        self.assertEqual(self.names(self.client.get(first.data['next'])), ['Product 2', 'Product 1'])
+
+    def test_ties_on_created_at_are_broken_by_id(self):
+        created_at = timezone.now()
+        Product.objects.update(created_at=created_at)
+        ProductListingSummary.objects.update(created_at=created_at)
+        expected = [str(product.pk) for product in sorted(self.products, key=lambda product: product.pk, reverse=True)]
+
+        ids, url = [], reverse('landing-products')
+        while url:
+            response = self.client.get(url)
+            ids += [item['id'] for item in response.data['results']]
+            url = response.data['next']
+
+        self.assertEqual(ids, expected)
+
+    def test_page_size_is_capped(self):
+        with self.settings(PRODUCT_MAX_PAGE_SIZE=3):
+            response = self.client.get(reverse('landing-products'), {'page_size': 50})
+
+        self.assertEqual(len(response.data['results']), 3)
+
+    def test_malformed_cursor_is_a_bad_request(self):
+        for cursor in ('not-base64!', 'bm90IGpzb24', 'WzFd', 'eyJjIjoxLCJpIjoyfQ'):
+            with self.subTest(cursor):
+                response = self.client.get(reverse('landing-products'), {'cursor': cursor})
+
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.data, {'cursor': ['Invalid cursor']})
+
+
+@override_settings(ROOT_URLCONF='products.urls')
+class SearchTests(TestCase):
+    def setUp(self):
+        vendor = make_vendor()
+        vegetables = Category.objects.create(name='Vegetables')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tomato = make_product(vendor, name='Tomato', category=vegetables, description='Red and ripe')
+            self.sauce = make_product(vendor, name='Pasta sauce', description='Made from tomato and garlic')
+            self.jam = make_product(vendor, name="O'Neil farm jam", description='Strawberry')
+            self.hidden = make_product(vendor, name='Tomato seedlings', status='hidden')
+            ProductVariation.objects.create(product=self.jam, name='Jar 250g', unit_price='120.00')
+
+    def search(self, query, **kwargs):
+        return [product_id for product_id, rank in search_products(query, **kwargs)]
+
+    def test_name_match_ranks_above_description_match(self):
+        self.assertEqual(self.search('tomato'), [self.tomato.id, self.sauce.id])
+
+    def test_terms_are_prefix_matched_and_all_required(self):
+        self.assertEqual(self.search('tom'), [self.tomato.id, self.sauce.id])
+        self.assertEqual(self.search('tom garl'), [self.sauce.id])
+        self.assertEqual(self.search('jar'), [self.jam.id])
+        self.assertEqual(self.search('veget'), [self.tomato.id])
+
+    def test_status_is_filtered(self):
+        self.assertEqual(self.search('seedlings'), [])
+        self.assertEqual(self.search('seedlings', status='hidden'), [self.hidden.id])
+
+    def test_quotes_and_operators_are_plain_text(self):
+        self.assertEqual(self.search('"tomato'), [self.tomato.id, self.sauce.id])
+        self.assertEqual(self.search('tomato"*'), [self.tomato.id, self.sauce.id])
+        # Not a boolean query: "or" and "not" are terms that no document has
+        self.assertEqual(self.search('tomato OR jam NOT'), [])
+        self.assertEqual(self.search('tomato AND (garlic'), [self.sauce.id])
+        self.assertEqual(self.search("o'neil"), [self.jam.id])
+        self.assertEqual(self.search('"" * -'), [])
+
+    def test_fallback_backend(self):
+        with mock.patch('products.search.get_backend', return_value=FallbackSearchBackend()):
+            # Substring matches, ordered by name
+            self.assertEqual(self.search('tomato'), [self.sauce.id, self.tomato.id])
+            self.assertEqual(self.search('tom garl'), [self.sauce.id])
+            self.assertEqual(self.search("o'neil"), [self.jam.id])
+            self.assertEqual(self.search('tomato OR jam NOT'), [])
+
+    def test_endpoint_pages_the_hits(self):
+        url = reverse('product-search')
+
+        first = self.client.get(url, {'q': 'tom', 'page_size': 1})
+        second = self.client.get(first.data['next'])
+
+        self.assertEqual([item['id'] for item in first.data['results']], [str(self.tomato.id)])
+        self.assertGreater(first.data['results'][0]['rank'], 0)
+        self.assertEqual([item['id'] for item in second.data['results']], [str(self.sauce.id)])
+        self.assertIsNone(second.data['next'])
+
+    def test_endpoint_requires_a_query(self):
+        self.assertEqual(self.client.get(reverse('product-search'), {'q': ' '}).status_code, 400)
+
+
+@override_settings(ROOT_URLCONF='products.urls')
+class FacetTests(TestCase):
+    def setUp(self):
+        north, south, abroad = make_vendor('north'), make_vendor('south'), make_vendor('abroad')
+        Address.objects.create(user=north, region='III', province='Bulacan', city='Malolos', barangay='Atlag')
+        Address.objects.create(user=south, region='IV-A', province='Batangas', city='Lipa', barangay='Marawoy')
+        self.vegetables = Category.objects.create(name='Vegetables')
+        self.fruits = Category.objects.create(name='Fruits')
+        with self.captureOnCommitCallbacks(execute=True):
+            for vendor, name, category, price, stock in [
+                (north, 'Tomato', self.vegetables, '40.00', 5),
+                (south, 'Eggplant', self.vegetables, '80.00', 0),
+                (south, 'Mango', self.fruits, '120.00', 3),
+                (north, 'Banana', self.fruits, '30.00', 2),
+                (abroad, 'Honey', None, '600.00', 1),
+                (south, 'Squash', self.vegetables, None, 0),
+            ]:
+                product = make_product(vendor, name=name, category=category)
+                if price:
+                    ProductVariation.objects.create(product=product, name='1kg', unit_price=price, stock=stock)
+
+    def filters(self, **params):
+        return parse_facet_filters(params)
+
+    def assertCountsMatchFilteredQuerysets(self, filters):
+        summaries = ProductListingSummary.objects.all()
+        facets = compute_facets(summaries, filters)
+        for dimension in FACET_DIMENSIONS:
+            for entry in facets[dimension]:
+                # Picking that value instead of the facet's own selection
+                picked = dict(filters, **{dimension: [entry['value']]})
+                with self.subTest(dimension=dimension, value=entry['value']):
+                    self.assertEqual(entry['count'], apply_facet_filters(summaries, picked).count())
+        return facets
+
+    def test_counts_match_the_filtered_queryset(self):
+        facets = self.assertCountsMatchFilteredQuerysets(self.filters())
+
+        self.assertEqual(facets['category'], [
+            {'value': str(self.vegetables.id), 'count': 3, 'label': 'Vegetables'},
+            {'value': str(self.fruits.id), 'count': 2, 'label': 'Fruits'},
+        ])
+        self.assertEqual(facets['price_band'], [
+            {'value': '0-50', 'count': 2}, {'value': '50-100', 'count': 1}, {'value': '100-250', 'count': 1},
+            {'value': '500+', 'count': 1},
+        ])
+        self.assertEqual(facets['available'], [{'value': True, 'count': 4}, {'value': False, 'count': 2}])
+
+    def test_selected_facet_keeps_counting_its_other_values(self):
+        facets = self.assertCountsMatchFilteredQuerysets(self.filters(category=str(self.fruits.id), region='III'))
+
+        # Regions of the fruits, categories of region III
+        self.assertEqual(facets['region'], [{'value': 'III', 'count': 1}, {'value': 'IV-A', 'count': 1}])
+        # Equal counts tie-break on category id, which is random here
+        self.assertEqual(sorted((entry['label'], entry['count']) for entry in facets['category']),
+                         [('Fruits', 1), ('Vegetables', 1)])
+
+    def test_price_range_applies_to_every_facet(self):
+        self.assertCountsMatchFilteredQuerysets(self.filters(min_price='50', available='true'))
+
+    def test_facets_are_one_query(self):
+        filters = self.filters(category=f'{self.vegetables.id},{self.fruits.id}', price_band='0-50,50-100')
+
+        with self.assertNumQueries(1):
+            compute_facets(ProductListingSummary.objects.all(), filters)
+
+    def test_endpoint_filters_and_counts(self):
+        response = self.client.get(reverse('landing-products'), {'facets': 'true', 'category': str(self.fruits.id)})
+
+        self.assertEqual(sorted(item['name'] for item in response.data['results']), ['Banana', 'Mango'])
+        self.assertEqual(len(response.data['facets']['category']), 2)
+
+
+class ListingSummarySyncTests(TestCase):
+    def setUp(self):
+        self.vendor = make_vendor()
+        self.category = Category.objects.create(name='Vegetables')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product = make_product(self.vendor, category=self.category)
+            self.kilo = ProductVariation.objects.create(
+                product=self.product, name='1kg', unit_price='100.00', stock=5, unit_measurement='per kg',
+            )
+
+    def summary(self):
+        return ProductListingSummary.objects.get(product=self.product)
+
+    def test_new_product_gets_a_summary(self):
+        summary = self.summary()
+
+        self.assertEqual((summary.name, summary.slug, summary.status), ('Tomato', self.product.slug, 'published'))
+        self.assertEqual((summary.vendor_name, summary.category_name), ('farmer', 'Vegetables'))
+        self.assertEqual((summary.min_price, summary.unit_measurement), (Decimal('100.00'), 'per kg'))
+        self.assertTrue(summary.in_stock)
+        self.assertEqual(summary.created_at, self.product.created_at)
+
+    def test_product_change(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.name = 'Cherry tomato'
+            self.product.status = 'hidden'
+            self.product.save()
+
+        summary = self.summary()
+        self.assertEqual((summary.name, summary.slug, summary.status), ('Cherry tomato', 'cherry-tomato', 'hidden'))
+
+    def test_unit_follows_the_cheapest_available_variation(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            piece = ProductVariation.objects.create(
+                product=self.product, name='Piece', unit_price='20.00', stock=5, unit_measurement='per piece',
+            )
+        self.assertEqual((self.summary().min_price, self.summary().unit_measurement), (Decimal('20.00'), 'per piece'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            piece.is_available = False
+            piece.save()
+        self.assertEqual((self.summary().min_price, self.summary().unit_measurement), (Decimal('100.00'), 'per kg'))
+
+    def test_variation_stock_and_delete(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.kilo.stock = 0
+            self.kilo.save()
+        self.assertFalse(self.summary().in_stock)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.kilo.delete()
+        summary = self.summary()
+        self.assertEqual((summary.min_price, summary.unit_measurement, summary.in_stock), (None, None, False))
+
+    def test_main_image_change(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            image = ProductImage.objects.create(
+                product=self.product, image='https://example.com/tomato.jpg', is_main=True, processing_state='ready',
+                renditions={'480': 'https://example.com/tomato_480w.webp'},
+            )
+        summary = self.summary()
+        self.assertEqual((summary.main_image_id, summary.main_image), (image.id, 'https://example.com/tomato.jpg'))
+        self.assertEqual(summary.main_image_renditions, {'480': 'https://example.com/tomato_480w.webp'})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            image.delete()
+        self.assertEqual((self.summary().main_image_id, self.summary().main_image), (None, None))
+
+    def test_vendor_change(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Address.objects.create(user=self.vendor, region='III', province='Bulacan', city='Malolos', barangay='Atlag')
+        self.assertEqual((self.summary().vendor_region, self.summary().vendor_province), ('III', 'Bulacan'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.vendor.username = 'grower'
+            self.vendor.save()
+        self.assertEqual(self.summary().vendor_name, 'grower')
+
+    def test_deleted_product_loses_its_summary(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.delete()
+
+        self.assertFalse(ProductListingSummary.objects.exists())
+
+
+class SlugTests(TestCase):
+    def setUp(self):
+        self.vendor = make_vendor()
+
+    def test_next_suffix_is_past_the_highest(self):
+        for name in ('Tomato', 'Tomato', 'Tomato sauce'):
+            make_product(self.vendor, name=name)
+        Product.objects.filter(slug='tomato-1').update(slug='tomato-3')
+
+        self.assertEqual(make_product(self.vendor, name='Tomato').slug, 'tomato-4')
+        # Its own base is taken by a suffix of "tomato"
+        self.assertEqual(make_product(self.vendor, name='Tomato 3').slug, 'tomato-3-1')
+
+    def test_batch_is_allocated_with_one_query(self):
+        make_product(self.vendor, name='Tomato')
+
+        with self.assertNumQueries(1):
+            allocated = slugs.allocate_slugs(Product, ['Tomato', 'Tomato', 'Tomato 1', 'Eggplant', 'Tomato'])
+
+        self.assertEqual(allocated, ['tomato-1', 'tomato-2', 'tomato-1-1', 'eggplant', 'tomato-3'])
+
+    def test_reserved_slugs_are_avoided(self):
+        self.assertEqual(slugs.allocate_slugs(Product, ['Tomato'], reserved={'tomato', 'tomato-1'}), ['tomato-2'])
+
+    def test_rename_doesnt_collide_with_itself(self):
+        product = make_product(self.vendor, name='Tomato')
+        product.name = 'TOMATO'
+        product.save()
+
+        self.assertEqual(product.slug, 'tomato')
+
+    def test_long_and_unsluggable_names(self):
+        self.assertEqual(len(make_product(self.vendor, name='x' * 200).slug), 42)
+        self.assertEqual(make_product(self.vendor, name='!!!').slug, 'product')
+
+    def test_slug_taken_concurrently_is_allocated_again(self):
+        make_product(self.vendor, name='Tomato')
+        # The first allocation still sees the slug free, as a concurrent save would
+        with mock.patch.object(slugs, 'allocate_slug', side_effect=['tomato', 'tomato-1']) as allocate:
+            product = make_product(self.vendor, name='Tomato')
+
+        self.assertEqual(product.slug, 'tomato-1')
+        self.assertEqual(allocate.call_count, 2)
+        self.assertTrue(Product.objects.filter(slug='tomato-1').exists())
+
+    def test_retries_are_limited(self):
+        make_product(self.vendor, name='Tomato')
+
+        with mock.patch.object(slugs, 'allocate_slug', return_value='tomato') as allocate:
+            with self.assertRaises(IntegrityError):
+                make_product(self.vendor, name='Tomato')
+
+        self.assertEqual(allocate.call_count, slugs.SAVE_ATTEMPTS)
+
+    def test_other_integrity_errors_are_not_retried(self):
+        Category.objects.create(name='Vegetables')
+
+        with mock.patch.object(slugs, 'allocate_slug', wraps=slugs.allocate_slug) as allocate:
+            with self.assertRaises(IntegrityError):
+                Category.objects.create(name='Vegetables')
+
+        self.assertEqual(allocate.call_count, 1)
+
+
+class CoPurchaseTests(TestCase):
+    # Baskets: {a, b, c}, {a, b}, {a, d}. Baskets with a: 3, b: 2, c: 1, d: 1
+    TRIPLES = [
+        ('ana', 'mon', 'a'), ('ana', 'mon', 'b'), ('ana', 'mon', 'c'),
+        ('ben', 'mon', 'a'), ('ben', 'mon', 'b'),
+        ('cy', 'tue', 'a'), ('cy', 'tue', 'd'),
+    ]
+
+    def assertNeighbors(self, neighbors, expected):
+        self.assertEqual({product: [neighbor for neighbor, _ in ranked] for product, ranked in neighbors.items()},
+                         {product: [neighbor for neighbor, _ in ranked] for product, ranked in expected.items()})
+        for product, ranked in expected.items():
+            for (_, score), (_, expected_score) in zip(neighbors[product], ranked):
+                self.assertAlmostEqual(score, expected_score, places=6)
+
+    def test_scores_are_the_cosine_of_the_basket_sets(self):
+        self.assertNeighbors(compute_neighbors(self.TRIPLES), {
+            'a': [('b', 2 / 6 ** 0.5), ('c', 1 / 3 ** 0.5), ('d', 1 / 3 ** 0.5)],  # c before d: tie by id
+            'b': [('a', 2 / 6 ** 0.5), ('c', 1 / 2 ** 0.5)],
+            'c': [('b', 1 / 2 ** 0.5), ('a', 1 / 3 ** 0.5)],
+            'd': [('a', 1 / 3 ** 0.5)],
+        })
+
+    @override_settings(RECOMMENDATION_NEIGHBORS=1)
+    def test_top_k(self):
+        self.assertEqual({product: len(ranked) for product, ranked in compute_neighbors(self.TRIPLES).items()},
+                         {'a': 1, 'b': 1, 'c': 1, 'd': 1})
+
+    @override_settings(RECOMMENDATION_MAX_BASKET_SIZE=2)
+    def test_large_baskets_are_left_out(self):
+        # Only {a, b} and {a, d} pair up; the frequencies still count every basket
+        self.assertNeighbors(compute_neighbors(self.TRIPLES), {
+            'a': [('d', 1 / 3 ** 0.5), ('b', 1 / 6 ** 0.5)],
+            'b': [('a', 1 / 6 ** 0.5)],
+            'd': [('a', 1 / 3 ** 0.5)],
+        })
+
+    def test_slice_uses_the_given_basket_counts(self):
+        neighbors = compute_neighbors(self.TRIPLES[3:5], basket_counts={'a': 3, 'b': 2}, targets={'b'})
+
+        self.assertNeighbors(neighbors, {'b': [('a', 1 / 6 ** 0.5)]})
+
+
+class CoPurchaseStorageTests(TestCase):
+    def setUp(self):
+        vendor = make_vendor()
+        self.variations = {}
+        for name in 'abcd':
+            product = make_product(vendor, name=name)
+            self.variations[name] = ProductVariation.objects.create(product=product, name='1kg', unit_price='10.00')
+        self.buyers = {name: make_buyer(name) for name in ('ana', 'ben', 'cy', 'dee')}
+
+    def order(self, buyer, names, status='pending'):
+        order = Order.objects.create(
+            buyer=self.buyers[buyer], total_price='10.00', shipping_address='Lipa', payment_method='cod', status=status,
+        )
+        for name in names:
+            OrderItem.objects.create(order=order, variation=self.variations[name], quantity=1, unit_price='10.00')
+        return order
+
+    def stored(self):
+        names = {variation.product_id: name for name, variation in self.variations.items()}
+        rows = ProductNeighbor.objects.filter(kind='co_purchase').order_by('product__name', 'rank')
+        lists = {}
+        for row in rows:
+            lists.setdefault(names[row.product_id], []).append((names[row.neighbor_id], round(row.score, 6)))
+        return lists
+
+    def test_rebuild_stores_the_ranked_neighbors(self):
+        # Checkout splits a cart per vendor: same buyer and day, one basket
+        self.order('ana', 'ab')
+        self.order('ana', 'c')
+        self.order('ben', 'ab')
+        self.order('cy', 'ad')
+        self.order('dee', 'cd', status='cancelled')
+
+        self.assertEqual(rebuild_co_purchase_neighbors(), 8)
+
+        stored = self.stored()
+        self.assertEqual(stored['b'], [('a', round(2 / 6 ** 0.5, 6)), ('c', round(1 / 2 ** 0.5, 6))])
+        self.assertEqual(stored['d'], [('a', round(1 / 3 ** 0.5, 6))])
+        self.assertEqual([name for name, _ in stored['a']][0], 'b')
+
+    def test_refresh_replaces_the_rows_of_the_new_baskets(self):
+        self.order('ana', 'abc')
+        self.order('ben', 'ab')
+        self.order('cy', 'ad')
+        rebuild_co_purchase_neighbors()
+        before = self.stored()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            refresh_co_purchase_neighbors([self.order('dee', 'bd').id])
+        refreshed = self.stored()
+        rebuild_co_purchase_neighbors()
+        rebuilt = self.stored()
+
+        # Lists of the products in the new basket are the full rebuild's
+        self.assertEqual(refreshed['b'], [('a', round(2 / 3, 6)), ('c', round(1 / 3 ** 0.5, 6)), ('d', round(1 / 6 ** 0.5, 6))])
+        self.assertEqual(refreshed['b'], rebuilt['b'])
+        self.assertEqual(refreshed['d'], rebuilt['d'])
+        # d is in 2 baskets, a and b in 3 each, one shared with d
+        self.assertEqual(sorted(refreshed['d']), [('a', round(1 / 6 ** 0.5, 6)), ('b', round(1 / 6 ** 0.5, 6))])
+        self.assertEqual(ProductNeighbor.objects.filter(product=self.variations['d'].product_id).count(), 2)
+        # Others keep their rows until the next rebuild
+        self.assertEqual(refreshed['a'], before['a'])
+        self.assertEqual(refreshed['c'], before['c'])
+
+
+class ContentSimilarityTests(TestCase):
+    CATALOG = [
+        ('cherry', 'Cherry tomatoes', 'Sweet and small', 'Vegetables', 'published'),
+        ('tomatoes', 'Tomatoes', 'Vine ripened', 'Vegetables', 'published'),
+        ('sauce', 'Pasta sauce', 'Made with tomatoes', 'Pantry', 'published'),
+        ('mango', 'Mango', 'Sweet', 'Fruits', 'published'),
+        ('carabao', 'Carabao mango', 'Sweet', 'Fruits', 'hidden'),
+        ('honey', 'Honey', 'Wild', None, 'published'),
+    ]
+
+    def test_neighbors_are_ranked_by_cosine(self):
+        index = ContentIndex(self.CATALOG)
+        neighbors = index.neighbors(index.ids)
+
+        expected = {
+            # Name word and category in common (both weighted 3x): idf 1.56 for "tomatoes" (3 of 6
+            # products), 1.85 for the category (2 of 6), cherry also has "sweet"
+            'cherry': [('tomatoes', 0.9559), ('sauce', 0.6166), ('mango', 0.0804)],
+            'tomatoes': [('cherry', 0.9559), ('sauce', 0.6451)],
+            'sauce': [('tomatoes', 0.6451), ('cherry', 0.6166)],
+            # Hidden products have lists, but are in no one's
+            'mango': [('cherry', 0.0804)],
+            'carabao': [('mango', 1.0), ('cherry', 0.0804)],
+            # No word shared with any other product
+            'honey': [],
+        }
+        self.assertEqual({product: [name for name, _ in ranked] for product, ranked in neighbors.items()},
+                         {product: [name for name, _ in ranked] for product, ranked in expected.items()})
+        for product, ranked in expected.items():
+            for (_, score), (_, expected_score) in zip(neighbors[product], ranked):
+                self.assertAlmostEqual(score, expected_score, places=4)
+
+    @override_settings(RECOMMENDATION_NEIGHBORS=1)
+    def test_top_k(self):
+        index = ContentIndex(self.CATALOG)
+
+        self.assertEqual([name for name, _ in index.neighbors(['cherry'])['cherry']], ['tomatoes'])
+
+    def test_refresh_replaces_the_affected_lists(self):
+        vendor = make_vendor()
+        categories = {}
+        products = {}
+        for key, name, description, category, status in self.CATALOG:
+            if category and category not in categories:
+                categories[category] = Category.objects.create(name=category)
+            products[key] = make_product(
+                vendor, name=name, description=description, category=categories.get(category), status=status,
+            )
+        names = {product.id: key for key, product in products.items()}
+
+        def stored():
+            rows = ProductNeighbor.objects.filter(kind='content').order_by('product__name', 'rank')
+            lists = {}
+            for row in rows:
+                lists.setdefault(names[row.product_id], []).append((names[row.neighbor_id], round(row.score, 5)))
+            return lists
+
+        rebuild_content_neighbors()
+        self.assertIn('sauce', [name for name, _ in stored()['cherry']])
+
+        sauce = products['sauce']
+        sauce.name, sauce.description = 'Mango jam', 'Made with sugar'
+        sauce.save()
+        refresh_content_neighbors([sauce.id])
+        refreshed = stored()
+        rebuild_content_neighbors()
+
+        # It left the tomato lists and entered the mango ones, as a full rebuild has it
+        self.assertEqual(refreshed, stored())
+        self.assertNotIn('sauce', [name for name, _ in refreshed['cherry']])
+        self.assertIn('sauce', [name for name, _ in refreshed['mango']])
+
+
+@override_settings(FRAGMENT_CACHE_ENABLED=False)
+class ProductSerializerQueryTests(TestCase):
+    def add_products(self, count):
+        category = Category.objects.create(name='Vegetables')
+        for number in range(count):
+            vendor = make_vendor(f'farmer{number}')
+            Address.objects.create(user=vendor, region='III', province='Bulacan', city='Malolos', barangay='Atlag')
+            product = make_product(vendor, name=f'Product {number}', category=category)
+            variation = ProductVariation.objects.create(product=product, name='1kg', unit_price='10.00', stock=3)
+            ProductImage.objects.create(product=product, image='https://example.com/p.jpg', is_main=True)
+            VariationImage.objects.create(variation=variation, image='https://example.com/v.jpg', is_main=True)
+            Review.objects.create(product=product, buyer=make_buyer(f'buyer{number}'), rating=4, comment='Fresh')
+
+    def serialize(self, count):
+        self.add_products(count)
+        # Products, vendors and their addresses, categories, images, ratings, variations and their images
+        with self.assertNumQueries(8):
+            data = ProductSerializer(Product.objects.all(), many=True, context={}).data
+        self.assertEqual(len(data), count)
+        return data
+
+    def test_one_product(self):
+        product = self.serialize(1)[0]
+
+        self.assertEqual(product['vendor_address']['province'], 'Bulacan')
+        self.assertEqual(product['category_name'], 'Vegetables')
+        self.assertEqual(product['rating']['count'], 1)
+        self.assertEqual(len(product['variations'][0]['images']), 1)
+
+    def test_five_products(self):
+        self.serialize(5)
+
+    def test_pruned_fields_are_not_loaded(self):
+        self.add_products(5)
+
+        with self.assertNumQueries(1):
+            ProductSerializer(Product.objects.all(), many=True, context={}, shape=Shape.parse('id,name')).data
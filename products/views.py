@@ -1,4 +1,3 @@
-from PIL import Image
 from rest_framework import generics, permissions, status
 from rest_framework.permissions import IsAuthenticated
 from users.permissions import IsFarmer
@@ -6,14 +5,29 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 from django.db import models
 from django.shortcuts import get_object_or_404
-from .models import Product, Category, ProductImage, Review, ProductVariation,VariationImage
-from .serializers import ProductDetailSerializer, ProductSerializer, ProductReviewSerializer, ProductVariationSerializer, LandingProductSerializer
+from .models import Product, Category, ProductImage, Review, ProductVariation,VariationImage, ProductListingSummary
+from .serializers import (ProductDetailSerializer, ProductSerializer, ProductReviewSerializer, ProductVariationSerializer,
+    LandingProductSerializer, ProductListingSummarySerializer, ReviewAggregateSerializer)
+from .pagination import KeysetPagination, ReviewPagination
+from .search import search_products
+from .facets import apply_facet_filters, compute_facets, parse_facet_filters
+from .cache import cache_catalog_response, detail_version_keys, list_version_keys, review_version_keys
+from .conditional import conditional_catalog_response, detail_state, list_state
+from .tasks import batch_image_processing
+from .images import inspect_uploads
+from .importer import detect_format, import_catalog
+from .recommendations import related_products
+from .inventory import InventoryUpdateError, apply_inventory_updates, read_changes
+from .reviews import review_aggregate
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+from django.conf import settings
 from django.db import transaction
-from rest_framework.parsers import MultiPartParser, FormParser
-from django.core.files.uploadedfile import InMemoryUploadedFile
-import json, io, uuid
+from rest_framework.parsers import JSONParser, MultiPartParser, FormParser
+import json, logging, uuid
 from django.core.exceptions import ValidationError
 
+logger = logging.getLogger(__name__)
+
 def validate_uuid_list(uuid_list):
     valid_uuids = []
     for item in uuid_list:
@@ -27,23 +41,26 @@ def validate_uuid_list(uuid_list):
 
 
 class ProductDetailView(APIView):
+    @conditional_catalog_response(detail_state)
+    @cache_catalog_response('product-detail', detail_version_keys)
     def get(self, request, slug):
         # Fetch the product with select_related and prefetch_related for optimization
-        product = get_object_or_404(
-            Product.objects.select_related('category').prefetch_related('images', 'variations', 'reviews'),
-            slug=slug
-        )
+        # Images, variations and the rating are batch loaded by the serializer, if asked for (?fields=)
+        product = get_object_or_404(Product.objects.select_related('category'), slug=slug)
 
-        # Get product reviews
-        reviews_qs = product.reviews.all()
+        # Newest reviews only; the product's rating summary covers all of them and
+        # the rest are paged through ProductReviewsView
+        reviews_qs = product.reviews.select_related('buyer').order_by('-created_at', '-pk')[
+            :getattr(settings, 'PRODUCT_DETAIL_REVIEWS', 5)
+        ]
 
-        # Get related products (same category, excluding itself)
-        related_qs = Product.objects.filter(category=product.category).exclude(id=product.id)[:4]
+        # Frequently bought together, topped up from the same category
+        related_qs = related_products(product)
 
         # Serialize all parts
-        product_data = ProductSerializer(product).data
+        product_data = ProductSerializer(product, context={'request': request}).data
         reviews_data = ProductReviewSerializer(reviews_qs, many=True).data
-        related_data = LandingProductSerializer(related_qs, many=True).data
+        related_data = ProductListingSummarySerializer(related_qs, many=True).data
 
         response_data = {
             'product': product_data,
@@ -55,10 +72,54 @@ class ProductDetailView(APIView):
         return Response(response_data)
     
 
+class ProductReviewsView(APIView):
+    """A product's reviews, newest first and keyset paginated (GET), and writing one (POST)."""
+
+    def get_permissions(self):
+        if self.request.method == 'POST':
+            return [IsAuthenticated()]
+        return []
+
+    @cache_catalog_response('product-reviews', review_version_keys)
+    def get(self, request, slug):
+        product = get_object_or_404(Product, slug=slug)
+        reviews = product.reviews.select_related('buyer')
+        paginator = ReviewPagination()
+        page = paginator.paginate_queryset(reviews, request, view=self)
+        return paginator.get_paginated_response(ProductReviewSerializer(page, many=True).data)
+
+    def post(self, request, slug):
+        serializer = ProductReviewSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        with transaction.atomic():
+            # Locked so two reviews of the same buyer can't both pass the check below
+            product = get_object_or_404(Product.objects.select_for_update(), slug=slug)
+            if product.vendor_id == request.user.id:
+                return Response({'error': 'You cannot review your own product.'}, status=status.HTTP_400_BAD_REQUEST)
+            if product.reviews.filter(buyer=request.user).exists():
+                return Response({'error': 'You have already reviewed this product.'}, status=status.HTTP_400_BAD_REQUEST)
+            # The aggregate is adjusted by the post_save signal, in this same transaction
+            review = serializer.save(product=product, buyer=request.user)
+
+        aggregate = review_aggregate(product)
+        return Response({
+            'review': ProductReviewSerializer(review).data,
+            'rating': ReviewAggregateSerializer(aggregate).data,
+        }, status=status.HTTP_201_CREATED)
+
+
 class CreateProductView(APIView):
     permission_classes = [IsAuthenticated, IsFarmer]
 
     def post(self, request):
+        try:
+            # Header-only check, before anything is written or decoded
+            inspect_uploads(request.FILES.getlist('images'))
+        except ValidationError as e:
+            return Response({"error": e.messages[0]}, status=400)
+
         product_data = request.data.copy()
         product_data['vendor'] = request.user.id
         product_data['status'] = 'hidden'
@@ -80,33 +141,20 @@ class CreateProductView(APIView):
             # Handle image uploads and set main image
             images = request.FILES.getlist('images')
             has_main = False
-            for img in images:
+            with batch_image_processing():
+                for img in images:
                 
-                if img.size > 5 * 1024 * 1024:  # 5MB size limit
-                    return Response({"error": "Each image must be <5MB."}, status=400)
-
-                # Open the image
-                image = Image.open(img)
-
-                # If the image has transparency (RGBA), convert it to RGB or save as PNG if required
-                if image.mode == 'RGBA':
-                    # Save it as PNG to preserve transparency
-                    image_io = io.BytesIO()
-                    image.save(image_io, format='PNG')  # Save as PNG to preserve transparency
-                    image_file = InMemoryUploadedFile(image_io, None, img.name, 'image/png', image_io.tell(), None)
-                else:
-                    # If it's not RGBA, just save it as JPEG
-                    image_io = io.BytesIO()
-                    image.save(image_io, format='JPEG')  # Save as JPEG if no transparency
-                    image_file = InMemoryUploadedFile(image_io, None, img.name, 'image/jpeg', image_io.tell(), None)
+                    if img.size > 5 * 1024 * 1024:  # 5MB size limit
+                        return Response({"error": "Each image must be <5MB."}, status=400)
 
-                # Check if the image should be marked as main (via 'is_main' field or first image logic)
-                is_main = request.data.get(f'{img.name}_is_main', False)  # Check for 'is_main' flag per image
-                if not has_main and (is_main == 'true' or is_main is True):  # Set as main if provided
-                    has_main = True
+                    # Check if the image should be marked as main (via 'is_main' field or first image logic)
+                    is_main = request.data.get(f'{img.name}_is_main', False)  # Check for 'is_main' flag per image
+                    if not has_main and (is_main == 'true' or is_main is True):  # Set as main if provided
+                        has_main = True
 
-                # Create the ProductImage (you might use ProductImageSerializer to validate)
-                product_image = ProductImage.objects.create(product=product, image_file=image_file, is_main=is_main)
+                    # Create the ProductImage (you might use ProductImageSerializer to validate)
+                    # Re-encoding and the storage upload happen in the products.process_image job
+                    product_image = ProductImage.objects.create(product=product, image_file=img, is_main=is_main)
 
             # If no main image is set, automatically set the first image as the main one
             if images and not has_main:
@@ -139,6 +187,11 @@ class UpdateProductView(APIView):
         product = get_object_or_404(Product, slug=slug)
         product_data = request.data.copy()
         new_images = request.FILES.getlist('images')
+        try:
+            # Header-only check, before anything is written or decoded
+            inspect_uploads(new_images)
+        except ValidationError as e:
+            return Response({"error": e.messages[0]}, status=400)
 
         with transaction.atomic():
             # 1. Update product fields
@@ -150,14 +203,14 @@ class UpdateProductView(APIView):
 
             # 2. Handle image deletion
             images_to_delete_raw = request.data.get('images_to_delete')
-            print("RAW images_to_delete:", images_to_delete_raw, type(images_to_delete_raw))
+            logger.debug("RAW images_to_delete: %r", images_to_delete_raw)
 
             try:
                 images_to_delete = json.loads(images_to_delete_raw) if images_to_delete_raw else []
             except Exception as e:
-                print("JSON parse error:", e)
+                logger.debug("JSON parse error: %s", e)
                 images_to_delete = []
-            print("After json.loads:", images_to_delete, type(images_to_delete))
+            logger.debug("After json.loads: %r", images_to_delete)
 
             if isinstance(images_to_delete, list) and images_to_delete:
                 valid_image_ids = []
@@ -165,41 +218,32 @@ class UpdateProductView(APIView):
                     try:
                         valid_image_ids.append(uuid.UUID(str(img_id)))
                     except Exception as e:
-                        print(f"Invalid UUID in images_to_delete: {img_id}, error: {e}")
-                print("UUID objects for deletion:", valid_image_ids)
+                        logger.debug("Invalid UUID in images_to_delete: %s, error: %s", img_id, e)
+                logger.debug("UUID objects for deletion: %s", valid_image_ids)
                 if valid_image_ids:
                     deleted_count, _ = ProductImage.objects.filter(
                         id__in=valid_image_ids,
                         product_id=product.id
                     ).delete()
-                    print(f"Deleted {deleted_count} ProductImage(s)")
+                    logger.debug("Deleted %d ProductImage(s)", deleted_count)
                 else:
-                    print("No valid UUIDs to delete.")
+                    logger.debug("No valid UUIDs to delete.")
             else:
-                print("images_to_delete is not a list or is empty.")
+                logger.debug("images_to_delete is not a list or is empty.")
 
             # 3. Handle image uploads
-            for img in new_images:
-                # Optional: Restrict large images (e.g., 5MB limit)
-                if img.size > 5 * 1024 * 1024:  # 5MB size limit
-                    return Response({"error": "Each image must be <5MB."}, status=400)
-
-                image = Image.open(img)
-                if image.mode == 'RGBA':
-                    image_io = io.BytesIO()
-                    image.save(image_io, format='PNG')
-                    image_file = InMemoryUploadedFile(image_io, None, img.name, 'image/png', image_io.tell(), None)
-                else:
-                    image_io = io.BytesIO()
-                    image.save(image_io, format='JPEG')
-                    image_file = InMemoryUploadedFile(image_io, None, img.name, 'image/jpeg', image_io.tell(), None)
+            with batch_image_processing():
+                for img in new_images:
+                    # Optional: Restrict large images (e.g., 5MB limit)
+                    if img.size > 5 * 1024 * 1024:  # 5MB size limit
+                        return Response({"error": "Each image must be <5MB."}, status=400)
 
-                is_main = request.data.get(f'{img.name}_is_main', False)
+                    is_main = request.data.get(f'{img.name}_is_main', False)
 
-                # Normalize input (e.g., if it's a string like 'true')
-                if is_main == 'true':
-                    is_main = True
-                ProductImage.objects.create(product=product, image=img, is_main=is_main)
+                    # Normalize input (e.g., if it's a string like 'true')
+                    if is_main == 'true':
+                        is_main = True
+                    ProductImage.objects.create(product=product, image_file=img, is_main=is_main)
                
                 # Check for existing images and if any are already marked as main
         has_main_image = ProductImage.objects.filter(product=product, is_main=True).exists()
@@ -209,7 +253,6 @@ class UpdateProductView(APIView):
             first_image = ProductImage.objects.filter(product_id=product).first()
             if first_image:
                 first_image.is_main = True
-                print(first_image.is_main)
                 first_image.save()
 
         return Response(ProductSerializer(product).data, status=status.HTTP_200_OK)
@@ -230,6 +273,12 @@ class CreateVariationView(APIView):
     parser_classes = [MultiPartParser, FormParser]
 
     def post(self, request, *args, **kwargs):
+        try:
+            # Header-only check, before anything is written or decoded
+            inspect_uploads(request.FILES.getlist('images'))
+        except ValidationError as e:
+            return Response({"error": e.messages[0]}, status=400)
+
         with transaction.atomic():
             # 1. Extract basic fields (product is required)
             product_id = request.data.get('product')
@@ -262,36 +311,22 @@ class CreateVariationView(APIView):
             # 3. Handle images (if any)
             images = request.FILES.getlist('images')
             has_main = False
-            for img in images:
+            with batch_image_processing():
+                for img in images:
                 
-                if img.size > 5 * 1024 * 1024:  # 5MB size limit
-                    return Response({"error": "Each image must be <5MB."}, status=400)
-
-                # Open the image
-                image = Image.open(img)
-
-                # If the image has transparency (RGBA), convert it to RGB or save as PNG if required
-                if image.mode == 'RGBA':
-                    # Save it as PNG to preserve transparency
-                    image_io = io.BytesIO()
-                    image.save(image_io, format='PNG')  # Save as PNG to preserve transparency
-                    image_file = InMemoryUploadedFile(image_io, None, img.name, 'image/png', image_io.tell(), None)
-                else:
-                    # If it's not RGBA, just save it as JPEG
-                    image_io = io.BytesIO()
-                    image.save(image_io, format='JPEG')  # Save as JPEG if no transparency
-                    image_file = InMemoryUploadedFile(image_io, None, img.name, 'image/jpeg', image_io.tell(), None)
-
-                # Check if the image should be marked as main (via 'is_main' field or first image logic)
-                is_main = request.data.get(f'{img.name}_is_main', False)  # Check for 'is_main' flag per image
-                if not has_main and (is_main == 'true' or is_main is True):  # Set as main if provided
-                    has_main = True
+                    if img.size > 5 * 1024 * 1024:  # 5MB size limit
+                        return Response({"error": "Each image must be <5MB."}, status=400)
+
+                    # Check if the image should be marked as main (via 'is_main' field or first image logic)
+                    is_main = request.data.get(f'{img.name}_is_main', False)  # Check for 'is_main' flag per image
+                    if not has_main and (is_main == 'true' or is_main is True):  # Set as main if provided
+                        has_main = True
                     
-                VariationImage.objects.create(
-                    variation=variation,
-                    image_file=img,
-                    is_main=is_main == 'true' or is_main is True
-                )
+                    VariationImage.objects.create(
+                        variation=variation,
+                        image_file=img,
+                        is_main=is_main == 'true' or is_main is True
+                    )
 
             # If no main is set but images exist, set first as main
             if images and not has_main:
@@ -314,6 +349,12 @@ class UpdateVariationView(APIView):
             new_images = request.FILES.getlist('images')
             images_to_delete = request.data.getlist('images_to_delete', [])
 
+            try:
+                # Header-only check, before anything is written or decoded
+                inspect_uploads(new_images)
+            except ValidationError as e:
+                return Response({"error": e.messages[0]}, status=400)
+
             with transaction.atomic():
                 # 1. Update variation fields (partial)
                 serializer = ProductVariationSerializer(variation, data=data, partial=True)
@@ -327,14 +368,15 @@ class UpdateVariationView(APIView):
                     VariationImage.objects.filter(id__in=images_to_delete, variation=variation).delete()
 
                 # 3. Add new images and handle is_main logic
-                for img in new_images:
-                    is_main = request.data.get(f"{img.name}_is_main", False)
-                    is_main = is_main == 'true' or is_main is True
-                    VariationImage.objects.create(
-                        variation=variation,
-                        image=img,
-                        is_main=is_main
-                    )
+                with batch_image_processing():
+                    for img in new_images:
+                        is_main = request.data.get(f"{img.name}_is_main", False)
+                        is_main = is_main == 'true' or is_main is True
+                        VariationImage.objects.create(
+                            variation=variation,
+                            image_file=img,
+                            is_main=is_main
+                        )
 
             # 4. Enforce only one main image per variation
             main_images = VariationImage.objects.filter(variation=variation, is_main=True)
@@ -365,6 +407,8 @@ class GetAllProducts(APIView):
         'published', 'out_of_stock', 'hidden', 'pending_approval', 'rejected'
     }
 
+    @conditional_catalog_response(list_state)
+    @cache_catalog_response('all-products', list_version_keys)
     def get(self, request):
         user_id = request.query_params.get('user_id')
         status = request.query_params.get('status')
@@ -382,10 +426,20 @@ class GetAllProducts(APIView):
         else:
             products = products.filter(status='published')
 
-
-        print(status)
-        serializer = ProductSerializer(products, many=True)
-        return Response(serializer.data)
+        # Facet filters (category, price band, vendor region/province, availability)
+        facet_filters = parse_facet_filters(request.query_params)
+        facets = None
+        if request.query_params.get('facets') == 'true':
+            facets = compute_facets(ProductListingSummary.objects.filter(product__in=products), facet_filters)
+        products = apply_facet_filters(products, facet_filters, prefix='listing_summary__')
+
+        paginator = KeysetPagination()
+        page = paginator.paginate_queryset(products, request, view=self)
+        serializer = ProductSerializer(page, many=True, context={'request': request})
+        response = paginator.get_paginated_response(serializer.data)
+        if facets is not None:
+            response.data['facets'] = facets
+        return response
     
 class LandingProducts(APIView):
 
@@ -393,15 +447,18 @@ class LandingProducts(APIView):
         'published', 'out_of_stock', 'hidden', 'pending_approval', 'rejected'
     }
 
+    @conditional_catalog_response(list_state)
+    @cache_catalog_response('landing-products', list_version_keys)
     def get(self, request):
         user_id = request.query_params.get('user_id')
         status = request.query_params.get('status')
 
       
-        products = Product.objects.all()
+        # Answered from the denormalized summary table: one indexed query
+        products = ProductListingSummary.objects.all()
 
         if user_id:
-            products = products.filter(vendor__id=user_id)
+            products = products.filter(vendor_id=user_id)
 
        
         if status and status in self.VALID_STATUSES:
@@ -410,7 +467,117 @@ class LandingProducts(APIView):
         else:
             products = products.filter(status='published')
 
+        # Facet filters (category, price band, vendor region/province, availability)
+        facet_filters = parse_facet_filters(request.query_params)
+        facets = None
+        if request.query_params.get('facets') == 'true':
+            facets = compute_facets(products, facet_filters)
+        products = apply_facet_filters(products, facet_filters)
+
+        paginator = KeysetPagination()
+        page = paginator.paginate_queryset(products, request, view=self)
+        serializer = ProductListingSummarySerializer(page, many=True, context={'request': request})
+        response = paginator.get_paginated_response(serializer.data)
+        if facets is not None:
+            response.data['facets'] = facets
+        return response
+
+
+class ProductSearchView(APIView):
+    """
+    Ranked full-text search over product name, description, category and
+    variation names. Every term is prefix matched. Paged with ?page=&page_size=.
+    """
+
+    def get(self, request):
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response({'error': 'Query parameter q is required.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        paginator = KeysetPagination()
+        page_size = paginator.get_page_size(request)
+        try:
+            page = max(int(request.query_params.get('page', 1)), 1)
+        except ValueError:
+            page = 1
+
+        # Ask for one extra hit to know whether a next page exists
+        hits = search_products(query, limit=page_size + 1, offset=(page - 1) * page_size)
+        has_next = len(hits) > page_size
+        hits = hits[:page_size]
+
+        summaries = ProductListingSummary.objects.in_bulk([product_id for product_id, _ in hits])
+        serializer = ProductListingSummarySerializer(context={'request': request})
+        results = []
+        for product_id, rank in hits:
+            summary = summaries.get(product_id)
+            if summary is None:
+                continue
+            item = serializer.to_representation(summary)
+            item['rank'] = round(float(rank), 6)
+            results.append(item)
+
+        url = replace_query_param(request.build_absolute_uri(), 'page_size', page_size)
+        next_url = replace_query_param(url, 'page', page + 1) if has_next else None
+        previous_url = None
+        if page == 2:
+            previous_url = remove_query_param(url, 'page')
+        elif page > 2:
+            previous_url = replace_query_param(url, 'page', page - 1)
+
+        return Response({
+            'next': next_url,
+            'previous': previous_url,
+            'results': results,
+        })
+
+
+class BulkImportProductsView(APIView):
+    """
+    Import many products/variations from one CSV or JSONL file (`file`).
+    Rows with errors are skipped and listed in the response; the rest are imported.
+    """
+    permission_classes = [IsAuthenticated, IsFarmer]
+    parser_classes = [MultiPartParser, FormParser]
+    MAX_REPORTED_ERRORS = 500
+
+    def post(self, request):
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({"error": "A CSV or JSONL file is required."}, status=400)
+
+        format = request.data.get('format') or detect_format(upload.name)
+        if format not in ('csv', 'jsonl'):
+            return Response({"error": "format must be csv or jsonl."}, status=400)
+
+        result = import_catalog(request.user, upload.file, format=format)
+        return Response(result.as_dict(max_errors=self.MAX_REPORTED_ERRORS), status=status.HTTP_200_OK)
 
-        print(status)
-        serializer = LandingProductSerializer(products, many=True)
-        return Response(serializer.data)
\ No newline at end of file
+
+class BulkUpdateVariationsView(APIView):
+    """
+    Update stock, unit_price and/or is_available of many of the caller's variations at once.
+    Either JSON `{"changes": [{"variation_id": ..., "stock": ...}, ...]}`, or a CSV/JSONL
+    `file` with the same columns where blank cells are left unchanged. Variations can
+    also be named by product `slug` and `variation` name. All changes apply, or none.
+    """
+    permission_classes = [IsAuthenticated, IsFarmer]
+    parser_classes = [JSONParser, MultiPartParser, FormParser]
+
+    def post(self, request):
+        upload = request.FILES.get('file')
+        try:
+            if upload is not None:
+                format = request.data.get('format') or detect_format(upload.name)
+                if format not in ('csv', 'jsonl'):
+                    return Response({"error": "format must be csv or jsonl."}, status=400)
+                rows = read_changes(upload.file, format)
+            else:
+                changes = request.data.get('changes')
+                if not isinstance(changes, list) or not all(isinstance(change, dict) for change in changes):
+                    return Response({"error": "changes must be a list of objects, or upload a file."}, status=400)
+                rows = list(enumerate(changes, start=1))
+            result = apply_inventory_updates(request.user, rows)
+        except InventoryUpdateError as e:
+            return Response({"error": str(e), "errors": e.errors}, status=400)
+        return Response(result, status=status.HTTP_200_OK)
@@ -1,25 +1,9 @@
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, PermissionsMixin
 from django.db import models
 from django.utils import timezone
-from django.utils.text import slugify
+from core.mixins import DirtyFieldsMixin
 import uuid
 
-def generate_unique_username(instance, field_value, slug_field_name='slug'):
-    """
-    Generate a unique slug for a model instance.
-    """
-    base_slug = slugify(field_value)
-    slug = base_slug
-    ModelClass = instance.__class__
-    n = 1
-
-    # Check for duplicates
-    while ModelClass.objects.filter(**{slug_field_name: slug}).exclude(pk=instance.pk).exists():
-        slug = f"{base_slug}-{n}"
-        n += 1
-
-    return slug
-
 class CustomUserManager(BaseUserManager):
     def create_user(self, email, username, contact_no, role, password=None):
         if not email:
@@ -62,7 +46,7 @@ class CustomUserManager(BaseUserManager):
         user.save(using=self._db)
         return user
 
-class CustomUser(AbstractBaseUser, PermissionsMixin):
+class CustomUser(DirtyFieldsMixin, AbstractBaseUser, PermissionsMixin):
     ROLE_CHOICES = [
         ('admin', 'Admin'),
         ('member', 'Member'),
@@ -95,11 +79,12 @@ class CustomUser(AbstractBaseUser, PermissionsMixin):
         if not self.username:
             self.username = self.email.split('@')[0]  # Set default username to part of the email
         
-        # Check if the username exists in the database, and modify it if needed
-        if CustomUser.objects.filter(username=self.username).exists():
+        # Only a new or changed username needs checking; the row itself doesn't count as taken
+        if self.has_changed('username'):
+            others = CustomUser.objects.exclude(pk=self.pk)
             base_username = self.username
             counter = 1
-            while CustomUser.objects.filter(username=self.username).exists():
+            while others.filter(username=self.username).exists():
                 self.username = f"{base_username}{counter}"
                 counter += 1
 